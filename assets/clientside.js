@@ -0,0 +1,119 @@
+// Previews waiting to be preloaded, and how many are loading.
+var prefetch = {queue: [], active: 0, started: {}};
+var PREFETCH_CONCURRENCY = 2;
+
+// Start queued preloads while fewer than PREFETCH_CONCURRENCY are loading, so
+// they do not hold up the photo being opened.
+function prefetch_next() {
+    while (prefetch.active < PREFETCH_CONCURRENCY && prefetch.queue.length) {
+        var url = prefetch.queue.shift();
+        var image = new Image();
+        prefetch.started[url] = true;
+        prefetch.active++;
+        image.onload = function() {
+            prefetch.active--;
+            prefetch_next();
+        };
+        image.onerror = (function(url) {
+            return function() {
+                delete prefetch.started[url];
+                prefetch.active--;
+                prefetch_next();
+            };
+        })(url);
+        image.src = url;
+    }
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    gallery: {
+        // Return the Entry_ID of the clicked gallery card, or of the photo
+        // before or after the open one.
+        select_card: function(n_clicks, n_prev, n_next, neighbours) {
+            var triggered = dash_clientside.callback_context.triggered;
+            if (!triggered.length || !triggered[0].value) {
+                return dash_clientside.no_update;
+            }
+            var prop_id = triggered[0].prop_id;
+            if (prop_id === 'photo_prev.n_clicks' || prop_id === 'photo_next.n_clicks') {
+                var entry_id = neighbours && neighbours[prop_id === 'photo_prev.n_clicks' ? 'previous' : 'next'];
+                return entry_id || dash_clientside.no_update;
+            }
+            return JSON.parse(prop_id.slice(0, prop_id.lastIndexOf('.'))).index;
+        },
+        // Queue the previews around the open photo, nearest first, replacing
+        // the ones queued for the previous photo that have not started yet,
+        // and start them once the open photo's own preview has loaded.
+        prefetch_images: function(neighbours) {
+            if (!neighbours) {
+                return dash_clientside.no_update;
+            }
+            prefetch.queue = neighbours.prefetch.filter(function(url) {
+                return !prefetch.started[url];
+            });
+            var current = new Image();
+            current.onload = current.onerror = prefetch_next;
+            current.src = neighbours.current;
+            return prefetch.queue.slice();
+        }
+    },
+    // UI-only callbacks; app.py keeps server-side equivalents of the same name
+    ui: {
+        // Open the photo modal when a photo is picked, close it from its buttons.
+        display_app_modal: function(selected_entry, n_ok, n_close, is_open) {
+            var triggered = dash_clientside.callback_context.triggered;
+            return triggered.length > 0 && triggered[0].prop_id === 'selected_entry.data';
+        },
+        // Show the introduction on page load until it is acknowledged.
+        display_intro_modal: function(pathname, n_ok, is_open) {
+            var triggered = dash_clientside.callback_context.triggered;
+            return !(triggered.length > 0 && triggered[0].prop_id === 'liveview_modal_ok_button_initial.n_clicks');
+        },
+        display_poster_modal: function(n_add, n_close, is_open) {
+            var triggered = dash_clientside.callback_context.triggered;
+            return triggered.length > 0 && triggered[0].prop_id === 'btn_poster.n_clicks';
+        },
+        // Give the browser tab an id, kept in session storage across reloads.
+        start_session: function(pathname, session_id) {
+            if (session_id) {
+                return dash_clientside.no_update;
+            }
+            var bytes = new Uint8Array(16);
+            window.crypto.getRandomValues(bytes);
+            return Array.prototype.map.call(bytes, function(b) {
+                return ('0' + b.toString(16)).slice(-2);
+            }).join('');
+        },
+        // Mark the clicked point on the map and echo its coordinates.
+        map_click: function(click_lat_lng) {
+            if (!click_lat_lng) {
+                return [dash_clientside.no_update, dash_clientside.no_update];
+            }
+            var lat = click_lat_lng[0].toFixed(3);
+            var lng = click_lat_lng[1].toFixed(3);
+            var marker = {
+                namespace: 'dash_leaflet',
+                type: 'Marker',
+                props: {
+                    position: click_lat_lng,
+                    children: {
+                        namespace: 'dash_leaflet',
+                        type: 'Tooltip',
+                        props: {children: '(' + lat + ', ' + lng + ')'}
+                    }
+                }
+            };
+            return [[marker], 'You have selected a point at ' + lat + ', ' + lng];
+        }
+    },
+    maplayers: {
+        // Draw a label cluster from a Geobuf layer as a circle sized by its count.
+        cluster_point: function(feature, latlng, context) {
+            var count = feature.properties.count;
+            return L.circleMarker(latlng, {
+                radius: 4 + 3 * Math.log2(count),
+                color: context.props.hideout.color
+            }).bindTooltip(count + (count === 1 ? ' label' : ' labels'));
+        }
+    }
+});
@@ -0,0 +1,192 @@
+"""
+Perceived open latency when stepping through photos with Next.
+
+The app runs on a local HTTP server with a cold thumbnail cache, and the
+originals come from a local image server that answers after a fixed latency,
+standing in for S3. A scripted browser opens a photo, looks at it for a while
+and clicks Next, again and again. Opening a photo is the show_box callback
+and then its preview, which comes from the browser's cache when the preview is
+already there, or from a preload still in flight.
+
+    off       the browser ignores the prefetch list of photo_neighbours
+    prefetch  the browser preloads it with PREFETCH_CONCURRENCY requests at a
+              time once the open photo's preview has loaded, dropping
+              unstarted preloads on every new photo, as assets/clientside.js
+              does
+
+    python -m benchmarks.browsing [--photos 20] [--dwell 0.5] [--latency 0.3]
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import statistics
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+from werkzeug.serving import make_server
+
+import app
+import thumbnails
+from benchmarks.common import callback_body
+
+PREFETCH_CONCURRENCY = 2
+ORIGINAL_SIZE = 1600 # pixels, like the lg_sq@2x originals
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Answers every path with a distinct JPEG after the server's latency."""
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        body = self.server.original(self.path)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ImageServer(ThreadingHTTPServer):
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), ImageHandler)
+        self.latency = latency
+        self._pixels = np.random.default_rng(0).integers(0, 64, (ORIGINAL_SIZE, ORIGINAL_SIZE, 3), dtype = np.uint8)
+        self._originals = {}
+        self._lock = threading.Lock()
+
+    def original(self, path):
+        # a different image per path, so every photo gets its own cached blobs
+        with self._lock:
+            if path not in self._originals:
+                shade = hashlib.sha1(path.encode('utf-8')).digest()[0]
+                buffer = io.BytesIO()
+                Image.fromarray(self._pixels + np.uint8(shade % 192)).save(buffer, 'JPEG', quality = 85)
+                self._originals[path] = buffer.getvalue()
+            return self._originals[path]
+
+
+class LocalOriginals(thumbnails.ThumbnailCache):
+    """Thumbnail cache fetching the originals from the local image server."""
+
+    def __init__(self, cache_dir, origin):
+        super().__init__(cache_dir)
+        self.origin = origin
+
+    def fetch(self, url):
+        with urllib.request.urlopen(self.origin + urllib.parse.urlparse(url).path, timeout = self.timeout) as response:
+            return response.read()
+
+
+def serve(server):
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    return 'http://127.0.0.1:{}'.format(server.server_port)
+
+
+class Browser:
+    """One tab: its HTTP cache of images and its preload queue."""
+
+    def __init__(self, origin, prefetch):
+        self.origin = origin
+        self.prefetch = prefetch
+        self.cache = {} # url -> future of the image bytes
+        self.pool = ThreadPoolExecutor(max_workers = PREFETCH_CONCURRENCY)
+        self.callbacks = json.loads(self.get('/_dash-dependencies'))
+        self.session_id = uuid.uuid4().hex
+
+    def get(self, url):
+        with urllib.request.urlopen(self.origin + url) as response:
+            return response.read()
+
+    def preload(self, urls):
+        for url, future in list(self.cache.items()):
+            if future.cancel():
+                del self.cache[url]
+        for url in urls:
+            if url not in self.cache:
+                self.cache[url] = self.pool.submit(self.get, url)
+
+    def image(self, url):
+        if url in self.cache:
+            return self.cache[url].result(), True
+        body = self.get(url)
+        self.cache[url] = self.pool.submit(lambda: body)
+        return body, False
+
+    def open(self, entry_id):
+        """Open a photo, returning (seconds, from cache, next Entry_ID)."""
+        body = callback_body(
+            self.callbacks,
+            'photo_neighbours.data',
+            {'selected_entry.data' : entry_id, 'url.pathname' : '/', 'session_id.data' : self.session_id},
+            ['selected_entry.data']
+        )
+        request = urllib.request.Request(
+            self.origin + '/_dash-update-component',
+            data = json.dumps(body).encode('utf-8'),
+            headers = {'Content-Type' : 'application/json'}
+        )
+        start = time.perf_counter()
+        with urllib.request.urlopen(request) as response:
+            neighbours = json.loads(response.read())['response']['photo_neighbours']['data']
+        image, cached = self.image(neighbours['current'])
+        seconds = time.perf_counter() - start
+        if self.prefetch:
+            self.preload(neighbours['prefetch'])
+        return seconds, cached, neighbours['next']
+
+
+def browse(origin, prefetch, photos, dwell):
+    browser = Browser(origin, prefetch)
+    entry_id = app.catalogues.get(app.DEFAULT_COLLECTION).table.column('Entry_ID')[0]
+    opens = []
+    for _ in range(photos):
+        seconds, cached, entry_id = browser.open(entry_id)
+        opens.append((seconds, cached))
+        if entry_id is None:
+            break
+        time.sleep(dwell)
+    browser.pool.shutdown(cancel_futures = True)
+    return opens
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--photos', type = int, default = 20, help = 'photos opened in a row')
+    parser.add_argument('--dwell', type = float, default = 0.5, help = 'seconds spent on each photo')
+    parser.add_argument('--latency', type = float, default = 0.3, help = 'seconds the image server takes to answer')
+    args = parser.parse_args()
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    images = serve(ImageServer(args.latency))
+    site = serve(make_server('127.0.0.1', 0, app.server, threaded = True))
+    print('{:<9} {:>9} {:>9} {:>9} {:>9} {:>7}'.format('mode', 'first ms', 'p50 ms', 'p90 ms', 'max ms', 'cached'))
+    for mode in ('off', 'prefetch'):
+        with tempfile.TemporaryDirectory() as directory:
+            # a cold thumbnail cache for each mode
+            app.thumbnail_cache = LocalOriginals(directory, images)
+            opens = browse(site, mode == 'prefetch', args.photos, args.dwell)
+        first = opens[0][0]
+        rest = sorted(seconds for seconds, cached in opens[1:])
+        print('{:<9} {:>9.1f} {:>9.1f} {:>9.1f} {:>9.1f} {:>4}/{:<2}'.format(
+            mode,
+            1000 * first,
+            1000 * statistics.median(rest),
+            1000 * rest[int(0.9 * (len(rest) - 1))],
+            1000 * rest[-1],
+            sum(cached for seconds, cached in opens[1:]),
+            len(rest)
+        ))
@@ -0,0 +1,81 @@
+"""
+Helpers shared by the benchmark scripts.
+
+Benchmarks drive the Dash endpoints in-process through the Flask test client;
+run them from the repository root, e.g. ``python -m benchmarks.selection``.
+"""
+
+import json
+import statistics
+import time
+
+
+def prop(id, property, value = None):
+    """One entry of the inputs/state/outputs lists sent by the Dash renderer."""
+    return {'id' : id, 'property' : property, 'value' : value}
+
+
+def output_key(outputs):
+    """The callback_map key Dash derives from a callback's outputs."""
+    def one(o):
+        id = o['id'] if isinstance(o['id'], str) else json.dumps(o['id'], sort_keys = True, separators = (',', ':'))
+        return '{}.{}'.format(id, o['property'])
+    if len(outputs) == 1:
+        return one(outputs[0])
+    return '..' + '...'.join(one(o) for o in outputs) + '..'
+
+
+def update_body(outputs, inputs, state = (), changed = ()):
+    """Build a /_dash-update-component request body."""
+    return {
+        'output' : output_key(outputs),
+        'outputs' : outputs if len(outputs) > 1 else outputs[0],
+        'inputs' : list(inputs),
+        'changedPropIds' : list(changed),
+        'state' : list(state)
+    }
+
+
+def callback_outputs(spec):
+    """The output props of one callback of /_dash-dependencies."""
+    key = spec['output']
+    keys = key[2:-2].split('...') if key.startswith('..') else [key]
+    return [prop(*key.rsplit('.', 1)) for key in keys]
+
+
+def callback_body(dependencies, output, values = {}, changed = ()):
+    """
+    Request body for the server callback among dependencies, the parsed
+    /_dash-dependencies, that has output ('id.property') among its outputs.
+    values gives its inputs and state by 'id.property'; the rest are None.
+    Built from the app's own callbacks, the body follows their signatures.
+    """
+    for spec in dependencies:
+        outputs = callback_outputs(spec)
+        if not spec.get('clientside_function') and output in ['{id}.{property}'.format(**o) for o in outputs]:
+            break
+    else:
+        raise KeyError(output)
+    def props(items):
+        return [prop(item['id'], item['property'], values.get('{id}.{property}'.format(**item))) for item in items]
+    return update_body(outputs, props(spec['inputs']), props(spec['state']), changed)
+
+
+def dependencies(client):
+    """The parsed /_dash-dependencies of the app behind a Flask test client."""
+    return json.loads(client.get('/_dash-dependencies').data)
+
+
+def post_update(client, body):
+    """POST one callback request, returning (request bytes, response bytes, seconds)."""
+    data = json.dumps(body).encode('utf-8')
+    start = time.perf_counter()
+    response = client.post('/_dash-update-component', data = data, content_type = 'application/json')
+    elapsed = time.perf_counter() - start
+    if response.status_code not in (200, 204):
+        raise RuntimeError('{} returned {}'.format(body['output'], response.status_code))
+    return len(data), len(response.data), elapsed
+
+
+def median_ms(samples):
+    return 1000 * statistics.median(samples)
@@ -0,0 +1,68 @@
+"""
+Cost of keeping consensus locations up to date.
+
+    incremental  PhotoConsensus.add for every new label of one photo
+    recompute    a full estimate over the photo's labels after every new one
+    backfill     consensus.estimate over all photos' labels in one batch
+    per photo    consensus.estimate called photo by photo
+
+    python -m benchmarks.consensus [--labels 2000] [--backfill 1000000] [--photos 10000]
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+import consensus
+
+
+def points(count, rng, outliers = 0.05):
+    """Clicks around one spot with some stray ones, as (lat, lng) arrays."""
+    lats = 26.2 + rng.normal(scale = 0.003, size = count)
+    lngs = -98.2 + rng.normal(scale = 0.003, size = count)
+    stray = rng.random(count) < outliers
+    lats[stray] = rng.uniform(25.5, 28.0, stray.sum())
+    lngs[stray] = rng.uniform(-100.0, -96.0, stray.sum())
+    return lats, lngs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--labels', type = int, default = 2000, help = 'labels of one photo')
+    parser.add_argument('--backfill', type = int, default = 1000000, help = 'labels in the backfill')
+    parser.add_argument('--photos', type = int, default = 10000, help = 'photos in the backfill')
+    args = parser.parse_args()
+    rng = np.random.default_rng(0)
+
+    lats, lngs = points(args.labels, rng)
+    photo = consensus.PhotoConsensus()
+    start = time.perf_counter()
+    for lat, lng in zip(lats.tolist(), lngs.tolist()):
+        photo.add(lat, lng)
+    incremental = time.perf_counter() - start
+    start = time.perf_counter()
+    for n in range(1, args.labels + 1):
+        consensus.estimate(np.zeros(n, dtype = np.int64), lats[:n], lngs[:n])
+    recompute = time.perf_counter() - start
+    print('{} labels of one photo'.format(args.labels))
+    print('  {:<12} {:>10.1f} us/label'.format('incremental', 1e6 * incremental / args.labels))
+    print('  {:<12} {:>10.1f} us/label'.format('recompute', 1e6 * recompute / args.labels))
+    print('  result      {}'.format(photo.result))
+
+    groups = rng.integers(0, args.photos, args.backfill)
+    lats, lngs = points(args.backfill, rng)
+    lats += groups * 1e-3 # a different spot per photo
+    start = time.perf_counter()
+    consensus.estimate(groups, lats, lngs)
+    backfill = time.perf_counter() - start
+    order = np.argsort(groups, kind = 'stable')
+    bounds = np.flatnonzero(np.diff(groups[order])) + 1
+    sample = np.split(order, bounds)[:1000]
+    start = time.perf_counter()
+    for rows in sample:
+        consensus.estimate(groups[rows], lats[rows], lngs[rows])
+    per_photo = (time.perf_counter() - start) / len(sample) * args.photos
+    print('{} labels of {} photos'.format(args.backfill, args.photos))
+    print('  {:<12} {:>10.2f} s'.format('backfill', backfill))
+    print('  {:<12} {:>10.2f} s (extrapolated from {} photos)'.format('per photo', per_photo, len(sample)))
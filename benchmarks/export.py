@@ -0,0 +1,130 @@
+"""
+Memory and speed of the streaming label export.
+
+Fills a SQLite label database with synthetic labels of the catalogue's
+photos, then exports the first 100k and all of them in every format, each in
+a fresh interpreter, reporting the peak RSS above what the interpreter held
+before exporting. The streamed exports should peak at the same few MB for
+both sizes; the naive export, which reads every label and encodes the whole
+CSV in memory as a plain query and writer would, grows with the labels.
+
+    python -m benchmarks.export [--labels 1000000]
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import catalogue
+import export
+import labels
+
+ASSETS_CSV = 'assets/mosth-beulah-metadata.csv'
+COLLECTION = 'mosth-beulah'
+CACHE_DIR = 'cache/catalogue'
+
+
+def fill(path, count):
+    store = labels.LabelStore(path)
+    conn = store.backend.connect()
+    entry_ids = catalogue.load_table(ASSETS_CSV, CACHE_DIR).column('Entry_ID')
+    rng = random.Random(0)
+    conn.executemany(
+        store.backend.insert,
+        (
+            (
+                '2021-08-01T{:02d}:{:02d}:00+00:00'.format(i // 60 % 24, i % 60),
+                COLLECTION,
+                rng.choice(entry_ids),
+                26.2 + rng.gauss(0, 0.5),
+                -98.2 + rng.gauss(0, 0.5),
+                None
+            )
+            for i in range(count)
+        )
+    )
+    conn.commit()
+    conn.close()
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def naive(store, tables, until_id):
+    join = export.CatalogueJoin(tables)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export.FIELDS)
+    for label_id, label in store.since(0, until_id, until_id):
+        writer.writerow(
+            (label_id, label.collection, label.entry_id) + join(label.collection, label.entry_id)
+            + (label.lat, label.lng, label.submitted_at)
+        )
+    yield buffer.getvalue().encode('utf-8')
+
+
+def child(path, format, count):
+    store = labels.LabelStore(path)
+    tables = {COLLECTION : catalogue.load_table(ASSETS_CSV, CACHE_DIR)}
+    until_id = store.last_id(0, count)
+    # loading pyarrow is not the export's memory
+    export.available(format)
+    before = peak_rss_mb()
+    start = time.perf_counter()
+    if format == 'naive':
+        chunks = naive(store, tables, until_id)
+    else:
+        chunks = export.export(store, tables, format, 0, until_id)
+    size = 0
+    with open(os.devnull, 'wb') as sink:
+        for data in chunks:
+            size += len(data)
+            sink.write(data)
+    return {'seconds' : time.perf_counter() - start, 'bytes' : size, 'peak_mb' : peak_rss_mb() - before}
+
+
+def run(path, format, count):
+    result = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.export', '--child', path, format, str(count)],
+        capture_output = True,
+        text = True
+    )
+    if result.returncode:
+        return {'error' : result.stderr.strip().splitlines()[-1]}
+    return json.loads(result.stdout.splitlines()[-1])
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--child']:
+        path, format, count = sys.argv[2:]
+        print(json.dumps(child(path, format, int(count))))
+        sys.exit()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--labels', type = int, default = 1000000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'labels.sqlite3')
+        start = time.perf_counter()
+        fill(path, args.labels)
+        print('{} synthetic labels written in {:.1f} s'.format(args.labels, time.perf_counter() - start))
+        print('{:<11} {:>9} {:>9} {:>10} {:>12}'.format('format', 'labels', 'seconds', 'labels/s', 'peak +MB'))
+        for format in list(export.FORMATS) + ['naive']:
+            for count in (min(100000, args.labels), args.labels):
+                result = run(path, format, count)
+                if 'error' in result:
+                    print('{:<11} {:>9} unavailable: {}'.format(format, count, result['error']))
+                    break
+                print('{:<11} {:>9} {:>9.1f} {:>10.0f} {:>12.1f}'.format(
+                    format, count, result['seconds'], count / result['seconds'], result['peak_mb']
+                ))
@@ -0,0 +1,163 @@
+"""
+Throughput of the image URL check against a local fixture server.
+
+The fixture stands in for the S3 bucket: it answers every path with one of a
+set of generated JPEGs after a fixed latency, honours HEAD and Range
+requests, keeps connections alive, and answers a share of the paths with
+404. A synthetic catalogue of --images URLs under the bucket's prefix is
+checked through ``--rewrite``, in each mode and with each number of workers:
+
+    mode  workers  checked  seconds  URLs/s  connections
+
+then re-run, when nothing is stale, and after --changed URLs were edited,
+when only those are checked. For comparison, ``urlopen`` fetches the same
+URLs on the same threads with urllib, a new connection per image, as
+thumbnails.py does.
+
+    python -m benchmarks.imagecheck [--images 2000] [--latency 0.02] [--workers 1 8 32] [--modes head probe full]
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+
+import imagecheck
+
+BUCKET = 'https://s3.us-west-2.amazonaws.com/app-catalogit-media-public/'
+MISSING = 20 # one path in this many is not found
+
+
+class ImageHandler(BaseHTTPRequestHandler):
+    """Serves one of the fixture's JPEGs for every path, after its latency."""
+
+    protocol_version = 'HTTP/1.1' # keep-alive
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_HEAD(self):
+        self.do_GET(body = False)
+
+    def do_GET(self, body = True):
+        time.sleep(self.server.latency)
+        digest = hashlib.sha1(self.path.encode('utf-8')).digest()
+        if digest[1] % MISSING == 0:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        data = self.server.bodies[digest[0] % len(self.server.bodies)]
+        start, stop = 0, len(data)
+        ranged = self.headers.get('Range', '').startswith('bytes=')
+        if ranged:
+            first, _, last = self.headers['Range'][len('bytes='):].partition('-')
+            start, stop = int(first), min(int(last) + 1 if last else len(data), len(data))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, stop - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(stop - start))
+        self.end_headers()
+        if body:
+            self.wfile.write(data[start:stop])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), ImageHandler)
+        self.latency = latency
+        self.connections = 0
+        self.lock = threading.Lock()
+        rng = np.random.default_rng(0)
+        self.bodies = []
+        for width, height in ((1200, 900), (900, 1200), (1024, 1024), (1600, 1067)):
+            # smooth gradients with noise, compressing about as well as photographs
+            y, x = np.mgrid[0:height, 0:width]
+            base = (x[..., None] * rng.uniform(0.05, 0.2, 3) + y[..., None] * rng.uniform(0.05, 0.2, 3)) % 256
+            pixels = np.clip(base + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+            buffer = io.BytesIO()
+            Image.fromarray(pixels).save(buffer, 'JPEG', quality = 85)
+            self.bodies.append(buffer.getvalue())
+        threading.Thread(target = self.serve_forever, daemon = True).start()
+        self.url = 'http://127.0.0.1:{}/'.format(self.server_port)
+
+
+def entries(count, edited = 0):
+    return [
+        ('img.{}'.format(i), '{}accounts/4837/photo/{}{}.JPG'.format(BUCKET, i, '.v2' if i < edited else ''))
+        for i in range(count)
+    ]
+
+
+def urlopen_rate(server, urls, workers):
+    """URLs/s fetching every image with urlopen, a new connection each."""
+    def fetch(url):
+        try:
+            with urllib.request.urlopen(server.url + url[len(BUCKET):], timeout = 10) as response:
+                return len(response.read())
+        except OSError:
+            return 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        list(pool.map(fetch, urls))
+    return len(urls) / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type = int, default = 2000)
+    parser.add_argument('--latency', type = float, default = 0.02, help = 'seconds the fixture takes per request')
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 8, 32])
+    parser.add_argument('--modes', nargs = '+', choices = imagecheck.MODES, default = list(imagecheck.MODES))
+    parser.add_argument('--changed', type = int, default = 100, help = 'URLs edited before the incremental re-run')
+    args = parser.parse_args()
+
+    server = FixtureServer(args.latency)
+    print('{} images, {} s per request, {} KB per image'.format(
+        args.images, args.latency, sum(map(len, server.bodies)) // len(server.bodies) // 1024
+    ))
+    print('{:<8} {:>8} {:>8} {:>8} {:>9} {:>12}'.format('mode', 'workers', 'checked', 'seconds', 'URLs/s', 'connections'))
+    with tempfile.TemporaryDirectory() as directory:
+        for mode in args.modes:
+            for workers in args.workers:
+                checks = imagecheck.ImageChecks(os.path.join(directory, '{}-{}.sqlite3'.format(mode, workers)))
+                fetcher = imagecheck.Fetcher(rewrite = (BUCKET, server.url))
+                before = server.connections
+                count, seconds, statuses = imagecheck.run(checks, fetcher, 'synthetic', entries(args.images), mode, workers)
+                print('{:<8} {:>8} {:>8} {:>8.2f} {:>9.0f} {:>12}'.format(
+                    mode, workers, count, seconds, count / seconds, server.connections - before
+                ))
+        for workers in args.workers:
+            rate = urlopen_rate(server, [url for _, url in entries(args.images)], workers)
+            print('{:<8} {:>8} {:>8} {:>8.2f} {:>9.0f} {:>12}'.format('urlopen', workers, args.images, args.images / rate, rate, args.images))
+
+        # re-runs of the last set-up
+        print()
+        for name, edited in (('nothing stale', 0), ('{} URLs edited'.format(args.changed), args.changed)):
+            count, seconds, statuses = imagecheck.run(checks, fetcher, 'synthetic', entries(args.images, edited), mode, workers)
+            print('{:<20} checked {:>5} in {:>7.1f} ms'.format(name, count, 1000 * seconds))
+        found = checks.lookup('synthetic', [entry_id for entry_id, _ in entries(args.images)])
+        print('{} recorded: {} not found, {} with dimensions, {} distinct hashes'.format(
+            len(found),
+            sum(row['status'] == 404 for row in found.values()),
+            sum(row['width'] is not None for row in found.values()),
+            len({row['phash'] for row in found.values()} - {None})
+        ))
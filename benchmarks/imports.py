@@ -0,0 +1,67 @@
+"""
+Cold start of a worker: the time to import app.
+
+Each run imports app in a fresh interpreter with ``-X importtime``, as a
+gunicorn worker or reload does, with the catalogue cache already built:
+
+    former  importing first what app.py used to import at module level
+            (pandas, numpy, plotly.express, plotly.graph_objects, dash_table
+            and dash_daq)
+    current app.py as it is
+
+and reports the median of the runs' total import time, the modules loaded,
+and the packages whose modules took the most time (their own, excluding what
+they import from other packages) in the last run.
+
+    python -m benchmarks.imports [--runs 5] [--top 10]
+"""
+
+import argparse
+import statistics
+import subprocess
+import sys
+
+FORMER_IMPORTS = 'import pandas, numpy, plotly.express, plotly.graph_objects, dash_table, dash_daq; '
+MODES = {
+    'former' : FORMER_IMPORTS + 'import app',
+    'current' : 'import app'
+}
+REPORT = 'import sys; print(len(sys.modules))'
+
+
+def profile(code):
+    """(seconds, modules loaded, {top-level package: seconds of its own modules}) of one cold import."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', '{}; {}'.format(code, REPORT)],
+        capture_output = True,
+        text = True,
+        check = True
+    )
+    packages = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        package = name.strip().split('.')[0]
+        packages[package] = packages.get(package, 0) + int(self_us) / 1e6
+    return sum(packages.values()), int(result.stdout.split()[-1]), packages
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--runs', type = int, default = 5)
+    parser.add_argument('--top', type = int, default = 10, help = 'packages to list')
+    args = parser.parse_args()
+
+    # builds the catalogue cache if needed, so no run pays for it
+    profile(MODES['current'])
+    print('{:<8} {:>10} {:>8}'.format('mode', 'import ms', 'modules'))
+    packages = {}
+    for mode, code in MODES.items():
+        runs = [profile(code) for _ in range(args.runs)]
+        packages[mode] = runs[-1][2]
+        print('{:<8} {:>10.0f} {:>8}'.format(mode, 1000 * statistics.median(run[0] for run in runs), runs[-1][1]))
+    for mode, times in packages.items():
+        print('\n{} - slowest packages:'.format(mode))
+        for package, seconds in sorted(times.items(), key = lambda item: -item[1])[:args.top]:
+            print('  {:<30} {:>7.0f} ms'.format(package, 1000 * seconds))
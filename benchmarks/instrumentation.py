@@ -0,0 +1,81 @@
+"""
+Overhead of the callback instrumentation.
+
+Times the same callback requests through the Flask test client with the
+/_dash-update-component view plain and instrumented, alternating between the
+two in rounds so drift affects both alike, and reports the median time per
+request and the overhead of recording.
+
+    python -m benchmarks.instrumentation [--rounds 20] [--requests 200]
+"""
+
+import argparse
+import time
+
+import app
+import instrumentation
+from benchmarks.common import callback_body, dependencies, post_update
+
+
+def requests(client):
+    """A gallery page turn and a photo preview, the most frequent server callbacks."""
+    entry_id = app.catalogues.get(app.DEFAULT_COLLECTION).table.column('Entry_ID')[0]
+    callbacks = dependencies(client)
+    session = {'session_id.data' : 'benchmark', 'url.pathname' : '/'}
+    return [
+        callback_body(
+            callbacks,
+            'gallery.children',
+            dict(session, **{
+                'gallery_next.n_clicks' : 1,
+                'gallery_search.value' : '',
+                'gallery_facets.value' : [],
+                'gallery_page.data' : 0
+            }),
+            ['gallery_next.n_clicks']
+        ),
+        callback_body(callbacks, 'selected_image.children', dict(session, **{'selected_entry.data' : entry_id}), ['selected_entry.data'])
+    ]
+
+
+def per_request_us(client, bodies, count):
+    start = time.perf_counter()
+    for i in range(count):
+        client.post('/_dash-update-component', json = bodies[i % len(bodies)])
+    return 1e6 * (time.perf_counter() - start) / count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rounds', type = int, default = 20)
+    parser.add_argument('--requests', type = int, default = 200)
+    args = parser.parse_args()
+
+    server = app.server
+    endpoint = '/_dash-update-component'
+    plain = server.view_functions[endpoint]
+    metrics = instrumentation.instrument(app.app)
+    instrumented = server.view_functions[endpoint]
+
+    client = server.test_client()
+    bodies = requests(client)
+    for body in bodies:
+        post_update(client, body) # raises unless the callback answers
+    per_request_us(client, bodies, 50) # warm up
+    times = {'plain' : [], 'instrumented' : []}
+    for _ in range(args.rounds):
+        for mode, view in (('plain', plain), ('instrumented', instrumented)):
+            server.view_functions[endpoint] = view
+            times[mode].append(per_request_us(client, bodies, args.requests))
+
+    # the fastest round is the least disturbed by the rest of the machine
+    plain_us = min(times['plain'])
+    instrumented_us = min(times['instrumented'])
+    print('{:<13} {:>10}'.format('view', 'us/request'))
+    print('{:<13} {:>10.1f}'.format('plain', plain_us))
+    print('{:<13} {:>10.1f}'.format('instrumented', instrumented_us))
+    print('overhead: {:.1f} us/request ({:.2f}%), {} samples recorded'.format(
+        instrumented_us - plain_us,
+        100 * (instrumented_us - plain_us) / plain_us,
+        sum(stats.duration.count for stats in metrics.stats.values())
+    ))
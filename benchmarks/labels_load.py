@@ -0,0 +1,70 @@
+"""
+Load test for the label store.
+
+Concurrent submitter threads push labels into a LabelStore backed by a
+temporary SQLite database (or the database given with --database) and the
+script reports how long submitters were blocked and the sustained write
+throughput once every label is on disk.
+
+    python -m benchmarks.labels_load [--threads 1 8 32] [--labels 20000]
+"""
+
+import argparse
+import pathlib
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import labels
+
+
+def load_test(database, threads, total, batch_size):
+    store = labels.LabelStore(database, batch_size = batch_size)
+    latencies = [[] for _ in range(threads)]
+    now = datetime.now(timezone.utc)
+
+    def submitter(n):
+        for i in range(total // threads):
+            start = time.perf_counter()
+            store.submit(now, 'mosth-beulah', '2013.001.{:03d}'.format(i % 400), 26.2 + i * 1e-5, -98.2 - n * 1e-5)
+            latencies[n].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target = submitter, args = (n,)) for n in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    submitted = time.perf_counter() - start
+    store.close()
+    written = time.perf_counter() - start
+    samples = sorted(latency for per_thread in latencies for latency in per_thread)
+    return {
+        'labels' : len(samples),
+        'submit_p50_us' : 1e6 * statistics.median(samples),
+        'submit_p99_us' : 1e6 * samples[int(0.99 * (len(samples) - 1))],
+        'submit_per_s' : len(samples) / submitted,
+        'written_per_s' : len(samples) / written
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type = int, nargs = '+', default = [1, 8, 32])
+    parser.add_argument('--labels', type = int, default = 20000)
+    parser.add_argument('--batch-size', type = int, default = 200)
+    parser.add_argument('--database', help = 'SQLite path or postgresql:// URL (default: temporary SQLite)')
+    args = parser.parse_args()
+
+    print('{:>7} {:>8} {:>10} {:>10} {:>12} {:>12}'.format(
+        'threads', 'labels', 'p50 us', 'p99 us', 'submit/s', 'written/s'
+    ))
+    with tempfile.TemporaryDirectory() as directory:
+        for threads in args.threads:
+            database = args.database or pathlib.Path(directory).joinpath('labels-{}.sqlite3'.format(threads))
+            result = load_test(database, threads, args.labels, args.batch_size)
+            print('{:>7} {labels:>8} {submit_p50_us:>10.1f} {submit_p99_us:>10.1f} {submit_per_s:>12.0f} {written_per_s:>12.0f}'.format(
+                threads, **result
+            ))
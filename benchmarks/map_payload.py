@@ -0,0 +1,86 @@
+"""
+Bytes sent to the browser for one map update as labels accumulate.
+
+Compares, for the initial view of the map at zoom 8:
+
+    markers     one dl.Marker per submitted label
+    clusters    one dl.CircleMarker per cluster, inline in the callback
+    geobuf      the callback's tile layer list plus the Geobuf tile blobs
+
+and the time to re-encode after one new label, which touches a single tile.
+
+    python -m benchmarks.map_payload [--sizes 1000 10000 100000]
+"""
+
+import argparse
+import json
+import random
+import time
+
+import dash_leaflet as dl
+import plotly
+
+import maplayers
+import spatial
+from benchmarks.spatial import scatter
+
+BOUNDS = [[25.4, -101.6], [28.4, -94.7]]
+ZOOM = 8
+
+
+def dash_bytes(components):
+    """Size of components as Dash serializes them in a callback response."""
+    return len(json.dumps(components, cls = plotly.utils.PlotlyJSONEncoder))
+
+
+def geobuf_update(grid, cache):
+    """Callback response bytes and Geobuf blob bytes for one map update."""
+    layers = []
+    blobs = 0
+    for (x, y), version in grid.tiles(BOUNDS, ZOOM).items():
+        layers.append(dl.GeoJSON(
+            id = 'labels-grey-{}-{}-{}-{}'.format(ZOOM, x, y, version),
+            url = '/map/labels/{}/{}/{}.pbf?v={}'.format(ZOOM, x, y, version),
+            format = 'geobuf',
+            options = {'pointToLayer' : {'variable' : 'dash_clientside.maplayers.cluster_point'}},
+            hideout = {'color' : 'grey'}
+        ))
+        blobs += len(cache.get(
+            (ZOOM, x, y),
+            version,
+            lambda: maplayers.cluster_collection(grid.tile_clusters(ZOOM, x, y))
+        ))
+    return dash_bytes(layers), blobs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1000, 10000, 100000])
+    args = parser.parse_args()
+
+    print('{:>8} {:>12} {:>12} {:>10} {:>10} {:>14}'.format(
+        'labels', 'markers B', 'clusters B', 'layers B', 'geobuf B', 'reencode ms'
+    ))
+    rng = random.Random(0)
+    for size in args.sizes:
+        points = list(scatter(size, rng))
+        grid = spatial.GridIndex()
+        for lat, lng in points:
+            grid.add(lat, lng)
+        markers = dash_bytes([
+            dl.Marker(position = [lat, lng], children = dl.Tooltip('({:.3f}, {:.3f})'.format(lat, lng)))
+            for lat, lng in points
+        ])
+        clusters = dash_bytes([
+            dl.CircleMarker(center = [c.lat, c.lng], radius = 10, color = 'grey', children = dl.Tooltip('{} labels'.format(c.count)))
+            for c in grid.clusters(BOUNDS, ZOOM)
+        ])
+        cache = maplayers.GeobufCache()
+        layer_bytes, blob_bytes = geobuf_update(grid, cache)
+        grid.add(*points[0])
+        start = time.perf_counter()
+        geobuf_update(grid, cache)
+        reencode = 1000 * (time.perf_counter() - start)
+        print('{:>8} {:>12} {:>12} {:>10} {:>10} {:>14.2f}'.format(
+            size, markers, clusters, layer_bytes, blob_bytes, reencode
+        ))
@@ -0,0 +1,86 @@
+"""
+Page loads per second, with and without the pre-compressed Dash payloads.
+
+A page load is the three requests the browser makes before any callback runs:
+the index page, /_dash-layout and /_dash-dependencies, sent with the
+Accept-Encoding of a current browser. A revisit sends the ETags of the
+previous load back.
+
+    before  Dash's own views, serializing on every request and gzipping the
+            result through Flask-Compress, as Dash configures it by default
+    after   precompressed.PrecompressedDash
+
+    python -m benchmarks.page_load [--seconds 5]
+"""
+
+import argparse
+import functools
+import time
+
+import dash
+
+import app
+
+PAGE = ('/', '/_dash-layout', '/_dash-dependencies')
+ACCEPT_ENCODING = 'gzip, deflate, br'
+
+
+def use_dash_views(enabled):
+    """Swap Dash's own layout/dependencies/index views (and gzip only) in or out."""
+    server = app.server
+    views = {
+        '/' : dash.Dash.index,
+        '/_dash-layout' : dash.Dash.serve_layout,
+        '/_dash-dependencies' : dash.Dash.dependencies
+    }
+    for endpoint, view in views.items():
+        bound = getattr(app.app, view.__name__)
+        server.view_functions[endpoint] = functools.partial(view, app.app) if enabled else bound
+    compress = server.after_request_funcs[None][0].__self__
+    compress.enabled_algorithms = ['gzip'] if enabled else list(app.precompressed.ENCODINGS)
+
+
+def page_load(client, etags):
+    """Load the page, returning the bytes received."""
+    received = 0
+    for path in PAGE:
+        headers = {'Accept-Encoding' : ACCEPT_ENCODING}
+        if path in etags:
+            headers['If-None-Match'] = etags[path]
+        response = client.get(path, headers = headers)
+        received += len(response.data)
+    return received
+
+
+def measure(client, revisit, seconds):
+    etags = {}
+    if revisit:
+        for path in PAGE:
+            response = client.get(path, headers = {'Accept-Encoding' : ACCEPT_ENCODING})
+            if response.headers.get('ETag'):
+                etags[path] = response.headers['ETag']
+    loads = 0
+    received = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        received += page_load(client, etags)
+        loads += 1
+    elapsed = time.perf_counter() - start
+    return loads / elapsed, received / loads
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type = float, default = 5)
+    args = parser.parse_args()
+
+    client = app.server.test_client()
+    page_load(client, {}) # first request setup
+    print('{:<7} {:<8} {:>11} {:>9} {:>13}'.format('mode', 'visit', 'loads/s', 'req/s', 'bytes/load'))
+    for mode in ('before', 'after'):
+        use_dash_views(mode == 'before')
+        for revisit in (False, True):
+            rate, size = measure(client, revisit, args.seconds)
+            print('{:<7} {:<8} {:>11.1f} {:>9.1f} {:>13.0f}'.format(
+                mode, 'revisit' if revisit else 'first', rate, rate * len(PAGE), size
+            ))
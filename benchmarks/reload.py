@@ -0,0 +1,94 @@
+"""
+Cost of picking up an edited catalogue in a running worker.
+
+Loads a collection over a synthetic catalogue, then repeatedly edits the CSV
+(changing the titles of some rows, removing as many and appending as many
+new ones), publishes it as the watcher's child process would, and times how
+long the worker's next ``table`` access takes to remap the table and update
+its search index from the table's diff. For comparison it times the former
+full re-sync of an index over the same change, which hashes every row:
+
+    rows  changed  publish s  reload ms  full re-sync ms
+
+The reload should grow with the number of changed rows only; the full
+re-sync with the size of the catalogue.
+
+    python -m benchmarks.reload [--rows 100000] [--changes 1 100 1000]
+"""
+
+import argparse
+import csv
+import pathlib
+import tempfile
+import time
+
+import catalogue
+import registry
+import search
+from benchmarks.startup import synthetic_csv
+
+
+def documents(table):
+    fields = list(search.SEARCH_FIELDS)
+    return [
+        (entry_id, dict(zip(fields, values)))
+        for entry_id, *values in zip(table.column('Entry_ID'), *(table.column(field) for field in fields))
+    ]
+
+
+def edit(csv_path, count, round):
+    """Retitle count rows, remove count rows and append count new ones."""
+    with open(csv_path, newline = '') as f:
+        reader = csv.DictReader(f)
+        fieldnames = reader.fieldnames
+        rows = list(reader)
+    step = max(len(rows) // (2 * count), 1)
+    for row in rows[:step * count:step]:
+        row['Title'] = 'Retitled {} {}'.format(round, row['Title'])
+    removed = set(range(step // 2, step * count, step)[:count])
+    appended = [
+        dict(rows[i], Entry_ID = 'added.{}.{}'.format(round, i))
+        for i in range(count)
+    ]
+    rows = [row for i, row in enumerate(rows) if i not in removed] + appended
+    with open(csv_path, 'w', newline = '') as f:
+        writer = csv.DictWriter(f, fieldnames = fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, default = 100000)
+    parser.add_argument('--changes', type = int, nargs = '+', default = [1, 100, 1000])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = synthetic_csv(args.rows, directory)
+        cache_dir = pathlib.Path(directory).joinpath('cache')
+        collection = registry.Collection('synthetic', csv_path, cache_dir, 10)
+        # the index a full re-sync updates, as every swap did before table diffs
+        former = search.SearchIndex()
+        former.sync(documents(collection.table))
+
+        print('{:>8} {:>8} {:>10} {:>10} {:>16}'.format('rows', 'changed', 'publish s', 'reload ms', 'full re-sync ms'))
+        for round, count in enumerate(args.changes):
+            edit(csv_path, count, round)
+            start = time.perf_counter()
+            catalogue.publish(csv_path, cache_dir)
+            published = time.perf_counter() - start
+
+            collection.catalogue._checked = 0 # do not wait for the next check
+            start = time.perf_counter()
+            table = collection.table
+            reloaded = time.perf_counter() - start
+            if table.diff is None:
+                raise RuntimeError('the published table has no diff')
+
+            start = time.perf_counter()
+            former.sync(documents(table))
+            resynced = time.perf_counter() - start
+            diff_rows = sum(len(table.diff[kind]) for kind in ('added', 'changed', 'removed'))
+            print('{:>8} {:>8} {:>10.2f} {:>10.1f} {:>16.1f}'.format(
+                len(table), diff_rows, published, 1000 * reloaded, 1000 * resynced
+            ))
@@ -0,0 +1,71 @@
+"""
+Search latency over a synthetic catalogue.
+
+Builds the index over the real metadata repeated to the requested size, times
+a set of representative queries, and times an incremental re-sync after a
+small fraction of the documents change.
+
+    python -m benchmarks.search [--rows 100000]
+"""
+
+import argparse
+import tempfile
+import time
+
+import catalogue
+import search
+from benchmarks.common import median_ms
+from benchmarks.startup import synthetic_csv
+
+QUERIES = [
+    ('exact', 'bridge', ()),
+    ('common term', 'hurricane', ()),
+    ('two terms', 'flooded street', ()),
+    ('prefix', 'mcal', ()),
+    ('typo', 'harlingne', ()),
+    ('facet filter', 'water', (('Type', 'Photograph'),)),
+    ('empty query', '', ())
+]
+
+
+def documents(frame):
+    fields = list(search.SEARCH_FIELDS)
+    return [
+        (entry_id, dict(zip(fields, values)))
+        for entry_id, *values in zip(frame['Entry_ID'], *(frame[field] for field in fields))
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, default = 100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        frame = catalogue.build_frame(synthetic_csv(args.rows, directory))
+    docs = documents(frame)
+
+    index = search.SearchIndex()
+    start = time.perf_counter()
+    index.sync(docs)
+    print('indexed {} documents in {:.2f} s'.format(len(index), time.perf_counter() - start))
+
+    print('{:>14} {:>20} {:>9} {:>9}'.format('query', 'text', 'matches', 'ms'))
+    for name, text, filters in QUERIES:
+        times = []
+        for _ in range(20):
+            start = time.perf_counter()
+            result = index.search(text, filters, limit = 10)
+            times.append(time.perf_counter() - start)
+        matches = sum(result.facets['Type'].values())
+        print('{:>14} {:>20} {:>9} {:>9.2f}'.format(name, repr(text), matches, median_ms(times)))
+
+    changed = [
+        (doc_id, dict(fields, Description = fields['Description'] + ' revised'))
+        for doc_id, fields in docs[:len(docs) // 100]
+    ]
+    start = time.perf_counter()
+    reindexed = index.sync(changed + docs[len(docs) // 100:])
+    print('re-synced after {} changes: {} documents re-indexed in {:.2f} s'.format(
+        len(changed), reindexed, time.perf_counter() - start
+    ))
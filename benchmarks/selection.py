@@ -0,0 +1,164 @@
+"""
+Per-click cost of selecting a gallery card.
+
+Compares the former pattern-matching callbacks, which shipped the n_clicks and
+ids of every card with each click, against the selection store, which sends
+only the selected Entry_ID. Reports request bytes and server time per click
+for several gallery sizes.
+
+    python -m benchmarks.selection
+
+With CLIENTSIDE_CALLBACKS=0 the selection store's column also includes the
+label modal callback, which otherwise runs in the browser.
+"""
+
+import json
+
+import dash
+import dash_html_components as html
+from dash.dependencies import Input, Output, State, ALL
+
+import app
+from benchmarks.common import callback_body, dependencies, prop, update_body, post_update, median_ms
+
+CARD_COUNTS = (10, 372, 10000)
+REPEAT = 20
+
+
+def legacy_app():
+    """The card callbacks as they were before the selection store."""
+    legacy = dash.Dash(__name__, suppress_callback_exceptions = True)
+    legacy.layout = html.Div()
+
+    @legacy.callback(
+        Output("liveview_label_modal_app", "is_open"),
+        [
+            Input({'type':'image-card','index': ALL}, 'n_clicks'),
+            Input("btn_submit", "n_clicks"),
+            Input("liveview_modal_close_button_app", "n_clicks")
+        ],
+        State("liveview_label_modal_app", "is_open")
+    )
+    def display_page(n_add, n_ok, n_close, is_open):
+        triggered = dash.callback_context.triggered[0]['prop_id'].replace('.n_clicks','')
+        try:
+            if json.loads(triggered):
+                return True
+        except ValueError:
+            pass
+        return False
+
+    @legacy.callback(
+        Output('selected_image','children'),
+        Input({'type':'image-card','index': ALL}, 'n_clicks'),
+        State({'type':'image-card','index': ALL}, 'id')
+    )
+    def show_box(n_clicks, entry_id):
+        triggered = dash.callback_context.triggered[0]['prop_id'].replace('.n_clicks','')
+        trigger_index = json.loads(triggered)['index']
+        image_url = app.catalogues.get(app.DEFAULT_COLLECTION).value(trigger_index, 'Image_url')
+        return html.Div(html.Img(src = image_url))
+
+    @legacy.callback(
+        [
+            Output("liveview_label_modal", "is_open"),
+            Output("liveview_label_image", "value")
+        ],
+        [
+            Input("btn_submit", "n_clicks"),
+            Input({'type':'select_button','index': ALL}, 'n_clicks')
+        ],
+        State({'type':'select_button','index': ALL}, 'id')
+    )
+    def show_modal(n_add, n_clicks, entry_id):
+        triggered = dash.callback_context.triggered[0]['prop_id'].replace('.n_clicks','')
+        if triggered == "btn_submit":
+            return True, entry_id
+        return False, entry_id
+
+    return legacy
+
+
+def card_ids(count):
+    """Real Entry_IDs first, padded with synthetic ids for large galleries."""
+    ids = app.catalogues.get(app.DEFAULT_COLLECTION).table.column('Entry_ID')[:count]
+    return ids + ['synthetic.{:06d}'.format(i) for i in range(count - len(ids))]
+
+
+def legacy_click(ids):
+    """The three requests fired by clicking the first card's button."""
+    clicked = ids[0]
+    def pattern(type, clicks):
+        return [
+            prop({'index' : i, 'type' : type}, 'n_clicks', clicks if i == clicked else 0)
+            for i in ids
+        ]
+    def pattern_ids(type):
+        return [prop({'index' : i, 'type' : type}, 'id', {'index' : i, 'type' : type}) for i in ids]
+    card_changed = json.dumps({'index' : clicked, 'type' : 'image-card'}, sort_keys = True, separators = (',', ':')) + '.n_clicks'
+    button_changed = card_changed.replace('image-card', 'select_button')
+    return [
+        update_body(
+            [prop('liveview_label_modal_app', 'is_open')],
+            [
+                pattern('image-card', 1),
+                prop('btn_submit', 'n_clicks'),
+                prop('liveview_modal_close_button_app', 'n_clicks')
+            ],
+            [prop('liveview_label_modal_app', 'is_open', False)],
+            [card_changed]
+        ),
+        update_body(
+            [prop('selected_image', 'children')],
+            [pattern('image-card', 1)],
+            [pattern_ids('image-card')],
+            [card_changed]
+        ),
+        update_body(
+            [prop('liveview_label_modal', 'is_open'), prop('liveview_label_image', 'value')],
+            [prop('btn_submit', 'n_clicks'), pattern('select_button', 1)],
+            [pattern_ids('select_button')],
+            [button_changed]
+        )
+    ]
+
+
+def store_click(callbacks, ids):
+    """The server requests fired once the clientside handler has set selected_entry."""
+    values = {
+        'selected_entry.data' : ids[0],
+        'liveview_label_modal_app.is_open' : False,
+        'url.pathname' : '/',
+        'session_id.data' : 'benchmark'
+    }
+    bodies = []
+    for output in ('liveview_label_modal_app.is_open', 'selected_image.children'):
+        try:
+            bodies.append(callback_body(callbacks, output, values, ['selected_entry.data']))
+        except KeyError:
+            pass # runs in the browser with CLIENTSIDE_CALLBACKS on
+    return bodies
+
+
+def measure(client, bodies):
+    """Request bytes, response bytes and median server ms for one click."""
+    times = []
+    for _ in range(REPEAT):
+        results = [post_update(client, body) for body in bodies]
+        times.append(sum(elapsed for _, _, elapsed in results))
+    request_bytes = sum(sent for sent, _, _ in results)
+    response_bytes = sum(received for _, received, _ in results)
+    return request_bytes, response_bytes, median_ms(times)
+
+
+if __name__ == '__main__':
+    legacy_client = legacy_app().server.test_client()
+    store_client = app.server.test_client()
+    callbacks = dependencies(store_client)
+    print('{:>7} | {:>24} | {:>24}'.format('cards', 'pattern callbacks', 'selection store'))
+    print('{:>7} | {:>8} {:>8} {:>6} | {:>8} {:>8} {:>6}'.format('', 'req B', 'resp B', 'ms', 'req B', 'resp B', 'ms'))
+    for count in CARD_COUNTS:
+        ids = card_ids(count)
+        before = measure(legacy_client, legacy_click(ids))
+        after = measure(store_client, store_click(callbacks, ids))
+        print('{:>7} | {:>8} {:>8} {:>6.2f} | {:>8} {:>8} {:>6.2f}'.format(count, *before, *after))
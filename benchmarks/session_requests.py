@@ -0,0 +1,103 @@
+"""
+Server round trips of a scripted user session.
+
+Replays the props a browser changes for each user step through the app's
+callback graph, the way the Dash renderer does: every callback with a changed
+input fires, its outputs count as changed in turn, and only callbacks without
+a clientside function cost a request to a worker. The app is imported in a
+fresh interpreter with the UI-only callbacks on the server (before) and in the
+browser (after).
+
+    python -m benchmarks.session_requests
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+# (step, props the browser changes)
+SESSION = [
+    ('open intro', [('url', 'pathname')]),
+    ('close intro', [('liveview_modal_ok_button_initial', 'n_clicks')]),
+    ('pick photo', [('image-card', 'n_clicks')]),
+    ('click map', [('map', 'click_lat_lng')]),
+    ('submit', [('btn_submit', 'n_clicks')]),
+    ('confirm', [('liveview_modal_ok_button', 'n_clicks')]),
+    ('next photo', [('photo_next', 'n_clicks')]),
+    ('close photo', [('liveview_modal_close_button_app', 'n_clicks')])
+]
+
+
+def component(id):
+    """Component id, or the type of a pattern-matching id."""
+    if id.startswith('{'):
+        return json.loads(id)['type']
+    return id
+
+
+def props(spec):
+    """(id, property) pairs of an output spec such as '..a.children...b.data..'."""
+    spec = spec.strip('.')
+    parts = spec.split('...') if '...' in spec else [spec]
+    return [tuple(part.rsplit('.', 1)) for part in parts]
+
+
+def count_requests():
+    import app
+    callbacks = [
+        (
+            props(callback['output']),
+            {(component(i['id']), i['property']) for i in callback['inputs']},
+            callback['clientside_function'] is None,
+            callback['output']
+        )
+        for callback in app.app._callback_list
+    ]
+    steps = []
+    for step, changed in SESSION:
+        changed = set(changed)
+        fired = set()
+        server = []
+        while True:
+            ready = [
+                callback for callback in callbacks
+                if callback[3] not in fired and callback[1] & changed
+            ]
+            if not ready:
+                break
+            for outputs, inputs, on_server, name in ready:
+                fired.add(name)
+                if on_server:
+                    server.append(name.strip('.'))
+                changed.update((component(id), prop) for id, prop in outputs)
+        steps.append((step, server))
+    return steps
+
+
+def run(clientside):
+    env = dict(os.environ, CLIENTSIDE_CALLBACKS = '1' if clientside else '0')
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.session_requests', '--child'],
+        env = env,
+        check = True,
+        capture_output = True,
+        text = True
+    ).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] == ['--child']:
+        print(json.dumps(count_requests()))
+        sys.exit()
+
+    before, after = run(False), run(True)
+    print('{:<12} {:>7} {:>6}  {}'.format('step', 'before', 'after', 'server callbacks after'))
+    for (step, server_before), (_, server_after) in zip(before, after):
+        print('{:<12} {:>7} {:>6}  {}'.format(step, len(server_before), len(server_after), ', '.join(server_after)))
+    print('{:<12} {:>7} {:>6}'.format(
+        'total',
+        sum(len(server) for _, server in before),
+        sum(len(server) for _, server in after)
+    ))
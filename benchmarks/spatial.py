@@ -0,0 +1,52 @@
+"""
+Viewport query latency of the label index as labels accumulate.
+
+Random labels are scattered over the study area and the map's initial view
+is queried at several zoom levels after each batch of inserts.
+
+    python -m benchmarks.spatial [--sizes 1000 10000 100000 500000]
+"""
+
+import argparse
+import random
+import time
+
+import spatial
+from benchmarks.common import median_ms
+
+CENTER = (26.903, -98.158)
+VIEWS = {
+    8 : [[25.4, -101.6], [28.4, -94.7]],
+    12 : [[26.81, -98.37], [26.99, -97.94]],
+    16 : [[26.897, -98.171], [26.908, -98.144]]
+}
+
+
+def scatter(count, rng):
+    for _ in range(count):
+        yield rng.gauss(CENTER[0], 0.3), rng.gauss(CENTER[1], 0.5)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type = int, nargs = '+', default = [1000, 10000, 100000, 500000])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    index = spatial.LabelIndex()
+    print('{:>8} {:>10} '.format('labels', 'insert us') + ' '.join('{:>14}'.format('z{} ms (n)'.format(z)) for z in VIEWS))
+    for size in args.sizes:
+        points = list(scatter(size - index.all.count, rng))
+        start = time.perf_counter()
+        for lat, lng in points:
+            index.add(('mosth-beulah', '2013.001.030'), lat, lng)
+        insert_us = 1e6 * (time.perf_counter() - start) / max(len(points), 1)
+        row = []
+        for zoom, bounds in VIEWS.items():
+            times = []
+            for _ in range(50):
+                start = time.perf_counter()
+                clusters = index.clusters(bounds, zoom)
+                times.append(time.perf_counter() - start)
+            row.append('{:>8.3f} ({:>3})'.format(median_ms(times), len(clusters)))
+        print('{:>8} {:>10.1f} '.format(size, insert_us) + ' '.join(row))
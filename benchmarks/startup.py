@@ -0,0 +1,101 @@
+"""
+Worker start-up cost of loading the catalogue.
+
+Each measurement runs in a fresh interpreter, as a gunicorn worker would, and
+reports the time until the catalogue can be served and the resulting peak RSS
+for:
+
+    apply   the former read_csv + row-wise apply + copy + set_index path
+    cold    catalogue.SharedCatalogue with an empty cache, publishing the table
+            (the first worker, or the publisher)
+    warm    catalogue.SharedCatalogue mapping the published table, as every
+            worker does once it exists; values are read from it on demand
+
+    python -m benchmarks.startup [--rows 319 100000]
+"""
+
+import argparse
+import csv
+import json
+import pathlib
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ASSETS_PATH = pathlib.Path(__file__).parent.parent.joinpath('assets')
+METADATA = ASSETS_PATH.joinpath('mosth-beulah-metadata.csv')
+
+
+def load(mode, csv_path, cache_dir):
+    """Load the catalogue the way the app does, or did, for the given mode."""
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if mode == 'apply':
+        # the importing is part of the former path's cost
+        import pandas as pd
+        df = pd.read_csv(csv_path)
+        images = df.copy()
+        images['Details'] = images.apply(lambda x: x['Title'] + '\n  ' + x['Description'] + '\n  ' + x['Entry_ID'], axis=1)
+        images['image_url_thumbnail'] = images.apply(lambda x: x['Image_url'] + '#thumbnail', axis=1)
+        images['Photo'] = images.apply(lambda x: '![]({})'.format(x['image_url_thumbnail']), axis=1)
+        # the Entry_ID lookup table
+        df.set_index('Entry_ID')
+    else:
+        import catalogue
+        table = catalogue.SharedCatalogue(csv_path, cache_dir).table
+        # ready for lookups by Entry_ID
+        table.row(table.value('Entry_ID', 0))
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {'seconds' : elapsed, 'rss_mb' : after / 1024, 'rss_delta_mb' : (after - before) / 1024}
+
+
+def synthetic_csv(rows, directory):
+    """Repeat the real metadata up to the requested row count, with unique ids."""
+    with open(METADATA, newline = '') as f:
+        source = list(csv.DictReader(f))
+    path = pathlib.Path(directory).joinpath('synthetic-{}-metadata.csv'.format(rows))
+    with open(path, 'w', newline = '') as f:
+        writer = csv.DictWriter(f, fieldnames = list(source[0]))
+        writer.writeheader()
+        for i in range(rows):
+            row = dict(source[i % len(source)])
+            row['Index'] = i
+            row['Entry_ID'] = '{}.{}'.format(row['Entry_ID'], i)
+            row['Collection'] = row['Collection'] or 'Hurricane Beulah'
+            writer.writerow(row)
+    return path
+
+
+def run(mode, csv_path, cache_dir):
+    output = subprocess.run(
+        [sys.executable, '-m', 'benchmarks.startup', '--child', mode, str(csv_path), str(cache_dir)],
+        check = True,
+        capture_output = True,
+        text = True
+    ).stdout
+    return json.loads(output)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, nargs = '+', default = [319, 100000])
+    parser.add_argument('--child', nargs = 3, help = argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(load(*args.child)))
+        sys.exit()
+
+    print('{:>8} {:>6} {:>9} {:>8} {:>10}'.format('rows', 'mode', 'seconds', 'RSS MB', 'delta MB'))
+    with tempfile.TemporaryDirectory() as directory:
+        for rows in args.rows:
+            csv_path = synthetic_csv(rows, directory)
+            cache_dir = pathlib.Path(directory).joinpath('cache-{}'.format(rows))
+            for mode in ('apply', 'cold', 'warm'):
+                result = run(mode, csv_path, cache_dir)
+                print('{:>8} {:>6} {:>9.3f} {:>8.1f} {:>10.1f}'.format(
+                    rows, mode, result['seconds'], result['rss_mb'], result['rss_delta_mb']
+                ))
@@ -0,0 +1,153 @@
+"""
+Label submission latency as the database gets slower.
+
+Concurrent clients confirm labels through the save_label callback while every
+database commit is delayed by a fixed write latency. With the queued label
+store the callback only enqueues, so its latency should not follow the write
+latency; the sync mode writes in the request, as show_modal did before the
+queue, for comparison.
+
+    python -m benchmarks.submissions [--clients 8] [--labels 50] [--latency 0 0.01 0.1 0.5]
+"""
+
+import argparse
+import collections
+import pathlib
+import statistics
+import tempfile
+import threading
+import time
+
+import app
+import labels
+from benchmarks.common import callback_body, dependencies
+
+
+class SlowConnection:
+    """Database connection whose commits take latency seconds longer."""
+
+    def __init__(self, conn, latency):
+        self._conn = conn
+        self._latency = latency
+
+    def commit(self):
+        time.sleep(self._latency)
+        self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+class SlowBackend(labels.SQLiteBackend):
+    def __init__(self, path, latency):
+        super().__init__(path)
+        self.latency = latency
+
+    def connect(self):
+        return SlowConnection(super().connect(), self.latency)
+
+
+class SyncStore:
+    """Writes each label in the calling thread, one writer at a time."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def submit(self, submitted_at, collection, entry_id, lat, lng, key = None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self.backend.connect()
+        with self._lock:
+            conn.execute(self.backend.insert, (submitted_at, collection, entry_id, lat, lng, key))
+            conn.commit()
+        return labels.WRITTEN
+
+    def close(self, timeout = None):
+        return 0
+
+
+def save_body(callbacks, session_id, n):
+    return callback_body(
+        callbacks,
+        'label_status.children',
+        {'liveview_modal_ok_button.n_clicks' : n, 'session_id.data' : session_id, 'pending_labels.data' : []},
+        ['liveview_modal_ok_button.n_clicks']
+    )
+
+
+def client_session(callbacks, client_id, count, latencies):
+    client = app.server.test_client()
+    session_id = 'client-{}'.format(client_id)
+    for n in range(count):
+        # the label show_modal leaves in the session for confirmation; a new
+        # minute per label, so every label has its own idempotency key
+        app.session_store.set(session_id, pending = {
+            'collection' : app.DEFAULT_COLLECTION,
+            'entry_id' : '2013.001.030',
+            'lat' : 26.2,
+            'lng' : -98.2,
+            'dt' : '2021-08-01 {:02d}:{:02d}:00'.format(n // 60, n % 60)
+        })
+        start = time.perf_counter()
+        response = client.post('/_dash-update-component', json = save_body(callbacks, session_id, n + 1))
+        latencies.append(time.perf_counter() - start)
+        if response.status_code != 200:
+            raise RuntimeError('save_label returned {}'.format(response.status_code))
+
+
+def measure(store, clients, count):
+    app.label_store = store
+    # start the writer and open the database before timing
+    store.submit('2021-08-01T00:00:00', app.DEFAULT_COLLECTION, 'warm-up', 0, 0)
+    if hasattr(store, 'flush'):
+        store.flush()
+    callbacks = dependencies(app.server.test_client())
+    # outcomes of the callbacks' submissions
+    outcomes = collections.Counter()
+    submit = store.submit
+    def counted_submit(*args, **kwargs):
+        outcome = submit(*args, **kwargs)
+        outcomes[outcome] += 1
+        return outcome
+    store.submit = counted_submit
+    latencies = []
+    threads = [
+        threading.Thread(target = client_session, args = (callbacks, i, count, latencies))
+        for i in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    store.close()
+    latencies.sort()
+    return {
+        'p50_ms' : 1000 * statistics.median(latencies),
+        'p99_ms' : 1000 * latencies[min(len(latencies) - 1, int(0.99 * len(latencies)))],
+        'deferred' : outcomes[labels.DEFERRED]
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--clients', type = int, default = 8)
+    parser.add_argument('--labels', type = int, default = 50, help = 'labels per client')
+    parser.add_argument('--latency', type = float, nargs = '+', default = [0, 0.01, 0.1, 0.5])
+    parser.add_argument('--max-pending', type = int, default = app.LABEL_QUEUE_SIZE)
+    args = parser.parse_args()
+
+    print('{:<7} {:>11} {:>9} {:>9} {:>9}'.format('mode', 'write ms', 'p50 ms', 'p99 ms', 'deferred'))
+    with tempfile.TemporaryDirectory() as directory:
+        for latency in args.latency:
+            for mode in ('queued', 'sync'):
+                backend = SlowBackend(pathlib.Path(directory).joinpath('{}-{}.sqlite3'.format(mode, latency)), latency)
+                if mode == 'queued':
+                    store = labels.LabelStore(backend, max_pending = args.max_pending)
+                else:
+                    store = SyncStore(backend)
+                result = measure(store, args.clients, args.labels)
+                print('{:<7} {:>11.0f} {:>9.2f} {:>9.2f} {:>9}'.format(
+                    mode, 1000 * latency, result['p50_ms'], result['p99_ms'], result['deferred']
+                ))
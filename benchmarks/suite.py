@@ -0,0 +1,416 @@
+"""
+End-to-end load test of the Dash endpoints with recorded user sessions.
+
+Virtual users replay the session scripts in benchmarks/sessions/ (the index
+page, /_dash-layout, /_dash-dependencies and the /_dash-update-component
+requests a browser made) in a loop for a fixed time, either in-process
+through the Flask test client or over HTTP against a local gunicorn with N
+workers. Each request is timed and reported per endpoint, with callback
+requests named after the callback function:
+
+    requests, throughput, p50/p95/p99 latency, request and response bytes
+
+plus the memory (RSS and PSS) of the process, or of the gunicorn master and
+each worker. Results are written as JSON; compared against a baseline
+result, latency, throughput and payload changes beyond a tolerance are
+flagged and the run exits with status 1.
+
+Callback requests are replayed against the app's current /_dash-dependencies:
+each body is rebuilt for its callback's inputs and state as they are now, with
+the recorded values and, for props the recording did not send, the last value
+the session sent for them, so scripts survive callbacks gaining arguments.
+
+    python -m benchmarks.suite run [--mode inprocess|gunicorn] [--workers 4] [--users 8] [--seconds 10]
+                                   [--output results.json] [--baseline baseline.json] [--tolerance 0.2]
+    python -m benchmarks.suite compare results.json baseline.json [--tolerance 0.2]
+    python -m benchmarks.suite record benchmarks/sessions/new.json [--port 8050]
+
+``record`` serves the app and writes the Dash requests of whatever is done
+in the browser to a new session script. Every pass of a user through a script
+is a new browser session, with its own session id, so its labels are all
+stored.
+"""
+
+import argparse
+import datetime
+import glob
+import http.client
+import io
+import itertools
+import json
+import os
+import pathlib
+import platform
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.common import callback_body, dependencies as app_dependencies
+from benchmarks.workers import free_port, memory_kb
+
+SESSIONS = pathlib.Path(__file__).parent.joinpath('sessions')
+ACCEPT_ENCODING = 'gzip, deflate, br'
+UPDATE_PATH = '/_dash-update-component'
+# (statistic, worse when it goes) compared against the baseline
+CHECKS = (
+    ('p50_ms', 'up'),
+    ('p95_ms', 'up'),
+    ('p99_ms', 'up'),
+    ('throughput', 'down'),
+    ('response_bytes', 'up')
+)
+MIN_COMPARED_MS = 1.0 # latencies below this are too noisy to flag
+
+
+def load_sessions(paths):
+    return {pathlib.Path(path).stem : json.load(open(path))['requests'] for path in paths}
+
+
+def personalize(body, session_id):
+    """A recorded callback request as sent from the given browser session."""
+    def value(item):
+        if item.get('id') == 'session_id':
+            return dict(item, value = session_id)
+        return item
+    return dict(
+        body,
+        inputs = [value(item) if isinstance(item, dict) else item for item in body['inputs']],
+        state = [value(item) for item in body.get('state', [])]
+    )
+
+
+def conform(requests, dependencies):
+    """The requests of a session script with callback bodies rebuilt for the app's current dependencies."""
+    values = {}
+    conformed = []
+    for request in requests:
+        body = request.get('json')
+        if request['path'] == UPDATE_PATH and body:
+            for item in body['inputs'] + body.get('state', []):
+                if isinstance(item, dict):
+                    values['{id}.{property}'.format(**item)] = item.get('value')
+            outputs = body['outputs'] if isinstance(body['outputs'], list) else [body['outputs']]
+            body = callback_body(
+                dependencies, '{id}.{property}'.format(**outputs[0]), values, body.get('changedPropIds', ())
+            )
+            request = dict(request, json = body)
+        conformed.append(request)
+    return conformed
+
+
+def request_name(request, names):
+    if request['path'] != UPDATE_PATH:
+        return '{} {}'.format(request['method'], request['path'])
+    output = request['json']['output']
+    return names.get(output, output)
+
+
+class TestClientTransport:
+    """Sends requests through the Flask test client of the imported app."""
+
+    def __init__(self, server):
+        self.client = server.test_client()
+
+    def send(self, method, path, body):
+        response = self.client.open(
+            path,
+            method = method,
+            data = body,
+            content_type = 'application/json' if body else None,
+            headers = {'Accept-Encoding' : ACCEPT_ENCODING}
+        )
+        return response.status_code, len(response.data)
+
+
+class HTTPTransport:
+    """Sends requests over one HTTP connection, reconnecting when the server closes it."""
+
+    def __init__(self, port):
+        self.connection = http.client.HTTPConnection('127.0.0.1', port, timeout = 60)
+
+    def send(self, method, path, body):
+        headers = {'Accept-Encoding' : ACCEPT_ENCODING}
+        if body:
+            headers['Content-Type'] = 'application/json'
+        self.connection.request(method, path, body = body, headers = headers)
+        response = self.connection.getresponse()
+        return response.status, len(response.read())
+
+
+def user(transport, sessions, user_id, deadline, samples):
+    """
+    Replay the session scripts in turn, at least once and then until the
+    deadline, appending (name, seconds, sent, received, status).
+    """
+    passes = itertools.count()
+    while True:
+        for requests in sessions:
+            session_id = '{:016x}{:016x}'.format(user_id, next(passes))
+            for method, path, body, name in requests:
+                if body is not None:
+                    body = json.dumps(personalize(body, session_id)).encode('utf-8')
+                start = time.perf_counter()
+                status, received = transport.send(method, path, body)
+                samples.append((name, time.perf_counter() - start, len(body or b''), received, status))
+        if time.monotonic() >= deadline:
+            return
+
+
+def percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(samples, seconds):
+    by_name = {}
+    for sample in samples:
+        by_name.setdefault(sample[0], []).append(sample)
+    by_name['total'] = samples
+    endpoints = {}
+    for name, calls in by_name.items():
+        latencies = sorted(call[1] for call in calls)
+        endpoints[name] = {
+            'requests' : len(calls),
+            'throughput' : len(calls) / seconds,
+            'p50_ms' : 1000 * percentile(latencies, 0.5),
+            'p95_ms' : 1000 * percentile(latencies, 0.95),
+            'p99_ms' : 1000 * percentile(latencies, 0.99),
+            'request_bytes' : statistics.mean(call[2] for call in calls),
+            'response_bytes' : statistics.mean(call[3] for call in calls),
+            'errors' : sum(not 200 <= call[4] < 400 for call in calls)
+        }
+    return endpoints
+
+
+def load(transports, sessions, names, dependencies, seconds):
+    """Run one user per transport for the given seconds, returning the per-endpoint summary."""
+    scripts = [
+        [
+            (request['method'], request['path'], request.get('json'), request_name(request, names))
+            for request in conform(requests, dependencies)
+        ]
+        for requests in sessions.values()
+    ]
+    # one pass to warm caches and connections
+    for transport in transports:
+        user(transport, scripts, 0, 0, [])
+    samples = []
+    deadline = time.monotonic() + seconds
+    threads = [
+        threading.Thread(target = user, args = (transport, scripts, user_id, deadline, samples))
+        for user_id, transport in enumerate(transports, 1)
+    ]
+    start = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(samples, time.monotonic() - start)
+
+
+def memory(pids):
+    return [
+        {'pid' : pid, 'rss_mb' : rss / 1024, 'pss_mb' : pss / 1024}
+        for pid in pids
+        for rss, pss in [memory_kb(pid)]
+    ]
+
+
+def run_inprocess(sessions, users, seconds):
+    import app
+    import instrumentation
+    names = instrumentation.callback_names(app.app)
+    dependencies = app_dependencies(app.server.test_client())
+    endpoints = load([TestClientTransport(app.server) for _ in range(users)], sessions, names, dependencies, seconds)
+    return endpoints, {'process' : memory([os.getpid()])}, names
+
+
+def worker_pids(pid):
+    with open('/proc/{0}/task/{0}/children'.format(pid)) as f:
+        return [int(child) for child in f.read().split()]
+
+
+def run_gunicorn(sessions, users, seconds, workers, worker_class):
+    import app
+    import instrumentation
+    names = instrumentation.callback_names(app.app)
+    port = free_port()
+    process = subprocess.Popen(
+        [
+            sys.executable, '-m', 'gunicorn',
+            '--workers', str(workers),
+            '--worker-class', worker_class,
+            '--bind', '127.0.0.1:{}'.format(port),
+            'app:server'
+        ],
+        env = os.environ,
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL
+    )
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                HTTPTransport(port).send('GET', '/_dash-dependencies', None)
+                break
+            except OSError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.2)
+        # let every worker import the app before loading it
+        while len(worker_pids(process.pid)) < workers:
+            time.sleep(0.2)
+        dependencies = app_dependencies(app.server.test_client())
+        endpoints = load([HTTPTransport(port) for _ in range(users)], sessions, names, dependencies, seconds)
+        usage = {'master' : memory([process.pid]), 'workers' : memory(worker_pids(process.pid))}
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+    return endpoints, usage, names
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output = True, text = True).stdout.strip()
+    except OSError:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Regressions of results against baseline, as messages."""
+    regressions = []
+    for name, stats in results['endpoints'].items():
+        base = baseline['endpoints'].get(name)
+        if base is None:
+            continue
+        for key, worse in CHECKS:
+            if key.endswith('_ms') and max(stats[key], base[key]) < MIN_COMPARED_MS:
+                continue
+            change = (stats[key] - base[key]) / base[key] if base[key] else 0
+            if (worse == 'up' and change > tolerance) or (worse == 'down' and change < -tolerance):
+                regressions.append('{}: {} {:.2f} -> {:.2f} ({:+.0%})'.format(name, key, base[key], stats[key], change))
+    return regressions
+
+
+def print_results(results):
+    print('{:<38} {:>8} {:>8} {:>8} {:>8} {:>8} {:>9} {:>9} {:>6}'.format(
+        'endpoint', 'requests', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms', 'sent B', 'recv B', 'errors'
+    ))
+    for name, stats in sorted(results['endpoints'].items(), key = lambda item: item[0] == 'total'):
+        print('{:<38} {:>8} {:>8.1f} {:>8.2f} {:>8.2f} {:>8.2f} {:>9.0f} {:>9.0f} {:>6}'.format(
+            name[:38], stats['requests'], stats['throughput'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+            stats['request_bytes'], stats['response_bytes'], stats['errors']
+        ))
+    for role, processes in results['memory'].items():
+        for process in processes:
+            print('{:<8} pid {:<8} RSS {:>7.1f} MB  PSS {:>7.1f} MB'.format(role, process['pid'], process['rss_mb'], process['pss_mb']))
+
+
+def unexercised(names, results):
+    """Server callbacks no session script calls."""
+    return sorted(set(names.values()) - set(results['endpoints']))
+
+
+def record(path, port):
+    """Serve the app, appending the Dash requests made from a browser to a session script."""
+    import app
+    recorded = []
+    wsgi_app = app.server.wsgi_app
+
+    def recording_app(environ, start_response):
+        path_info = environ.get('PATH_INFO', '')
+        if path_info == '/' or (path_info.startswith('/_dash-') and not path_info.startswith('/_dash-component-suites')):
+            request = {'method' : environ['REQUEST_METHOD'], 'path' : path_info}
+            if environ['REQUEST_METHOD'] == 'POST':
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+                body = environ['wsgi.input'].read(length)
+                environ['wsgi.input'] = io.BytesIO(body)
+                request['json'] = json.loads(body)
+            recorded.append(request)
+        return wsgi_app(environ, start_response)
+
+    app.server.wsgi_app = recording_app
+    print('recording at http://127.0.0.1:{}/ until Ctrl-C'.format(port))
+    try:
+        app.server.run(port = port, threaded = True)
+    finally:
+        with open(path, 'w') as f:
+            json.dump({'description' : 'Recorded {}'.format(datetime.date.today()), 'requests' : recorded}, f, indent = 1)
+        print('{} requests written to {}'.format(len(recorded), path))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest = 'command', required = True)
+    run = commands.add_parser('run')
+    run.add_argument('--mode', choices = ('inprocess', 'gunicorn'), default = 'inprocess')
+    run.add_argument('--workers', type = int, default = 4, help = 'gunicorn workers')
+    run.add_argument('--worker-class', default = 'sync', help = 'gunicorn worker class')
+    run.add_argument('--users', type = int, default = 8, help = 'concurrent virtual users')
+    run.add_argument('--seconds', type = float, default = 10)
+    run.add_argument('--sessions', nargs = '+', default = sorted(glob.glob(str(SESSIONS.joinpath('*.json')))))
+    run.add_argument('--output', help = 'write the results to this JSON file')
+    run.add_argument('--baseline', help = 'flag regressions against this results file')
+    run.add_argument('--tolerance', type = float, default = 0.2, help = 'relative change flagged as a regression')
+    check = commands.add_parser('compare')
+    check.add_argument('results')
+    check.add_argument('baseline')
+    check.add_argument('--tolerance', type = float, default = 0.2)
+    recorder = commands.add_parser('record')
+    recorder.add_argument('output')
+    recorder.add_argument('--port', type = int, default = 8050)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        record(args.output, args.port)
+        sys.exit()
+
+    if args.command == 'compare':
+        results = json.load(open(args.results))
+        baseline = json.load(open(args.baseline))
+    else:
+        sessions = load_sessions(args.sessions)
+        with tempfile.TemporaryDirectory() as directory:
+            # labels and sessions of the users go to scratch databases, in the workers as well
+            os.environ['LABELS_DATABASE'] = os.path.join(directory, 'labels.sqlite3')
+            os.environ['SESSION_STORE'] = os.path.join(directory, 'sessions.sqlite3')
+            if args.mode == 'inprocess':
+                endpoints, usage, names = run_inprocess(sessions, args.users, args.seconds)
+            else:
+                endpoints, usage, names = run_gunicorn(sessions, args.users, args.seconds, args.workers, args.worker_class)
+        results = {
+            'meta' : {
+                'mode' : args.mode,
+                'workers' : args.workers if args.mode == 'gunicorn' else None,
+                'worker_class' : args.worker_class if args.mode == 'gunicorn' else None,
+                'users' : args.users,
+                'seconds' : args.seconds,
+                'sessions' : sorted(sessions),
+                'commit' : git_commit(),
+                'python' : platform.python_version(),
+                'at' : datetime.datetime.now(datetime.timezone.utc).isoformat()
+            },
+            'endpoints' : endpoints,
+            'memory' : usage
+        }
+        print_results(results)
+        missing = unexercised(names, results)
+        if missing:
+            print('callbacks no session calls: {}'.format(', '.join(missing)))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(results, f, indent = 1)
+        if not args.baseline:
+            sys.exit()
+        baseline = json.load(open(args.baseline))
+
+    if any(baseline['meta'].get(key) != results['meta'].get(key) for key in ('mode', 'workers', 'worker_class', 'users')):
+        print('warning: baseline ran with {}'.format(baseline['meta']))
+    regressions = compare(results, baseline, args.tolerance)
+    for message in regressions:
+        print('REGRESSION {}'.format(message))
+    print('{} regressions against the baseline (tolerance {:.0%})'.format(len(regressions), args.tolerance))
+    sys.exit(1 if regressions else 0)
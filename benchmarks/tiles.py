@@ -0,0 +1,133 @@
+"""
+Base map tiles of one map open, from the public server versus the local store.
+
+A fake upstream tile server answers every tile after a fixed latency,
+standing in for the public OpenStreetMap servers. A map open requests the
+tiles covering MAP_BOUNDS at MAP_ZOOM, PARALLEL at a time as a browser does:
+
+    upstream  straight from the fake upstream, as the bare TileLayer did
+    cold      through /map/tiles with an empty store, filled from the upstream
+    warm      through /map/tiles again, now from the store
+    offline   through /map/tiles with no upstream at all
+
+Then the study area is seeded into a store bounded well below its size, to
+show seeding speed and that eviction keeps the store within its bound.
+
+    python -m benchmarks.tiles [--latency 0.1] [--zooms 8-12] [--max-bytes 10000000]
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+from PIL import Image
+
+import app
+import tiles
+
+PARALLEL = 6 # connections a browser opens per host
+
+
+class TileHandler(BaseHTTPRequestHandler):
+    """Answers every path with one of the server's PNG tiles after its latency."""
+
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        bodies = self.server.bodies
+        body = bodies[hashlib.sha1(self.path.encode('utf-8')).digest()[0] % len(bodies)]
+        with self.server.lock:
+            self.server.requests += 1
+        self.send_response(200)
+        self.send_header('Content-Type', tiles.MIMETYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeUpstream(ThreadingHTTPServer):
+    def __init__(self, latency):
+        super().__init__(('127.0.0.1', 0), TileHandler)
+        self.latency = latency
+        self.requests = 0
+        rng = np.random.default_rng(0)
+        self.bodies = []
+        for _ in range(16):
+            # flat areas with some detail, about the size of a map tile
+            pixels = rng.integers(200, 256, (128, 128, 3), dtype = np.uint8)
+            buffer = io.BytesIO()
+            Image.fromarray(pixels).resize((256, 256), Image.NEAREST).quantize(64).save(buffer, 'PNG')
+            self.bodies.append(buffer.getvalue())
+        self.lock = threading.Lock()
+        threading.Thread(target = self.serve_forever, daemon = True).start()
+        self.url = 'http://127.0.0.1:{}/{{z}}/{{x}}/{{y}}.png'.format(self.server_port)
+
+
+def map_tiles():
+    xs, ys = tiles.tile_range(app.MAP_BOUNDS, app.MAP_ZOOM)
+    return [(app.MAP_ZOOM, x, y) for x in xs for y in ys]
+
+
+def open_map(fetch):
+    """Seconds to load every tile of the initial map view, PARALLEL at a time."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = PARALLEL) as pool:
+        sizes = list(pool.map(fetch, map_tiles()))
+    if not all(sizes):
+        raise RuntimeError('missing tiles')
+    return time.perf_counter() - start
+
+
+def through_app(tile):
+    response = app.server.test_client().get('/map/tiles/{}/{}/{}.png'.format(*tile))
+    return len(response.data) if response.status_code == 200 else 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--latency', type = float, default = 0.1, help = 'seconds the fake upstream takes per tile')
+    parser.add_argument('--zooms', type = tiles.zoom_levels, default = tiles.zoom_levels('8-12'), help = 'zoom levels to seed')
+    parser.add_argument('--max-bytes', type = int, default = 10000000, help = 'bound of the seeded store')
+    args = parser.parse_args()
+
+    upstream = FakeUpstream(args.latency)
+    print('map open: {} tiles at zoom {}'.format(len(map_tiles()), app.MAP_ZOOM))
+    print('{:<9} {:>9} {:>18}'.format('source', 'ms', 'upstream requests'))
+    def direct(tile):
+        with urllib.request.urlopen(upstream.url.format(z = tile[0], x = tile[1], y = tile[2])) as response:
+            return len(response.read())
+    with tempfile.TemporaryDirectory() as directory:
+        path = '{}/tiles.mbtiles'.format(directory)
+        for source in ('upstream', 'cold', 'warm', 'offline'):
+            before = upstream.requests
+            if source != 'upstream':
+                app.tile_store = tiles.TileStore(
+                    path, upstream = None if source == 'offline' else upstream.url, fill_bounds = app.MAP_BOUNDS
+                )
+            seconds = open_map(direct if source == 'upstream' else through_app)
+            print('{:<9} {:>9.1f} {:>18}'.format(source, 1000 * seconds, upstream.requests - before))
+
+        upstream.latency = 0
+        store = tiles.TileStore('{}/seeded.mbtiles'.format(directory), args.max_bytes, upstream.url)
+        start = time.perf_counter()
+        failures, count = store.seed(app.MAP_BOUNDS, args.zooms)
+        seconds = time.perf_counter() - start
+        conn = store.connections.get()
+        stored, stored_bytes = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM tile_usage').fetchone()
+        print('seeded {} tiles at zooms {}-{} in {:.1f} s ({:.0f} tiles/s), {} failed'.format(
+            count, args.zooms[0], args.zooms[-1], seconds, count / seconds, len(failures)
+        ))
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        print('store bounded to {} bytes holds {} tiles: {} bytes of tile data, a {} byte file'.format(
+            args.max_bytes, stored, stored_bytes, os.path.getsize(store.path)
+        ))
@@ -0,0 +1,158 @@
+"""
+Start-up and throughput of the app under different gunicorn set-ups.
+
+Each set-up starts gunicorn with the same number of workers:
+
+    bare            gunicorn's defaults, as the former ``gunicorn app:server``:
+                    sync workers, each importing the app itself, no warm-up
+    sync            gunicorn.conf.py with sync workers: preloaded and warmed
+    gthread         gunicorn.conf.py as shipped: preloaded, warmed, threads
+    gevent          gunicorn.conf.py with gevent workers, if gevent is installed
+
+and reports the seconds from launch until the first response, the latency of
+the first visits (every user's first pass through the browse session, made
+as soon as the server answers), then throughput and p95 latency of the
+session scripts replayed as in benchmarks/suite.py, alone and while other
+users open uncached base map tiles from an upstream that takes --latency
+seconds per tile, as a slow image or tile lookup would.
+
+    python -m benchmarks.worker_classes [--workers 2] [--users 8] [--slow-users 2] [--seconds 10] [--latency 0.5]
+"""
+
+import argparse
+import importlib.util
+import itertools
+import json
+import os
+import pathlib
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+from benchmarks.suite import SESSIONS, HTTPTransport, load, load_sessions, percentile
+from benchmarks.workers import free_port
+
+ROOT = pathlib.Path(__file__).parent.parent
+SETUPS = {
+    'bare' : ('--config', os.devnull),
+    'sync' : ('--worker-class', 'sync', '--threads', '1'),
+    'gthread' : (),
+    'gevent' : ('--worker-class', 'gevent')
+}
+TILE_ZOOM = 18 # tiles of the slow users are always new at this zoom
+
+
+def start(setup, workers, env):
+    port = free_port()
+    started = time.monotonic()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--bind', '127.0.0.1:{}'.format(port)]
+        + list(SETUPS[setup]) + ['app:server'],
+        cwd = ROOT,
+        env = env,
+        stdout = subprocess.DEVNULL,
+        stderr = subprocess.DEVNULL
+    )
+    while True:
+        try:
+            status, size = HTTPTransport(port).send('GET', '/_dash-layout', None)
+            if status == 200:
+                return process, port, time.monotonic() - started
+        except OSError:
+            pass
+        if process.poll() is not None or time.monotonic() - started > 120:
+            process.kill()
+            raise RuntimeError('gunicorn did not start')
+        time.sleep(0.01)
+
+
+def first_visits(port, browse, users):
+    """Latencies of every user's first pass through the browse script, all at once."""
+    latencies = []
+    def visit():
+        transport = HTTPTransport(port)
+        for request in browse:
+            body = json.dumps(request['json']).encode('utf-8') if 'json' in request else None
+            start = time.perf_counter()
+            transport.send(request['method'], request['path'], body)
+            latencies.append(time.perf_counter() - start)
+    threads = [threading.Thread(target = visit) for _ in range(users)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sorted(latencies)
+
+
+def open_tiles(port, tiles, stop):
+    """Request new base map tiles until stopped."""
+    transport = HTTPTransport(port)
+    while not stop.is_set():
+        transport.send('GET', '/map/tiles/{}/{}/{}.png'.format(TILE_ZOOM, *next(tiles)), None)
+
+
+def measure(setup, args, sessions, env, tiles):
+    process, port, ready = start(setup, args.workers, env)
+    try:
+        cold = first_visits(port, sessions['browse'], args.users)
+        result = {'ready' : ready, 'first_p50' : percentile(cold, 0.5), 'first_max' : cold[-1]}
+        for name, slow_users in (('alone', 0), ('slow', args.slow_users)):
+            stop = threading.Event()
+            slow = [threading.Thread(target = open_tiles, args = (port, tiles, stop)) for _ in range(slow_users)]
+            for thread in slow:
+                thread.start()
+            total = load([HTTPTransport(port) for _ in range(args.users)], sessions, {}, args.seconds)['total']
+            stop.set()
+            for thread in slow:
+                thread.join()
+            result[name] = total
+    finally:
+        process.send_signal(signal.SIGTERM)
+        process.wait()
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type = int, default = 2)
+    parser.add_argument('--users', type = int, default = 8, help = 'concurrent users replaying sessions')
+    parser.add_argument('--slow-users', type = int, default = 2, help = 'concurrent users opening uncached tiles')
+    parser.add_argument('--seconds', type = float, default = 10)
+    parser.add_argument('--latency', type = float, default = 0.5, help = 'seconds the upstream takes per tile')
+    parser.add_argument('--setups', nargs = '+', choices = SETUPS, default = list(SETUPS))
+    args = parser.parse_args()
+
+    sessions = load_sessions(sorted(SESSIONS.glob('*.json')))
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            LABELS_DATABASE = os.path.join(directory, 'labels.sqlite3'),
+            CACHE_PATH = directory,
+            GUNICORN_THREADS = os.environ.get('GUNICORN_THREADS', '4')
+        )
+        # build the catalogue once, so no set-up pays for it
+        subprocess.run([sys.executable, '-c', 'import app'], cwd = ROOT, env = env, check = True)
+        # the fake upstream loads app itself, so it comes after the environment
+        os.environ.update(env)
+        from benchmarks.tiles import FakeUpstream
+        upstream = FakeUpstream(args.latency)
+        env['MAP_BASE_TILE_UPSTREAM'] = upstream.url
+        tiles = iter((x, y) for x, y in itertools.product(range(1 << TILE_ZOOM), repeat = 2))
+
+        print('{} workers, {} users, {} slow users at {} s per tile'.format(args.workers, args.users, args.slow_users, args.latency))
+        print('{:<8} {:>8} {:>11} {:>11} {:>9} {:>9} {:>10} {:>10}'.format(
+            'setup', 'ready s', 'first p50', 'first max', 'req/s', 'p95 ms', 'slow req/s', 'slow p95'
+        ))
+        for setup in args.setups:
+            if setup == 'gevent' and importlib.util.find_spec('gevent') is None:
+                print('{:<8} gevent is not installed'.format(setup))
+                continue
+            result = measure(setup, args, sessions, env, tiles)
+            print('{:<8} {:>8.2f} {:>11.1f} {:>11.1f} {:>9.0f} {:>9.1f} {:>10.0f} {:>10.1f}'.format(
+                setup, result['ready'], 1000 * result['first_p50'], 1000 * result['first_max'],
+                result['alone']['throughput'], result['alone']['p95_ms'],
+                result['slow']['throughput'], result['slow']['p95_ms']
+            ))
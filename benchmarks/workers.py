@@ -0,0 +1,133 @@
+"""
+Memory of 1, 4 and 16 gunicorn workers holding the catalogue.
+
+Starts gunicorn on a synthetic catalogue for each mode and worker count, waits
+until every worker has loaded it and read every value once, and sums the
+memory of the master and workers from /proc/<pid>/smaps_rollup:
+
+    frame   each worker reads the CSV into a DataFrame with pandas (the former
+            loader) and builds a search index
+    shared  registry.Collection: values read from the shared memory-mapped
+            table, plus the per-worker search index
+    table   the shared memory-mapped table alone
+
+RSS counts shared pages once per process; PSS divides them among the
+processes mapping them, so total PSS is the real footprint.
+
+    python -m benchmarks.workers [--rows 20000] [--workers 1 4 16]
+"""
+
+import argparse
+import os
+import pathlib
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmarks.startup import synthetic_csv
+
+MODES = ('frame', 'shared', 'table')
+
+
+def create_server():
+    """gunicorn app factory: load the catalogue as BENCH_MODE says, then report ready."""
+    import flask
+    import catalogue
+    import registry
+    import search
+    mode = os.environ['BENCH_MODE']
+    csv_path = pathlib.Path(os.environ['BENCH_CSV'])
+    cache_dir = pathlib.Path(os.environ['BENCH_CACHE'])
+    if mode == 'frame':
+        import pandas as pd
+        images = pd.read_csv(csv_path, dtype = str, keep_default_na = False).set_index('Entry_ID', drop = False)
+        index = search.SearchIndex()
+        index.sync(zip(images['Entry_ID'], images[list(search.SEARCH_FIELDS)].to_dict('records')))
+        loaded = (images, index)
+    elif mode == 'shared':
+        loaded = registry.Collection(catalogue.collection_name(csv_path), csv_path, cache_dir, 10)
+        table = loaded.table
+    else:
+        loaded = table = catalogue.SharedCatalogue(csv_path, cache_dir).table
+    if mode != 'frame':
+        # fault in every page, as serving the whole catalogue eventually would
+        for column in table.columns:
+            table.column(column)
+    pathlib.Path(os.environ['BENCH_READY']).joinpath(str(os.getpid())).touch()
+    server = flask.Flask(__name__)
+    server.route('/')(lambda: type(loaded).__name__)
+    return server
+
+
+def memory_kb(pid):
+    """(RSS, PSS) of a process in kB."""
+    values = {}
+    with open('/proc/{}/smaps_rollup'.format(pid)) as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ('Rss:', 'Pss:'):
+                values[parts[0]] = int(parts[1])
+    return values['Rss:'], values['Pss:']
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def measure(mode, workers, csv_path, cache_dir, timeout = 600):
+    with tempfile.TemporaryDirectory() as ready:
+        env = dict(os.environ, BENCH_MODE = mode, BENCH_CSV = str(csv_path), BENCH_CACHE = str(cache_dir), BENCH_READY = ready)
+        process = subprocess.Popen(
+            [
+                sys.executable, '-m', 'gunicorn',
+                # not the app's gunicorn.conf.py: each worker must call the factory
+                '--config', os.devnull,
+                '--workers', str(workers),
+                '--bind', '127.0.0.1:{}'.format(free_port()),
+                '--timeout', str(timeout),
+                'benchmarks.workers:create_server()'
+            ],
+            env = env,
+            stdout = subprocess.DEVNULL,
+            stderr = subprocess.DEVNULL
+        )
+        try:
+            deadline = time.monotonic() + timeout
+            while len(os.listdir(ready)) < workers:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start {} workers'.format(workers))
+                time.sleep(0.2)
+            time.sleep(1)
+            pids = [process.pid] + [int(pid) for pid in os.listdir(ready)]
+            rss, pss = map(sum, zip(*map(memory_kb, pids)))
+        finally:
+            process.send_signal(signal.SIGTERM)
+            process.wait()
+    return rss / 1024, pss / 1024
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', type = int, default = 20000)
+    parser.add_argument('--workers', type = int, nargs = '+', default = [1, 4, 16])
+    parser.add_argument('--modes', nargs = '+', choices = MODES, default = list(MODES))
+    args = parser.parse_args()
+
+    print('{:>7} {:>8} {:>10} {:>10} {:>14}'.format('mode', 'workers', 'RSS MB', 'PSS MB', 'PSS/worker MB'))
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = synthetic_csv(args.rows, directory)
+        cache_dir = pathlib.Path(directory).joinpath('cache')
+        for mode in args.modes:
+            for workers in args.workers:
+                try:
+                    rss, pss = measure(mode, workers, csv_path, cache_dir)
+                except RuntimeError as error:
+                    # e.g. the workers ran out of memory
+                    print('{:>7} {:>8} {}'.format(mode, workers, error))
+                    continue
+                print('{:>7} {:>8} {:>10.1f} {:>10.1f} {:>14.1f}'.format(mode, workers, rss, pss, pss / workers))
@@ -0,0 +1,404 @@
+"""
+Load the image catalogue from a metadata CSV.
+
+The display columns derived from the metadata are built with vectorized string
+operations and the resulting table is stored in a compact columnar file named
+after a hash of the source CSV. Workers memory-map that file read-only and
+look values up in place, so every gunicorn worker shares the same page cache
+copy of the catalogue instead of holding its own DataFrame.
+
+``<stem>.current`` is a symlink to the published table. Publishing a new
+version of the CSV writes a new table and swaps the link atomically;
+``SharedCatalogue`` notices the swap and remaps, and the old mapping stays
+valid until the last reference to it is dropped. With ``watch`` it also
+notices when the CSV itself changes, and publishes it in a child process.
+
+A CSV is only published if it looks complete: it ends with a line break, has
+the columns in REQUIRED_COLUMNS and an Entry_ID in every row, and keeps at
+least MIN_KEPT_ROWS of the rows of the table it replaces, unless publishing
+is forced. This catches a CSV read while still being written; writers that
+replace the file with a rename (save to a temporary file, then ``mv``) never
+expose one.
+
+A table published over a previous one records in its header the Entry_IDs
+added, changed and removed since that table, so workers update their search
+index and pages for those rows only. Rows reordered or inserted before
+existing ones leave no diff, and workers re-sync in full.
+
+File layout (native byte order):
+
+    MAGIC | header length (uint64) | JSON header, padded to 8 bytes
+    int64 offsets[columns][rows + 1] into the string blob
+    int64 rows sorted by the key column, for lookups by Entry_ID
+    UTF-8 string blob
+"""
+
+import argparse
+import array
+import contextlib
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pathlib
+import re
+import subprocess
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'CATALOG2'
+FORMAT_VERSION = 3 # bump when the file layout or derived columns change
+METADATA_SUFFIX = '-metadata'
+KEY_COLUMN = 'Entry_ID'
+CHECK_INTERVAL = 1.0 # seconds between checks for a newly published table
+
+# columns added to the metadata for display
+DERIVED_COLUMNS = ('Details', 'image_url_thumbnail', 'Photo')
+# metadata columns the app reads from every catalogue
+REQUIRED_COLUMNS = (KEY_COLUMN, 'Title', 'Description', 'Image_url', 'Collection', 'Type', 'Organization')
+MIN_KEPT_ROWS = 0.5 # a new version with fewer rows than this share of the published one needs force
+
+
+def source_digest(csv_path):
+    """Short content hash of the metadata file, used to key the cache."""
+    digest = hashlib.sha256()
+    with open(csv_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:16]
+
+
+def collection_name(csv_path):
+    """'<name>-metadata.csv' holds the collection '<name>'."""
+    stem = pathlib.Path(csv_path).stem
+    return stem[:-len(METADATA_SUFFIX)] if stem.endswith(METADATA_SUFFIX) else stem
+
+
+def build_frame(csv_path):
+    """Read the metadata CSV and add the derived display columns."""
+    # only needed to build a table, not by workers mapping a published one
+    import pandas as pd
+    df = pd.read_csv(csv_path, dtype = str, keep_default_na = False)
+    missing = [column for column in REQUIRED_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError('{} lacks the columns {}'.format(csv_path, ', '.join(missing)))
+    # Entry_ID keys gallery cards and lookups, so it has to be unique
+    df = df.drop_duplicates('Entry_ID').reset_index(drop = True)
+    df['Details'] = df['Title'] + '\n  ' + df['Description'] + '\n  ' + df['Entry_ID']
+    df['image_url_thumbnail'] = '/thumbnails/{}/thumb/'.format(collection_name(csv_path)) + df['Entry_ID'] + '#thumbnail'
+    df['Photo'] = '![](' + df['image_url_thumbnail'] + ')'
+    return df
+
+
+def validate(csv_path, df, previous = None, force = False):
+    """
+    Raise ValueError unless the CSV and its DataFrame df, from build_frame,
+    look complete, with at least MIN_KEPT_ROWS of the rows of the previous
+    table unless forced.
+    """
+    with open(csv_path, 'rb') as f:
+        f.seek(0, os.SEEK_END)
+        if f.tell() == 0:
+            raise ValueError('{} is empty'.format(csv_path))
+        f.seek(-1, os.SEEK_END)
+        # a file cut short ends mid-row
+        if f.read(1) != b'\n':
+            raise ValueError('{} does not end with a line break; is it still being written?'.format(csv_path))
+    if len(df) == 0 or (df[KEY_COLUMN] == '').any():
+        raise ValueError('{} has no rows, or rows without an {}'.format(csv_path, KEY_COLUMN))
+    if not force and previous is not None and len(df) < MIN_KEPT_ROWS * len(previous):
+        raise ValueError('{} has {} rows, down from {}; publish it with --force if that is intended'.format(
+            csv_path, len(df), len(previous)
+        ))
+
+
+def table_diff(previous, df):
+    """
+    {'base', 'added', 'changed', 'removed'} Entry_IDs going from the table
+    previous to the DataFrame df; None unless the rows in both keep their
+    order and every added row comes after them.
+    """
+    if previous.source is None or list(previous.columns) != list(df.columns):
+        return None
+    old_ids = previous.column(KEY_COLUMN)
+    new_ids = df[KEY_COLUMN].tolist()
+    new_set = set(new_ids)
+    kept = [i for i, entry_id in enumerate(old_ids) if entry_id in new_set]
+    if new_ids[:len(kept)] != [old_ids[i] for i in kept]:
+        return None
+    # the kept rows, old and new, side by side in the same order
+    old_values = list(zip(*(previous.column(column) for column in df.columns)))
+    new_values = df.iloc[:len(kept)].itertuples(index = False, name = None)
+    return {
+        'base' : previous.source,
+        'added' : new_ids[len(kept):],
+        'changed' : [new_ids[position] for position, (i, new) in enumerate(zip(kept, new_values)) if old_values[i] != new],
+        'removed' : [entry_id for entry_id in old_ids if entry_id not in new_set]
+    }
+
+
+def write_table(path, df, diff = None):
+    """Write a DataFrame of strings in the columnar format, atomically, with its diff from the previous table."""
+    path = pathlib.Path(path)
+    header = json.dumps({
+        'columns' : list(df.columns),
+        'rows' : len(df),
+        'key' : KEY_COLUMN,
+        'source' : path.name,
+        'diff' : diff
+    }).encode('utf-8')
+    header += b' ' * (-len(header) % 8)
+    offsets = array.array('q', [0])
+    blob = []
+    for name in df.columns:
+        encoded = [value.encode('utf-8') for value in df[name]]
+        position = offsets[-1]
+        if len(offsets) > 1:
+            offsets.append(position)
+        for value in encoded:
+            position += len(value)
+            offsets.append(position)
+        blob.extend(encoded)
+    order = array.array('q', sorted(range(len(df)), key = df[KEY_COLUMN].tolist().__getitem__))
+    path.parent.mkdir(parents = True, exist_ok = True)
+    tmp = path.with_name('.{}.{}.tmp'.format(path.name, os.getpid()))
+    with open(tmp, 'wb') as f:
+        f.write(MAGIC)
+        f.write(array.array('Q', [len(header)]).tobytes())
+        f.write(header)
+        f.write(offsets.tobytes())
+        f.write(order.tobytes())
+        f.writelines(blob)
+    # atomic, so a worker never maps a half-written file
+    os.replace(tmp, path)
+
+
+class CatalogueTable:
+    """Read-only, memory-mapped view of a catalogue file."""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        with open(self.path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+            stat = os.fstat(f.fileno())
+        # identify the published file this table maps
+        self.inode = stat.st_ino
+        self.version = '{}-{}'.format(stat.st_ino, stat.st_mtime_ns)
+        if self._map[:8] != MAGIC:
+            raise ValueError('{} is not a catalogue file'.format(self.path))
+        header_length = memoryview(self._map)[8:16].cast('Q')[0]
+        header = json.loads(self._map[16:16 + header_length])
+        self.columns = header['columns']
+        self.rows = header['rows']
+        self.key = header['key']
+        # the file name it was published as, and the rows changed since the previous one
+        self.source = header.get('source')
+        self.diff = header.get('diff')
+        self._column_index = {name : i for i, name in enumerate(self.columns)}
+        start = 16 + header_length
+        stop = start + 8 * len(self.columns) * (self.rows + 1)
+        self._offsets = memoryview(self._map)[start:stop].cast('q')
+        self._order = memoryview(self._map)[stop:stop + 8 * self.rows].cast('q')
+        self._blob_start = stop + 8 * self.rows
+
+    def __len__(self):
+        return self.rows
+
+    def __contains__(self, key):
+        return self.row(key) is not None
+
+    def value(self, column, row):
+        base = self._column_index[column] * (self.rows + 1) + row
+        start, stop = self._offsets[base], self._offsets[base + 1]
+        return self._map[self._blob_start + start:self._blob_start + stop].decode('utf-8')
+
+    def row(self, key):
+        """Row number of the given key column value, or None; a binary search of the sorted rows."""
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            if self.value(self.key, self._order[middle]) < key:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.rows and self.value(self.key, self._order[low]) == key:
+            return self._order[low]
+        return None
+
+    def records(self, rows, columns):
+        """The given columns of the given rows, as {column: [values]}."""
+        return {column : [self.value(column, row) for row in rows] for column in columns}
+
+    def column(self, column):
+        base = self._column_index[column] * (self.rows + 1)
+        offsets = self._offsets[base:base + self.rows + 1]
+        data = self._map[self._blob_start + offsets[0]:self._blob_start + offsets[-1]]
+        first = offsets[0]
+        return [
+            data[offsets[i] - first:offsets[i + 1] - first].decode('utf-8')
+            for i in range(self.rows)
+        ]
+
+
+def cache_path(csv_path, cache_dir):
+    csv_path = pathlib.Path(csv_path)
+    return pathlib.Path(cache_dir).joinpath('{}-{}-v{}.cat'.format(csv_path.stem, source_digest(csv_path), FORMAT_VERSION))
+
+
+def current_path(csv_path, cache_dir):
+    return pathlib.Path(cache_dir).joinpath('{}.current'.format(pathlib.Path(csv_path).stem))
+
+
+@contextlib.contextmanager
+def publishing(csv_path, cache_dir):
+    """Hold the lock that lets one process at a time publish the CSV."""
+    path = pathlib.Path(cache_dir).joinpath('{}.lock'.format(pathlib.Path(csv_path).stem))
+    path.parent.mkdir(parents = True, exist_ok = True)
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def publish(csv_path, cache_dir, force = False):
+    """
+    Build the table for the CSV as it is now, if needed, and atomically point
+    the current link at it. Superseded tables are removed; workers still
+    mapping them keep their pages until they remap. Raises ValueError, and
+    leaves the current table published, if the CSV fails validate().
+    """
+    path = cache_path(csv_path, cache_dir)
+    link = current_path(csv_path, cache_dir)
+    with publishing(csv_path, cache_dir):
+        if not path.exists():
+            df = build_frame(csv_path)
+            try:
+                previous = CatalogueTable(link)
+            except (FileNotFoundError, ValueError):
+                previous = None
+            validate(csv_path, df, previous, force)
+            write_table(path, df, table_diff(previous, df) if previous is not None else None)
+        if not (link.is_symlink() and os.readlink(link) == path.name):
+            tmp = link.with_name('.{}.{}.tmp'.format(link.name, os.getpid()))
+            os.symlink(path.name, tmp)
+            os.replace(tmp, link)
+        stale = re.compile(r'{}-[0-9a-f]{{16}}-v\d+\.cat$'.format(re.escape(pathlib.Path(csv_path).stem)))
+        for other in path.parent.iterdir():
+            if other != path and stale.match(other.name):
+                other.unlink(missing_ok = True)
+    return link
+
+
+def load_table(csv_path, cache_dir):
+    """Memory-map the preprocessed catalogue, building it on first use."""
+    path = cache_path(csv_path, cache_dir)
+    if not path.exists():
+        publish(csv_path, cache_dir)
+    return CatalogueTable(path)
+
+
+def published_table(csv_path, cache_dir):
+    """
+    Memory-map the table currently published for the CSV, whatever state the
+    CSV is in now; only a CSV never published is published first.
+    """
+    try:
+        return CatalogueTable(current_path(csv_path, cache_dir))
+    except FileNotFoundError:
+        publish(csv_path, cache_dir)
+        return CatalogueTable(current_path(csv_path, cache_dir))
+
+
+class SharedCatalogue:
+    """
+    The published table of a CSV, shared by every process that maps it.
+    ``table`` remaps when a new version has been published, checking at most
+    every ``check_interval`` seconds. With ``watch``, a change to the CSV that
+    has held for one check is published by a child process meanwhile.
+    """
+
+    def __init__(self, csv_path, cache_dir, check_interval = CHECK_INTERVAL, watch = False):
+        self.csv_path = pathlib.Path(csv_path)
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.watch = watch
+        self._source_stat = self._stat_source()
+        self._changed_stat = None
+        self._publisher = None
+        try:
+            self.link = publish(csv_path, cache_dir)
+        except ValueError:
+            # serve the last good version, if there is one
+            self.link = current_path(csv_path, cache_dir)
+            if not self.link.exists():
+                raise
+            logger.exception('Serving the published %s', self.link)
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._table = CatalogueTable(self.link)
+        self._checked = time.monotonic()
+
+    def _stat_source(self):
+        try:
+            stat = os.stat(self.csv_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def _check_source(self):
+        """Publish the CSV in a child process once a change has held for a check, e.g. a save finishing."""
+        if self._publisher is not None:
+            if self._publisher.poll() is None:
+                return
+            if self._publisher.returncode != 0:
+                logger.warning('Publishing %s failed with exit code %s; still serving the current table', self.csv_path, self._publisher.returncode)
+            self._publisher = None
+        stat = self._stat_source()
+        if stat is None or stat == self._source_stat:
+            self._changed_stat = None
+            return
+        if stat != self._changed_stat:
+            self._changed_stat = stat
+            return
+        self._source_stat = stat
+        # building needs pandas and time; the worker keeps serving the current table
+        self._publisher = subprocess.Popen(
+            [sys.executable, '-m', 'catalogue', str(self.csv_path.resolve()), '--cache-dir', str(self.cache_dir.resolve())],
+            cwd = pathlib.Path(__file__).parent,
+            stdout = subprocess.DEVNULL
+        )
+
+    @property
+    def table(self):
+        if time.monotonic() - self._checked >= self.check_interval:
+            with self._lock:
+                self._checked = time.monotonic()
+                if self.watch:
+                    self._check_source()
+                try:
+                    inode = os.stat(self.link).st_ino
+                except FileNotFoundError:
+                    inode = self._table.inode
+                if inode != self._table.inode:
+                    self._table = CatalogueTable(self.link)
+        return self._table
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Publish catalogue tables for the running workers to pick up.')
+    parser.add_argument('csv', nargs = '+', type = pathlib.Path)
+    parser.add_argument('--cache-dir', type = pathlib.Path, default = pathlib.Path(__file__).parent.joinpath('cache', 'catalogue'))
+    parser.add_argument('--force', action = 'store_true', help = 'publish even if most rows were removed')
+    args = parser.parse_args()
+    for csv_path in args.csv:
+        try:
+            print(os.path.realpath(publish(csv_path, args.cache_dir, args.force)))
+        except ValueError as error:
+            print(error, file = sys.stderr)
+            sys.exit(1)
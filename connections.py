@@ -0,0 +1,61 @@
+"""
+Database connections shared by the stores.
+
+The request threads of a worker each need their own connection: sqlite3
+connections are not shared between threads, and no connection may be carried
+across a fork, since gunicorn's master warms the app up before forking the
+workers. ThreadConnections opens one per thread on first use, and again in a
+forked child; close() closes those of the calling process, e.g. in the master
+just before it forks.
+
+backend_for picks a store's backend from a path or URL by its scheme.
+"""
+
+import os
+import threading
+
+
+class ThreadConnections:
+    """One connection per thread from connect(), reopened after a fork or close()."""
+
+    def __init__(self, connect):
+        self.connect = connect
+        self._local = threading.local()
+        self._opened = [] # (pid, connection) of every connection handed out
+        self._generation = 0 # counts close() calls
+        self._lock = threading.Lock()
+
+    def get(self):
+        """The calling thread's connection."""
+        local = self._local
+        if getattr(local, 'conn', None) is None or local.pid != os.getpid() or local.generation != self._generation:
+            conn = self.connect()
+            with self._lock:
+                self._opened.append((os.getpid(), conn))
+                local.conn, local.pid, local.generation = conn, os.getpid(), self._generation
+        return local.conn
+
+    def close(self):
+        """Close this process's connections; each thread opens a new one on its next get()."""
+        pid = os.getpid()
+        with self._lock:
+            self._generation += 1
+            closing = [conn for owner, conn in self._opened if owner == pid]
+            # a forked child drops, but does not close, those of its parent
+            self._opened = []
+        for conn in closing:
+            conn.close()
+
+
+def backend_for(target, backends, default, interface = 'connect'):
+    """
+    The backend for a path or URL: backends maps a URL scheme, or a whole
+    name such as 'memory', to the backend class taking it, and anything else
+    is a path for default. A target with the interface attribute is a backend
+    already and is returned as given.
+    """
+    if hasattr(target, interface):
+        return target
+    target = str(target)
+    scheme = target.split('://', 1)[0] if '://' in target else target
+    return backends.get(scheme, default)(target)
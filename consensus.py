@@ -0,0 +1,184 @@
+"""
+Consensus location of each photo from the locations its labels give.
+
+The estimate is robust to stray clicks: points are projected onto a local
+plane in metres, the geometric median is found by Weiszfeld iterations,
+points further from it than OUTLIER_K robust standard deviations (the scaled
+median distance) are rejected, and the consensus is the centroid of the
+remaining points. Its confidence radius is the 95% radius of that centroid.
+
+``estimate`` computes this for many photos at once, vectorized over all their
+points with NumPy, for backfills. ``PhotoConsensus`` keeps one photo's
+estimate up to date as labels arrive: a new point only updates running sums,
+and the median and outlier cut-off are recomputed in full whenever the number
+of points doubles, so each point costs O(1) amortized.
+"""
+
+import collections
+import math
+import threading
+
+import numpy as np
+
+Consensus = collections.namedtuple('Consensus', ['lat', 'lng', 'radius', 'count', 'inliers'])
+
+EARTH_RADIUS = 6371008.8 # metres
+WEISZFELD_ITERATIONS = 20
+OUTLIER_K = 3.0
+MAD_SCALE = 1.4826 # median absolute deviation -> standard deviation, for normal errors
+MIN_CUTOFF = 250.0 # metres; points this close to the median are never outliers
+MIN_REJECTION_POINTS = 3 # fewer points cannot tell an outlier apart
+# 95% radius of a 2D normal centroid, per unit RMS distance of the points over sqrt(n)
+RADIUS_FACTOR = math.sqrt(-math.log(0.05))
+BACKFILL_MIN_ROWS = 64 # extend() recomputes in batch from this many new labels
+
+
+def estimate(groups, lats, lngs):
+    """
+    Robust consensus of the points of every group, as {group: (Consensus,
+    frame, sums)}; the frame (reference lat/lng, median x/y and cut-off) and
+    the inlier sums let PhotoConsensus continue incrementally.
+    """
+    lats = np.asarray(lats, dtype = np.float64)
+    lngs = np.asarray(lngs, dtype = np.float64)
+    keys, codes = np.unique(np.asarray(groups), return_inverse = True)
+    size = len(keys)
+    counts = np.bincount(codes, minlength = size).astype(np.float64)
+
+    # local plane around the mean of each group
+    ref_lat = np.bincount(codes, lats, size) / counts
+    ref_lng = np.bincount(codes, lngs, size) / counts
+    scale_x = EARTH_RADIUS * np.radians(1.0) * np.cos(np.radians(ref_lat))
+    x = (lngs - ref_lng[codes]) * scale_x[codes]
+    y = (lats - ref_lat[codes]) * (EARTH_RADIUS * np.radians(1.0))
+
+    # geometric median
+    mx = np.zeros(size)
+    my = np.zeros(size)
+    for _ in range(WEISZFELD_ITERATIONS):
+        w = 1.0 / np.maximum(np.hypot(x - mx[codes], y - my[codes]), 1e-6)
+        total = np.bincount(codes, w, size)
+        mx = np.bincount(codes, w * x, size) / total
+        my = np.bincount(codes, w * y, size) / total
+
+    # median distance per group, from the points sorted by group then distance
+    distance = np.hypot(x - mx[codes], y - my[codes])
+    order = np.lexsort((distance, codes))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.int64)
+    middle = starts + (counts.astype(np.int64) - 1) // 2
+    median_distance = distance[order][middle]
+    cutoff = np.maximum(OUTLIER_K * MAD_SCALE * median_distance, MIN_CUTOFF)
+    cutoff[counts < MIN_REJECTION_POINTS] = np.inf
+
+    inlier = (distance <= cutoff[codes]).astype(np.float64)
+    n = np.bincount(codes, inlier, size)
+    sx = np.bincount(codes, inlier * x, size)
+    sy = np.bincount(codes, inlier * y, size)
+    sq = np.bincount(codes, inlier * (x * x + y * y), size)
+
+    results = {}
+    for i, key in enumerate(keys.tolist()):
+        sums = RunningSums(n[i], sx[i], sy[i], sq[i])
+        frame = (ref_lat[i], ref_lng[i], mx[i], my[i], cutoff[i])
+        results[key] = (sums.consensus(frame, int(counts[i])), frame, sums)
+    return results
+
+
+class RunningSums:
+    """Count, coordinate sums and sum of squares of the inliers, in a local plane."""
+
+    __slots__ = ('n', 'sx', 'sy', 'sq')
+
+    def __init__(self, n = 0.0, sx = 0.0, sy = 0.0, sq = 0.0):
+        self.n, self.sx, self.sy, self.sq = n, sx, sy, sq
+
+    def add(self, x, y):
+        self.n += 1
+        self.sx += x
+        self.sy += y
+        self.sq += x * x + y * y
+
+    def consensus(self, frame, count):
+        ref_lat, ref_lng = frame[:2]
+        cx, cy = self.sx / self.n, self.sy / self.n
+        lat = ref_lat + cy / (EARTH_RADIUS * math.radians(1.0))
+        lng = ref_lng + cx / (EARTH_RADIUS * math.radians(1.0) * math.cos(math.radians(ref_lat)))
+        radius = None
+        if self.n > 1:
+            rms = math.sqrt(max(self.sq / self.n - cx * cx - cy * cy, 0.0))
+            radius = RADIUS_FACTOR * rms / math.sqrt(self.n)
+        return Consensus(lat, lng, radius, count, int(self.n))
+
+
+class PhotoConsensus:
+    """Incrementally updated consensus of one photo's labels."""
+
+    def __init__(self):
+        self.points = []
+        self.result = None
+        self._frame = None
+        self._sums = None
+        self._rebuild_at = 1
+
+    def add(self, lat, lng):
+        self.points.append((lat, lng))
+        if len(self.points) >= self._rebuild_at:
+            self.rebuild()
+            return
+        ref_lat, ref_lng, mx, my, cutoff = self._frame
+        x = (lng - ref_lng) * EARTH_RADIUS * math.radians(1.0) * math.cos(math.radians(ref_lat))
+        y = (lat - ref_lat) * EARTH_RADIUS * math.radians(1.0)
+        if math.hypot(x - mx, y - my) <= cutoff:
+            self._sums.add(x, y)
+        self.result = self._sums.consensus(self._frame, len(self.points))
+
+    def rebuild(self):
+        """Recompute the median and outliers from every point."""
+        lats, lngs = zip(*self.points)
+        self.set(*estimate([0] * len(lats), lats, lngs)[0])
+
+    def set(self, result, frame, sums):
+        self.result, self._frame, self._sums = result, frame, sums
+        # the next full recompute, once the number of points has doubled
+        self._rebuild_at = 2 * len(self.points)
+
+
+class ConsensusIndex:
+    """Consensus locations by (collection, entry_id) photo, fed from the label store."""
+
+    def __init__(self):
+        self.by_photo = collections.defaultdict(PhotoConsensus)
+        self.last_id = 0
+        self._lock = threading.Lock()
+
+    def add(self, photo, lat, lng):
+        with self._lock:
+            self.by_photo[photo].add(lat, lng)
+
+    def extend(self, rows):
+        """Add (id, label) rows read from the label store, in batch when there are many."""
+        rows = list(rows)
+        if not rows:
+            return
+        if len(rows) < BACKFILL_MIN_ROWS:
+            for label_id, label in rows:
+                self.add((label.collection, label.entry_id), label.lat, label.lng)
+        else:
+            with self._lock:
+                for label_id, label in rows:
+                    self.by_photo[label.collection, label.entry_id].points.append((label.lat, label.lng))
+                # estimate() groups by scalars, so by each photo's position here
+                touched = list({(label.collection, label.entry_id) for label_id, label in rows})
+                groups = [
+                    (i, lat, lng)
+                    for i, photo in enumerate(touched)
+                    for lat, lng in self.by_photo[photo].points
+                ]
+                for i, result in estimate(*zip(*groups)).items():
+                    self.by_photo[touched[i]].set(*result)
+        self.last_id = max(self.last_id, max(label_id for label_id, label in rows))
+
+    def get(self, photo):
+        """The (collection, entry_id) photo's Consensus, or None if it has no labels."""
+        photo = self.by_photo.get(tuple(photo))
+        return photo.result if photo else None
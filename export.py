@@ -0,0 +1,248 @@
+"""
+Streaming export of the stored labels joined with their photos' metadata,
+for the hand-off to the Texas Disaster Information System (TDIS).
+
+Labels are read from the label store in id order, CHUNK_SIZE at a time, each
+joined with the Title, Description and Collection of its photo from the
+memory-mapped catalogue table of its collection, and encoded chunk by chunk,
+so memory use does not depend on how many labels are exported. A photo is
+identified by its collection (the app's name for it, as in the URL) and its
+Entry_ID, which is only unique within the collection. Formats:
+
+    geojsonseq  newline-delimited GeoJSON features (RFC 8142)
+    csv         one row per label, with a header
+    parquet     one row group per chunk; needs pyarrow, see available()
+
+Exports are resumable through the label id: an export covers the labels with
+after_id < id <= until_id, and the next pull starts after that until_id.
+Run this module directly to export to a file, keeping the cursor between
+pulls in a file:
+
+    python -m export labels-update.csv --cursor-file data/export.cursor
+"""
+
+import csv
+import datetime
+import functools
+import importlib
+import io
+import json
+
+# columns of every format, in order
+FIELDS = ('label_id', 'collection', 'Entry_ID', 'Title', 'Description', 'Collection', 'lat', 'lng', 'submitted_at')
+CATALOGUE_FIELDS = ('Title', 'Description', 'Collection')
+CHUNK_SIZE = 10000
+JOIN_CACHE_SIZE = 65536 # photos whose metadata is kept between labels
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    'geojsonseq' : ('application/geo+json-seq', 'geojsons'),
+    'csv' : ('text/csv', 'csv'),
+    'parquet' : ('application/vnd.apache.parquet', 'parquet')
+}
+# format -> module its encoder imports
+REQUIRES = {
+    'parquet' : 'pyarrow.parquet'
+}
+
+
+def utc_timestamp(value):
+    """A stored submission time as an aware UTC datetime; naive times are taken as UTC."""
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime.fromisoformat(value)
+    if value.tzinfo is None:
+        return value.replace(tzinfo = datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc)
+
+
+def iso_utc(value):
+    return value.strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def available(format):
+    """
+    Whether the format can be encoded here. Checked before a response is
+    started: an encoder failing to import midway would truncate the export.
+    """
+    if format not in REQUIRES:
+        return True
+    try:
+        importlib.import_module(REQUIRES[format])
+    except ImportError:
+        return False
+    return True
+
+
+class CatalogueJoin:
+    """Metadata of a photo from the catalogue table of its collection, given tables by collection name."""
+
+    def __init__(self, tables):
+        self.tables = dict(tables)
+        self._missing = ('',) * len(CATALOGUE_FIELDS)
+        # photos have many labels; bounded, so memory stays flat over any export
+        self._lookup = functools.lru_cache(maxsize = JOIN_CACHE_SIZE)(self._lookup_uncached)
+
+    def __call__(self, collection, entry_id):
+        return self._lookup(collection, entry_id)
+
+    def _lookup_uncached(self, collection, entry_id):
+        table = self.tables.get(collection)
+        row = table.row(entry_id) if table is not None else None
+        if row is None:
+            return self._missing
+        return tuple(
+            table.value(field, row) if field in table.columns else ''
+            for field in CATALOGUE_FIELDS
+        )
+
+
+def chunks(store, join, after_id = 0, until_id = None, chunk_size = CHUNK_SIZE):
+    """Rows of FIELDS of the labels with after_id < id <= until_id, a list per chunk."""
+    while True:
+        labels = store.since(after_id, chunk_size, until_id)
+        if not labels:
+            return
+        yield [
+            (label_id, label.collection, label.entry_id) + join(label.collection, label.entry_id)
+            + (label.lat, label.lng, utc_timestamp(label.submitted_at))
+            for label_id, label in labels
+        ]
+        after_id = labels[-1][0]
+
+
+def geojsonseq(chunks):
+    for rows in chunks:
+        yield ''.join(
+            '\x1e{}\n'.format(json.dumps({
+                'type' : 'Feature',
+                'id' : row[0],
+                'geometry' : {'type' : 'Point', 'coordinates' : [row[7], row[6]]},
+                'properties' : dict(zip(FIELDS[1:6], row[1:6]), submitted_at = iso_utc(row[8]))
+            }))
+            for row in rows
+        ).encode('utf-8')
+
+
+def csv_rows(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for rows in chunks:
+        writer.writerows(row[:8] + (iso_utc(row[8]),) for row in rows)
+        yield buffer.getvalue().encode('utf-8')
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+class ChunkSink(io.RawIOBase):
+    """Write-only file handing out what was written since the last drain."""
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def drain(self):
+        data = b''.join(self._parts)
+        self._parts = []
+        return data
+
+
+def parquet(chunks):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = pa.schema([
+        ('label_id', pa.int64()),
+        ('collection', pa.string()),
+        ('Entry_ID', pa.string()),
+        ('Title', pa.string()),
+        ('Description', pa.string()),
+        ('Collection', pa.string()),
+        ('lat', pa.float64()),
+        ('lng', pa.float64()),
+        ('submitted_at', pa.timestamp('s', tz = 'UTC'))
+    ])
+    sink = ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for rows in chunks:
+            arrays = [pa.array(values, field.type) for values, field in zip(zip(*rows), schema)]
+            writer.write_table(pa.Table.from_arrays(arrays, schema = schema))
+            yield sink.drain()
+    # the footer, written on close
+    yield sink.drain()
+
+
+ENCODERS = {
+    'geojsonseq' : geojsonseq,
+    'csv' : csv_rows,
+    'parquet' : parquet
+}
+
+
+def export(store, tables, format, after_id = 0, until_id = None, chunk_size = CHUNK_SIZE):
+    """
+    Encoded bytes of the labels with after_id < id <= until_id, chunk by
+    chunk, joined with tables, the catalogue tables by collection name.
+    """
+    return ENCODERS[format](chunks(store, CatalogueJoin(tables), after_id, until_id, chunk_size))
+
+
+if __name__ == '__main__':
+    import argparse
+    import pathlib
+    import sys
+
+    import catalogue
+    import labels
+
+    root = pathlib.Path(__file__).parent
+    parser = argparse.ArgumentParser(description = 'Export labels joined with catalogue metadata.')
+    parser.add_argument('output', help = "output file, or - for stdout")
+    parser.add_argument('--format', choices = sorted(FORMATS), help = 'default: from the output extension')
+    parser.add_argument('--database', default = str(root.joinpath('data', 'labels.sqlite3')), help = 'SQLite path or postgresql:// URL')
+    parser.add_argument('--assets', type = pathlib.Path, default = root.joinpath('assets'), help = 'folder of <name>-metadata.csv files')
+    parser.add_argument('--cache-dir', type = pathlib.Path, default = root.joinpath('cache', 'catalogue'))
+    parser.add_argument('--after', type = int, help = 'export labels after this id; default: the cursor file, else 0')
+    parser.add_argument('--limit', type = int, help = 'export at most this many labels')
+    parser.add_argument('--cursor-file', type = pathlib.Path, help = 'read the cursor from and write the new one to this file')
+    parser.add_argument('--chunk-size', type = int, default = CHUNK_SIZE)
+    args = parser.parse_args()
+
+    format = args.format
+    if format is None:
+        extensions = {extension : name for name, (mimetype, extension) in FORMATS.items()}
+        format = extensions.get(pathlib.Path(args.output).suffix.lstrip('.'))
+        if format is None:
+            parser.error('cannot tell the format of {}; pass --format'.format(args.output))
+    if args.limit is not None and args.limit < 1:
+        parser.error('--limit must be at least 1')
+    if not available(format):
+        parser.error('{} export needs {}, which cannot be imported'.format(format, REQUIRES[format]))
+    after_id = args.after
+    if after_id is None:
+        after_id = int(args.cursor_file.read_text()) if args.cursor_file and args.cursor_file.exists() else 0
+
+    store = labels.LabelStore(args.database)
+    until_id = store.last_id(after_id, args.limit)
+    tables = {
+        catalogue.collection_name(path) : catalogue.published_table(path, args.cache_dir)
+        for path in sorted(args.assets.glob('*{}.csv'.format(catalogue.METADATA_SUFFIX)))
+    }
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    with output:
+        for data in export(store, tables, format, after_id, until_id, args.chunk_size):
+            output.write(data)
+    if args.cursor_file:
+        args.cursor_file.write_text('{}\n'.format(until_id))
+    print('exported the labels after {} up to {}; next cursor: {}'.format(after_id, until_id, until_id), file = sys.stderr)
@@ -0,0 +1,61 @@
+"""
+Gunicorn settings, read by ``gunicorn app:server`` when started from this folder.
+
+The app is imported once in the master and the workers are forked from it,
+so they share the imported modules, the memory-mapped catalogue and the
+pre-rendered layout copy-on-write. Each worker serves requests from a pool of
+threads: callbacks mostly wait on SQLite, thumbnails and tiles, and a slow
+image or tile fetch then holds one thread rather than a whole worker.
+
+Tuned through the environment:
+
+    GUNICORN_WORKERS        processes; default WEB_CONCURRENCY, else the CPU count
+    GUNICORN_THREADS        threads per worker (default 4)
+    GUNICORN_WORKER_CLASS   gthread (default), sync, or e.g. gevent if installed
+    GUNICORN_PRELOAD        0 imports the app in each worker instead
+    GUNICORN_TIMEOUT        seconds before a silent worker is restarted (default 60)
+    GUNICORN_GRACEFUL_TIMEOUT  seconds a stopping worker gets to finish (default 30)
+"""
+
+import gc
+import multiprocessing
+import os
+import sys
+
+workers = int(os.environ.get('GUNICORN_WORKERS', os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count())))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') != '0'
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = 5 # seconds; browsers reuse the connection for the callbacks that follow a page load
+
+
+def when_ready(server):
+    """With the app preloaded, warm it in the master so every worker inherits the result."""
+    app = sys.modules.get('app')
+    if app is None:
+        return
+    app.warm_up()
+    # the workers open their own
+    app.close_connections()
+    # objects made so far are left out of garbage collection, which would
+    # otherwise write to their pages and unshare them in every worker
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """Warm the worker once the app is loaded, before it takes requests."""
+    app = sys.modules.get('app')
+    if app is not None:
+        app.warm_up()
+
+
+def worker_exit(server, worker):
+    """Write the labels still queued in this worker before it goes away."""
+    app = sys.modules.get('app')
+    if app is None:
+        return
+    unwritten = app.label_store.close(timeout = graceful_timeout)
+    if unwritten:
+        server.log.warning('worker %s exited with %d labels unwritten', worker.pid, unwritten)
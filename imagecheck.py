@@ -0,0 +1,371 @@
+"""
+Check the catalogue's image URLs and record what each image is.
+
+Every ``Image_url`` is requested concurrently from a pool of worker threads,
+each keeping one keep-alive connection per host, so a run holds at most
+``workers`` connections to S3 however many images it checks. What comes back
+is stored in a SQLite sidecar table, one row per collection and Entry_ID:
+
+    status          HTTP status of the image, NULL if the request failed
+    content_length  bytes of the image
+    width, height   pixels
+    phash           64-bit DCT perceptual hash, as 16 hex digits
+    error           why the image could not be fetched or read
+
+Modes, cheapest first:
+
+    head   HEAD request: status and size only
+    probe  GET of the first PROBE_BYTES: dimensions read from the image header
+    full   GET of the whole image: dimensions and perceptual hash (default)
+
+A run only checks the rows that are new, whose URL changed, that were checked
+in a cheaper mode, that failed to connect, or that are older than
+``max_age``; results are written as they arrive, so an interrupted run
+resumes where it stopped. The gallery reads the dimensions to reserve each
+card's space before its thumbnail arrives.
+
+    python imagecheck.py [metadata.csv ...] [--database data/images.sqlite3]
+        [--mode full] [--workers 16] [--max-age 30] [--rewrite FROM TO]
+"""
+
+import base64
+import csv
+import http.client
+import io
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image, ImageFile
+
+import catalogue
+from connections import ThreadConnections
+
+MODES = ('head', 'probe', 'full') # each records what the ones before it do, and more
+PROBE_BYTES = 64 * 1024 # enough for the header of nearly every JPEG, EXIF included
+MAX_REDIRECTS = 3
+WRITE_INTERVAL = 1 # seconds between committing results during a run
+HASH_SIZE = 8 # bits per side of the perceptual hash
+
+
+def phash(image):
+    """DCT perceptual hash: the signs of the lowest frequencies of a 32 x 32 greyscale copy, against their median."""
+    size = 4 * HASH_SIZE
+    # decode JPEGs at a fraction of their resolution; the hash only needs 32 x 32
+    image.draft('L', (2 * size, 2 * size))
+    pixels = np.asarray(image.convert('L').resize((size, size), Image.LANCZOS), dtype = np.float64)
+    k = np.arange(size)
+    basis = np.cos(np.pi * np.outer(k, 2 * k + 1) / (2 * size))
+    low = (basis @ pixels @ basis.T)[:HASH_SIZE, :HASH_SIZE].ravel()
+    bits = low > np.median(low[1:]) # the DC term only measures brightness
+    return '{:016x}'.format(int(''.join('1' if bit else '0' for bit in bits), 2))
+
+
+def describe(data, result):
+    """Add the size, dimensions and perceptual hash of image bytes to a check result."""
+    if result['content_length'] is None:
+        result['content_length'] = len(data)
+    image = Image.open(io.BytesIO(data))
+    result['width'], result['height'] = image.size
+    result['phash'] = phash(image)
+
+
+class Fetcher:
+    """HTTP requests over one keep-alive connection per host for each calling thread."""
+
+    def __init__(self, timeout = 10, rewrite = None):
+        self.timeout = timeout
+        # (from, to) URL prefixes, e.g. to check against a local copy of the bucket
+        self.rewrite = rewrite
+        self._local = threading.local()
+
+    def _connection(self, scheme, netloc):
+        connections = self._local.__dict__.setdefault('connections', {})
+        conn = connections.get((scheme, netloc))
+        if conn is None:
+            connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            conn = connections[scheme, netloc] = connection_class(netloc, timeout = self.timeout)
+        return conn
+
+    def _drop(self, scheme, netloc):
+        conn = self._local.__dict__.get('connections', {}).pop((scheme, netloc), None)
+        if conn is not None:
+            conn.close()
+
+    def request(self, method, url, headers = None):
+        """
+        Send the request, following redirects, and return (response,
+        release): call release(reuse) when done with the response, reuse
+        only if its body was read in full.
+        """
+        if self.rewrite and url.startswith(self.rewrite[0]):
+            url = self.rewrite[1] + url[len(self.rewrite[0]):]
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            target = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+            for attempt in (0, 1):
+                conn = self._connection(parts.scheme, parts.netloc)
+                try:
+                    conn.request(method, target, headers = headers or {})
+                    response = conn.getresponse()
+                    break
+                except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                    # the server closed an idle keep-alive connection: reconnect once
+                    self._drop(parts.scheme, parts.netloc)
+                    if attempt:
+                        raise
+                except Exception:
+                    self._drop(parts.scheme, parts.netloc)
+                    raise
+            location = response.getheader('Location')
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()
+                url = urllib.parse.urljoin(url, location)
+                continue
+            def release(reuse, scheme = parts.scheme, netloc = parts.netloc):
+                if not reuse or response.will_close:
+                    self._drop(scheme, netloc)
+            return response, release
+        raise http.client.HTTPException('too many redirects')
+
+    def check(self, url, mode = 'full'):
+        """What one image URL serves, as the fields of an ImageChecks row."""
+        result = {'status' : None, 'content_length' : None, 'content_type' : None, 'width' : None, 'height' : None, 'phash' : None, 'error' : None}
+        if url.startswith('data:'):
+            return self._check_inline(url, result)
+        headers = {'Range' : 'bytes=0-{}'.format(PROBE_BYTES - 1)} if mode == 'probe' else {}
+        try:
+            response, release = self.request('HEAD' if mode == 'head' else 'GET', url, headers)
+        except (OSError, http.client.HTTPException) as error:
+            result['error'] = '{}: {}'.format(type(error).__name__, error)
+            return result
+        reuse = False
+        try:
+            result['status'] = 200 if response.status == 206 else response.status
+            result['content_type'] = response.getheader('Content-Type')
+            length = response.getheader('Content-Length')
+            content_range = response.getheader('Content-Range', '')
+            if response.status == 206 and '/' in content_range:
+                length = content_range.rsplit('/', 1)[1] # the whole image, not the range
+            result['content_length'] = int(length) if length and length.isdigit() else None
+            if mode == 'head' or response.status >= 400:
+                response.read() # nothing, or the error page: the connection can be reused
+                reuse = True
+            elif mode == 'probe':
+                reuse = self._probe(response, result)
+            else:
+                data = response.read()
+                reuse = True
+                describe(data, result)
+        except (OSError, ValueError, http.client.HTTPException, Image.DecompressionBombError) as error:
+            result['error'] = '{}: {}'.format(type(error).__name__, error)
+        finally:
+            release(reuse)
+        return result
+
+    def _check_inline(self, url, result):
+        """A data: URL holds its image: read it as a full check would."""
+        header, _, payload = url[len('data:'):].partition(',')
+        try:
+            data = base64.b64decode(payload) if header.endswith(';base64') else urllib.parse.unquote_to_bytes(payload)
+            result['status'] = 200
+            result['content_type'] = header.split(';')[0] or None
+            describe(data, result)
+        except (OSError, ValueError, Image.DecompressionBombError) as error:
+            result['error'] = '{}: {}'.format(type(error).__name__, error)
+        return result
+
+    def _probe(self, response, result):
+        """Read the image header for its dimensions; True if the body was read to its end."""
+        parser = ImageFile.Parser()
+        read = 0
+        while parser.image is None and read < PROBE_BYTES:
+            chunk = response.read(min(16 * 1024, PROBE_BYTES - read))
+            if not chunk:
+                break
+            parser.feed(chunk)
+            read += len(chunk)
+        if parser.image is None:
+            result['error'] = 'no image header in the first {} bytes'.format(read)
+        else:
+            result['width'], result['height'] = parser.image.size
+        if response.status == 206:
+            response.read() # the rest of the range, so the connection can be reused
+        # a server ignoring the Range header sends the whole image: stop reading it
+        return response.isclosed()
+
+
+class ImageChecks:
+    """The SQLite sidecar table of image checks, keyed by collection and Entry_ID."""
+
+    schema = '''CREATE TABLE IF NOT EXISTS images (
+        collection TEXT NOT NULL,
+        entry_id TEXT NOT NULL,
+        url TEXT NOT NULL,
+        mode TEXT NOT NULL,
+        status INTEGER,
+        content_length INTEGER,
+        content_type TEXT,
+        width INTEGER,
+        height INTEGER,
+        phash TEXT,
+        error TEXT,
+        checked_at REAL NOT NULL,
+        PRIMARY KEY (collection, entry_id)
+    )'''
+    columns = ('status', 'content_length', 'content_type', 'width', 'height', 'phash', 'error')
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.connections = ThreadConnections(self.connect)
+
+    def connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        # rollback journal rather than WAL, so every commit changes the
+        # file's modification time that version() reads
+        conn = sqlite3.connect(self.path, timeout = 30, check_same_thread = False)
+        conn.execute(self.schema)
+        conn.commit()
+        return conn
+
+    def close(self):
+        """Close this process's connections, e.g. before forking."""
+        self.connections.close()
+
+    def version(self):
+        """Changes whenever a run records results; 0 before the first."""
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def stale(self, collection, entries, mode = 'full', max_age = None):
+        """The (entry_id, url) entries due a check in the given mode."""
+        known = {
+            entry_id : (url, checked_mode, status, checked_at)
+            for entry_id, url, checked_mode, status, checked_at in self.connections.get().execute(
+                'SELECT entry_id, url, mode, status, checked_at FROM images WHERE collection = ?', (collection,)
+            )
+        }
+        oldest = time.time() - max_age if max_age is not None else float('-inf')
+        due = []
+        for entry_id, url in entries:
+            row = known.get(entry_id)
+            if (
+                row is None
+                or row[0] != url
+                or MODES.index(row[1]) < MODES.index(mode)
+                or row[2] is None # could not connect: try again
+                or row[3] < oldest
+            ):
+                due.append((entry_id, url))
+        return due
+
+    def record(self, collection, checks):
+        """Store (entry_id, url, mode, result) checks."""
+        now = time.time()
+        conn = self.connections.get()
+        with conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [
+                    (collection, entry_id, url, mode) + tuple(result[column] for column in self.columns) + (now,)
+                    for entry_id, url, mode, result in checks
+                ]
+            )
+
+    def prune(self, collection, entry_ids):
+        """Delete the rows of entries no longer among the given ones, returning how many."""
+        keep = set(entry_ids)
+        conn = self.connections.get()
+        gone = [
+            (collection, entry_id)
+            for entry_id, in conn.execute('SELECT entry_id FROM images WHERE collection = ?', (collection,))
+            if entry_id not in keep
+        ]
+        with conn:
+            conn.executemany('DELETE FROM images WHERE collection = ? AND entry_id = ?', gone)
+        return len(gone)
+
+    def lookup(self, collection, entry_ids):
+        """{entry_id: {column: value}} of the given entries that have been checked."""
+        entry_ids = list(entry_ids)
+        if not entry_ids or not os.path.exists(self.path):
+            return {}
+        rows = self.connections.get().execute(
+            'SELECT entry_id, {} FROM images WHERE collection = ? AND entry_id IN ({})'.format(
+                ', '.join(self.columns), ', '.join('?' * len(entry_ids))
+            ),
+            [collection] + entry_ids
+        )
+        return {entry_id : dict(zip(self.columns, values)) for entry_id, *values in rows}
+
+
+def run(checks, fetcher, collection, entries, mode = 'full', workers = 16, max_age = None):
+    """
+    Check the stale entries of one collection, recording results as they
+    arrive. Returns (entries checked, seconds, {status: count}).
+    """
+    start = time.perf_counter()
+    entries = list(entries)
+    checks.prune(collection, [entry_id for entry_id, _ in entries])
+    due = checks.stale(collection, entries, mode, max_age)
+    statuses = {}
+    done = []
+    written = time.monotonic()
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        futures = {pool.submit(fetcher.check, url, mode) : (entry_id, url) for entry_id, url in due}
+        for future in as_completed(futures):
+            entry_id, url = futures[future]
+            result = future.result()
+            statuses[result['status']] = statuses.get(result['status'], 0) + 1
+            done.append((entry_id, url, mode, result))
+            if time.monotonic() - written > WRITE_INTERVAL:
+                checks.record(collection, done)
+                done = []
+                written = time.monotonic()
+    checks.record(collection, done)
+    return len(due), time.perf_counter() - start, statuses
+
+
+def catalogue_entries(csv_path):
+    """(entry_id, url) of every image of a metadata CSV, the first row of a repeated Entry_ID only."""
+    urls = {}
+    with open(csv_path, newline = '') as f:
+        for row in csv.DictReader(f):
+            urls.setdefault(row['Entry_ID'], row['Image_url'])
+    return list(urls.items())
+
+
+if __name__ == '__main__':
+    import argparse
+
+    here = pathlib.Path(__file__).parent
+    parser = argparse.ArgumentParser(description = 'Check the image URLs of metadata CSVs and record their dimensions and hashes.')
+    parser.add_argument('metadata', nargs = '*', help = 'metadata CSVs; default every *-metadata.csv in assets')
+    data_path = pathlib.Path(os.environ.get('DATA_PATH', here.joinpath('data')))
+    parser.add_argument('--database', default = os.environ.get('IMAGE_CHECKS_DATABASE', str(data_path.joinpath('images.sqlite3'))))
+    parser.add_argument('--mode', choices = MODES, default = 'full')
+    parser.add_argument('--workers', type = int, default = 16, help = 'concurrent requests, and connections per host')
+    parser.add_argument('--max-age', type = float, default = 30, help = 'days before a checked image is checked again')
+    parser.add_argument('--timeout', type = float, default = 10)
+    parser.add_argument('--rewrite', nargs = 2, metavar = ('FROM', 'TO'), help = 'fetch URLs starting with FROM from TO instead, e.g. a local server')
+    args = parser.parse_args()
+
+    checks = ImageChecks(args.database)
+    fetcher = Fetcher(args.timeout, args.rewrite)
+    for csv_path in args.metadata or sorted(here.joinpath('assets').glob('*-metadata.csv')):
+        collection = catalogue.collection_name(csv_path)
+        entries = catalogue_entries(csv_path)
+        count, seconds, statuses = run(checks, fetcher, collection, entries, args.mode, args.workers, args.max_age * 24 * 60 * 60)
+        print('{}: checked {} of {} images in {:.1f} s ({:.0f} URLs/s)'.format(
+            collection, count, len(entries), seconds, count / seconds if seconds else 0
+        ))
+        for status, n in sorted(statuses.items(), key = lambda item: (item[0] is None, item[0] or 0)):
+            print('    {:>6} {}'.format(status or 'failed', n))
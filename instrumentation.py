@@ -0,0 +1,236 @@
+"""
+Opt-in timing and payload metrics for the server-side Dash callbacks.
+
+``instrument`` wraps the view behind /_dash-update-component, which runs every
+server callback, and records for each call its wall time (including
+serialization), request and response bytes before compression, and the ids of
+the props that triggered it. Samples go to a fixed-size ring buffer for the
+/debug/callbacks summary, and into per-callback histograms exposed in the
+Prometheus text format on /metrics. Both routes need the bearer token passed
+to ``instrument``, and are not served without one.
+
+Series are labelled with the name of the callback's function. Requests for
+an output no registered callback has are counted under "unknown", so clients
+cannot add series by posting made-up outputs.
+
+Metrics are kept per worker process and are not combined: under gunicorn a
+scrape of /metrics, or a look at /debug/callbacks, is answered by whichever
+worker takes the request, and shows only the calls that worker served. The
+series of one target then jump between workers' counts from scrape to scrape.
+Collect them with a single worker (GUNICORN_WORKERS=1) when the numbers have
+to add up, e.g. for a profiling session.
+"""
+
+import collections
+import hmac
+import html
+import threading
+import time
+from bisect import bisect_left
+
+import flask
+from dash.exceptions import PreventUpdate
+
+RING_SIZE = 4096
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+UNKNOWN = 'unknown' # callback name of outputs with no registered callback
+
+Sample = collections.namedtuple('Sample', ['at', 'callback', 'seconds', 'request_bytes', 'response_bytes', 'triggers', 'status'])
+
+
+def label_value(value):
+    """A Prometheus label value, escaped and quoted."""
+    return '"{}"'.format(str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+
+
+class Histogram:
+    """Prometheus-style histogram; bucket counts are kept non-cumulative."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def exposition(self, name, labels):
+        cumulative = 0
+        lines = []
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            cumulative += count
+            lines.append('{}_bucket{{{},le="{}"}} {}'.format(name, labels, bound, cumulative))
+        lines.append('{}_sum{{{}}} {}'.format(name, labels, self.sum))
+        lines.append('{}_count{{{}}} {}'.format(name, labels, self.count))
+        return lines
+
+
+class CallbackStats:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.request_bytes = Histogram(BYTES_BUCKETS)
+        self.response_bytes = Histogram(BYTES_BUCKETS)
+        self.errors = 0
+
+
+class CallbackMetrics:
+    """Ring buffer of recent callback calls and histograms per callback."""
+
+    def __init__(self, ring_size = RING_SIZE):
+        self.samples = collections.deque(maxlen = ring_size)
+        self.stats = collections.defaultdict(CallbackStats)
+        self._lock = threading.Lock()
+
+    def record(self, sample):
+        with self._lock:
+            self.samples.append(sample)
+            stats = self.stats[sample.callback]
+            stats.duration.observe(sample.seconds)
+            stats.request_bytes.observe(sample.request_bytes)
+            stats.response_bytes.observe(sample.response_bytes)
+            if sample.status >= 500:
+                stats.errors += 1
+
+    def prometheus(self):
+        """All histograms in the Prometheus text exposition format."""
+        metrics = (
+            ('dash_callback_duration_seconds', 'duration', 'Wall time of server callbacks, including serialization.'),
+            ('dash_callback_request_bytes', 'request_bytes', 'Uncompressed size of callback requests.'),
+            ('dash_callback_response_bytes', 'response_bytes', 'Uncompressed size of callback responses.')
+        )
+        with self._lock:
+            stats = sorted(self.stats.items())
+            lines = []
+            for name, attribute, help in metrics:
+                lines += ['# HELP {} {}'.format(name, help), '# TYPE {} histogram'.format(name)]
+                for callback, callback_stats in stats:
+                    lines += getattr(callback_stats, attribute).exposition(name, 'callback=' + label_value(callback))
+            lines += [
+                '# HELP dash_callback_errors_total Server callbacks that failed.',
+                '# TYPE dash_callback_errors_total counter'
+            ]
+            lines += [
+                'dash_callback_errors_total{{callback={}}} {}'.format(label_value(callback), callback_stats.errors)
+                for callback, callback_stats in stats
+            ]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self):
+        """Per callback: calls, latency percentiles and mean payloads over the ring buffer."""
+        with self._lock:
+            samples = list(self.samples)
+        by_callback = collections.defaultdict(list)
+        for sample in samples:
+            by_callback[sample.callback].append(sample)
+        rows = []
+        for callback, calls in by_callback.items():
+            seconds = sorted(sample.seconds for sample in calls)
+            rows.append({
+                'callback' : callback,
+                'calls' : len(calls),
+                'p50_ms' : 1000 * seconds[len(seconds) // 2],
+                'p95_ms' : 1000 * seconds[min(len(seconds) - 1, int(0.95 * len(seconds)))],
+                'max_ms' : 1000 * seconds[-1],
+                'total_ms' : 1000 * sum(seconds),
+                'request_bytes' : sum(sample.request_bytes for sample in calls) / len(calls),
+                'response_bytes' : sum(sample.response_bytes for sample in calls) / len(calls),
+                'triggers' : collections.Counter(trigger for sample in calls for trigger in sample.triggers).most_common(3)
+            })
+        return sorted(rows, key = lambda row: -row['total_ms'])
+
+
+def callback_names(dash_app):
+    """Output key -> name of the function behind each server callback."""
+    return {
+        output : spec['callback'].__name__
+        for output, spec in dash_app.callback_map.items()
+        if 'callback' in spec
+    }
+
+
+def render_summary(rows):
+    columns = ('callback', 'calls', 'total_ms', 'p50_ms', 'p95_ms', 'max_ms', 'request_bytes', 'response_bytes', 'triggers')
+    def cell(value):
+        if isinstance(value, float):
+            value = '{:.1f}'.format(value)
+        elif isinstance(value, list):
+            value = ', '.join('{} ({})'.format(trigger, count) for trigger, count in value)
+        return '<td>{}</td>'.format(html.escape(str(value)))
+    return (
+        '<!DOCTYPE html><title>Callbacks</title>'
+        '<table border="1" cellpadding="4"><tr>{}</tr>{}</table>'.format(
+            ''.join('<th>{}</th>'.format(column) for column in columns),
+            ''.join('<tr>{}</tr>'.format(''.join(cell(row[column]) for column in columns)) for row in rows)
+        )
+    )
+
+
+def require_token(token):
+    """Abort unless the request carries the bearer token: 404 when there is none to carry, else 401."""
+    if not token:
+        flask.abort(404)
+    if not hmac.compare_digest(flask.request.headers.get('Authorization', ''), 'Bearer ' + token):
+        flask.abort(401)
+
+
+def instrument(dash_app, metrics = None, token = None):
+    """
+    Record every server callback of dash_app, and add /metrics and
+    /debug/callbacks, served to requests with the bearer token only.
+    """
+    metrics = metrics or CallbackMetrics()
+    server = dash_app.server
+    endpoint = dash_app.config.routes_pathname_prefix + '_dash-update-component'
+    dispatch = server.view_functions[endpoint]
+    # output key -> callback name, rebuilt when callbacks are added after instrument()
+    names = {}
+    registered = -1
+
+    def instrumented_dispatch(*args, **kwargs):
+        nonlocal names, registered
+        start = time.perf_counter()
+        status = 500
+        response_bytes = 0
+        try:
+            response = dispatch(*args, **kwargs)
+            status = response.status_code
+            response_bytes = response.content_length or 0
+            return response
+        except PreventUpdate:
+            # answered by Dash's error handler with an empty 204
+            status = 204
+            raise
+        finally:
+            seconds = time.perf_counter() - start
+            body = flask.request.get_json(silent = True) or {}
+            output = body.get('output', '')
+            if registered != len(dash_app.callback_map):
+                names, registered = callback_names(dash_app), len(dash_app.callback_map)
+            metrics.record(Sample(
+                time.time(),
+                names.get(output, UNKNOWN),
+                seconds,
+                flask.request.content_length or 0,
+                response_bytes,
+                tuple(body.get('changedPropIds', ())),
+                status
+            ))
+
+    server.view_functions[endpoint] = instrumented_dispatch
+
+    @server.route('/metrics')
+    def serve_metrics():
+        require_token(token)
+        return flask.Response(metrics.prometheus(), mimetype = PROMETHEUS_MIMETYPE)
+
+    @server.route('/debug/callbacks')
+    def serve_callback_summary():
+        require_token(token)
+        return render_summary(metrics.summary())
+
+    return metrics
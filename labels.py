@@ -0,0 +1,339 @@
+"""
+Persistent store for the image-location labels submitted by users.
+
+Submissions are appended to an in-memory write-ahead queue and written to the
+database in batches by a background thread, so callbacks never wait on disk.
+SQLite is the default backend; a ``postgresql://`` URL uses PostgreSQL through
+psycopg2 when it is installed.
+
+The queue is bounded. When it is full ``submit`` returns DEFERRED instead of
+blocking, and the caller keeps the label and submits it again later.
+Submissions carry an idempotency key, so double clicks and such retries are
+stored once: repeats are recognised in process, and the database ignores keys
+it already holds, which also covers repeats answered by other workers.
+
+A queued label is only in this process's memory until its batch commits. The
+writer retries a batch it cannot write, reconnecting as needed, for as long
+as it takes rather than dropping it; meanwhile the queue fills and further
+labels are deferred. Submitting a key again reports WRITTEN once its label is
+in the database, so a caller that keeps each label until then, as the app's
+browser side does, loses none when a worker dies with labels still queued.
+"""
+
+import atexit
+import collections
+import hashlib
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from tenacity import Retrying, before_sleep_log, wait_exponential
+
+from connections import ThreadConnections, backend_for
+
+logger = logging.getLogger(__name__)
+
+# a photo is (collection, entry_id): Entry_IDs are only unique within a collection
+Label = collections.namedtuple('Label', ['submitted_at', 'collection', 'entry_id', 'lat', 'lng'])
+
+# collection of the labels stored before labels recorded theirs, when it was the only one
+LEGACY_COLLECTION = 'mosth-beulah'
+
+# outcomes of LabelStore.submit
+QUEUED = 'queued' # accepted, not written yet
+DEFERRED = 'deferred' # queue full: submit the same label again shortly
+DUPLICATE = 'duplicate' # the key is already queued, not written yet
+WRITTEN = 'written' # the key's label is in the database
+
+MAX_RETRY_WAIT = 30 # seconds between attempts to write a batch, at most
+
+
+def idempotency_key(session_id, collection, entry_id, submitted_at):
+    """Key identifying one submission of a label from one browser session."""
+    return hashlib.sha256('\x1f'.join(map(str, (session_id, collection, entry_id, submitted_at))).encode('utf-8')).hexdigest()[:32]
+
+
+INDEX = 'CREATE UNIQUE INDEX IF NOT EXISTS labels_idempotency_key ON labels (idempotency_key)'
+
+
+class SQLiteBackend:
+    placeholder = '?'
+    schema = """
+        CREATE TABLE IF NOT EXISTS labels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            submitted_at TEXT NOT NULL,
+            collection TEXT,
+            entry_id TEXT NOT NULL,
+            lat REAL NOT NULL,
+            lng REAL NOT NULL,
+            idempotency_key TEXT
+        )
+    """
+    insert = 'INSERT OR IGNORE INTO labels (submitted_at, collection, entry_id, lat, lng, idempotency_key) VALUES (?, ?, ?, ?, ?, ?)'
+
+    def __init__(self, path):
+        self.path = str(path)
+
+    def connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        # closable from any thread by ThreadConnections.close()
+        conn = sqlite3.connect(self.path, timeout = 30, check_same_thread = False)
+        # readers in other workers do not block the batch writer
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(self.schema)
+        # databases created before idempotency keys or collections; their
+        # labels read as LEGACY_COLLECTION's
+        for column in ('idempotency_key', 'collection'):
+            try:
+                conn.execute('ALTER TABLE labels ADD COLUMN {} TEXT'.format(column))
+            except sqlite3.OperationalError:
+                pass # already there
+        conn.execute(INDEX)
+        conn.commit()
+        return conn
+
+
+class PostgresBackend:
+    placeholder = '%s'
+    schema = """
+        CREATE TABLE IF NOT EXISTS labels (
+            id BIGSERIAL PRIMARY KEY,
+            submitted_at TIMESTAMPTZ NOT NULL,
+            collection TEXT,
+            entry_id TEXT NOT NULL,
+            lat DOUBLE PRECISION NOT NULL,
+            lng DOUBLE PRECISION NOT NULL,
+            idempotency_key TEXT
+        )
+    """
+    insert = 'INSERT INTO labels (submitted_at, collection, entry_id, lat, lng, idempotency_key) VALUES (%s, %s, %s, %s, %s, %s) ON CONFLICT DO NOTHING'
+
+    def __init__(self, url):
+        self.url = url
+
+    def connect(self):
+        import psycopg2
+        conn = psycopg2.connect(self.url)
+        with conn.cursor() as cursor:
+            cursor.execute(self.schema)
+            cursor.execute('ALTER TABLE labels ADD COLUMN IF NOT EXISTS idempotency_key TEXT')
+            cursor.execute('ALTER TABLE labels ADD COLUMN IF NOT EXISTS collection TEXT')
+            cursor.execute(INDEX)
+        conn.commit()
+        return conn
+
+
+# a PostgreSQL URL, or else a SQLite path
+BACKENDS = {
+    'postgres' : PostgresBackend,
+    'postgresql' : PostgresBackend
+}
+
+
+class LabelStore:
+    """Append-only label store with a batching background writer."""
+
+    def __init__(self, database, batch_size = 200, flush_interval = 0.5, max_pending = 10000, remember = 10000):
+        self.backend = backend_for(database, BACKENDS, SQLiteBackend)
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.remember = remember
+        self._queue = queue.Queue(maxsize = max_pending)
+        # recently accepted idempotency keys -> whether their label is written
+        self._keys = collections.OrderedDict()
+        self._keys_lock = threading.Lock()
+        self._writer = None
+        self._writer_pid = None
+        self._writer_lock = threading.Lock()
+        self._writing = 0 # labels in the batch being written
+        # read connections of the request threads
+        self._readers = ThreadConnections(self.backend.connect)
+
+    def submit(self, submitted_at, collection, entry_id, lat, lng, key = None):
+        """
+        Queue one label for writing, without touching the database or waiting
+        for room in the queue. Returns QUEUED, DEFERRED if the queue is full,
+        or for a key already accepted, WRITTEN once its label has been written
+        and DUPLICATE until then.
+        """
+        if hasattr(submitted_at, 'isoformat'):
+            submitted_at = submitted_at.isoformat()
+        self._ensure_writer()
+        with self._keys_lock:
+            if key is not None and key in self._keys:
+                return WRITTEN if self._keys[key] else DUPLICATE
+            try:
+                self._queue.put_nowait((Label(submitted_at, collection, entry_id, float(lat), float(lng)), key))
+            except queue.Full:
+                return DEFERRED
+            if key is not None:
+                self._keys[key] = False
+                if len(self._keys) > self.remember:
+                    self._keys.popitem(last = False)
+        return QUEUED
+
+    def pending(self):
+        """Number of labels waiting to be written."""
+        return self._queue.qsize() + self._writing
+
+    def _ensure_writer(self):
+        # threads do not survive fork, so each (gunicorn) process starts its
+        # own; a writer that has stopped is started again
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            return
+        with self._writer_lock:
+            if self._writer_pid == os.getpid() and self._writer.is_alive():
+                return
+            if self._writer_pid not in (None, os.getpid()):
+                # forked child: the parent's queue and its locks are not ours,
+                # nor are the keys it had still to write
+                self._queue = queue.Queue(maxsize = self.max_pending)
+                self._keys_lock = threading.Lock()
+                self._keys = collections.OrderedDict((key, True) for key, written in self._keys.items() if written)
+                self._writing = 0
+            if self._writer_pid != os.getpid():
+                atexit.register(self.close)
+            self._writer = threading.Thread(target = self._run, name = 'label-writer', daemon = True)
+            self._writer.start()
+            self._writer_pid = os.getpid()
+
+    def _next_batch(self):
+        """Block for one label, then gather more until the batch fills or times out."""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while batch[-1] is not None and len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get(timeout = max(0, deadline - time.monotonic())))
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn, labels):
+        """
+        Commit one batch, reconnecting and retrying until it is written.
+        Returns the connection to use for the next batch.
+        """
+        retrying = Retrying(wait = wait_exponential(max = MAX_RETRY_WAIT), before_sleep = before_sleep_log(logger, logging.WARNING), reraise = True)
+        for attempt in retrying:
+            with attempt:
+                if conn is None:
+                    conn = self.backend.connect()
+                try:
+                    cursor = conn.cursor()
+                    # rows whose idempotency key is already stored are skipped
+                    cursor.executemany(self.backend.insert, labels)
+                    conn.commit()
+                except Exception:
+                    # start over on a new connection, whatever state this one is in
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                    conn = None
+                    raise
+        return conn
+
+    def _run(self):
+        conn = None
+        while True:
+            batch = self._next_batch()
+            labels = [label + (key,) for label, key in filter(None, batch)]
+            self._writing = len(labels)
+            if labels:
+                conn = self._write(conn, labels)
+            with self._keys_lock:
+                for label in labels:
+                    if label[-1] in self._keys:
+                        self._keys[label[-1]] = True
+            self._writing = 0
+            for _ in batch:
+                self._queue.task_done()
+            if len(labels) < len(batch):
+                if conn is not None:
+                    conn.close()
+                return
+
+    def flush(self):
+        """Block until every queued label has been written."""
+        if self._writer_pid == os.getpid():
+            self._queue.join()
+
+    def close(self, timeout = None):
+        """
+        Write the remaining labels and stop the writer thread, waiting at most
+        timeout seconds. Returns the number of labels left unwritten.
+        """
+        if self._writer_pid == os.getpid() and self._writer.is_alive():
+            try:
+                self._queue.put(None, timeout = timeout)
+            except queue.Full:
+                pass
+            self._writer.join(timeout)
+            if not self._writer.is_alive():
+                self._writer_pid = None
+        return self.pending()
+
+    def close_readers(self):
+        """Close this process's read connections, e.g. before forking."""
+        self._readers.close()
+
+    @staticmethod
+    def _label(row):
+        label = Label(*row)
+        return label if label.collection is not None else label._replace(collection = LEGACY_COLLECTION)
+
+    def labels(self, photo = None):
+        """Every stored label, optionally for a single (collection, entry_id) photo, oldest first."""
+        cursor = self._readers.get().cursor()
+        query = 'SELECT submitted_at, collection, entry_id, lat, lng FROM labels'
+        if photo is None:
+            cursor.execute(query + ' ORDER BY id')
+        else:
+            cursor.execute(
+                query + ' WHERE COALESCE(collection, {0}) = {0} AND entry_id = {0} ORDER BY id'.format(self.backend.placeholder),
+                (LEGACY_COLLECTION,) + tuple(photo)
+            )
+        rows = [self._label(row) for row in cursor.fetchall()]
+        self._readers.get().commit() # end the read transaction
+        return rows
+
+    def since(self, after_id = 0, limit = 10000, until_id = None):
+        """
+        Up to limit stored (id, label) rows with an id above after_id, and at
+        most until_id if given, in id order.
+        """
+        cursor = self._readers.get().cursor()
+        query = 'SELECT id, submitted_at, collection, entry_id, lat, lng FROM labels WHERE id > {0}'
+        params = (after_id,)
+        if until_id is not None:
+            query += ' AND id <= {0}'
+            params += (until_id,)
+        cursor.execute((query + ' ORDER BY id LIMIT {0}').format(self.backend.placeholder), params + (limit,))
+        rows = [(row[0], self._label(row[1:])) for row in cursor.fetchall()]
+        self._readers.get().commit()
+        return rows
+
+    def last_id(self, after_id = 0, limit = None):
+        """
+        Id of the last stored label above after_id, or of the limit-th one if
+        there are more; after_id when there are none.
+        """
+        cursor = self._readers.get().cursor()
+        placeholder = self.backend.placeholder
+        row = None
+        if limit is not None:
+            cursor.execute(
+                'SELECT id FROM labels WHERE id > {0} ORDER BY id LIMIT 1 OFFSET {0}'.format(placeholder),
+                (after_id, limit - 1)
+            )
+            row = cursor.fetchone()
+        if row is None:
+            cursor.execute('SELECT MAX(id) FROM labels WHERE id > {0}'.format(placeholder), (after_id,))
+            row = cursor.fetchone()
+        self._readers.get().commit()
+        return row[0] if row[0] is not None else after_id
@@ -0,0 +1,58 @@
+"""
+Geobuf-encoded map layers.
+
+Map data is served per Web Mercator tile as Geobuf, a compact protobuf
+encoding of GeoJSON that dash-leaflet's GeoJSON component decodes in the
+browser. Encoded tiles are cached against the version of their source, so
+when new labels arrive only the tiles they fall in are encoded again.
+"""
+
+import collections
+import threading
+
+import geobuf
+
+MIMETYPE = 'application/x-protobuf'
+
+
+def point_collection(points):
+    """GeoJSON FeatureCollection of (lat, lng, properties) points."""
+    return {
+        'type' : 'FeatureCollection',
+        'features' : [
+            {
+                'type' : 'Feature',
+                'geometry' : {'type' : 'Point', 'coordinates' : [lng, lat]},
+                'properties' : properties
+            }
+            for lat, lng, properties in points
+        ]
+    }
+
+
+def cluster_collection(clusters):
+    return point_collection((c.lat, c.lng, {'count' : c.count}) for c in clusters)
+
+
+class GeobufCache:
+    """Bounded LRU of encoded blobs, each valid for one source version."""
+
+    def __init__(self, max_entries = 4096):
+        self.max_entries = max_entries
+        self._blobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, version, build):
+        """The blob for key at version, encoding build() on a miss."""
+        with self._lock:
+            cached = self._blobs.get(key)
+            if cached is not None and cached[0] == version:
+                self._blobs.move_to_end(key)
+                return cached[1]
+        blob = geobuf.encode(build())
+        with self._lock:
+            self._blobs[key] = (version, blob)
+            self._blobs.move_to_end(key)
+            while len(self._blobs) > self.max_entries:
+                self._blobs.popitem(last = False)
+        return blob
@@ -0,0 +1,131 @@
+"""
+Serve payloads that rarely change serialized and compressed once.
+
+Dash serializes the layout, the callback dependencies and the index page on
+every request, although they only change with the catalogue (the layout
+shows the first gallery page) or not at all. ``PayloadCache`` keeps each
+payload as identity, gzip and brotli bodies for the version it was built
+for, rebuilding it only when the version changes, and answers conditional
+GETs with 304. ``PrecompressedDash`` routes Dash's own endpoints through it:
+the index is versioned by the asset files and their modification times, which
+its asset URLs carry, and the dependencies by the number of callbacks.
+Other responses, such as callback results, are left to Flask-Compress, which
+skips responses that already carry a Content-Encoding.
+"""
+
+import collections
+import gzip
+import hashlib
+import json
+import os
+import threading
+
+import brotli
+import dash
+import flask
+import plotly
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# preferred first when a client accepts several
+ENCODINGS = ('br', 'gzip')
+
+Payload = collections.namedtuple('Payload', ['version', 'digest', 'bodies'])
+
+
+def compress(body):
+    """Bodies of the payload for every supported Content-Encoding, None for identity."""
+    return {
+        None : body,
+        'gzip' : gzip.compress(body, compresslevel = GZIP_LEVEL),
+        'br' : brotli.compress(body, quality = BROTLI_QUALITY)
+    }
+
+
+class PayloadCache:
+    """Compressed payloads by key, each valid for one version."""
+
+    def __init__(self):
+        self._payloads = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, version, build):
+        payload = self._payloads.get(key)
+        if payload is None or payload.version != version:
+            with self._lock:
+                payload = self._payloads.get(key)
+                if payload is None or payload.version != version:
+                    body = build()
+                    payload = self._payloads[key] = Payload(
+                        version,
+                        hashlib.sha1(body).hexdigest(),
+                        compress(body)
+                    )
+        return payload
+
+    def respond(self, key, version, build, mimetype):
+        """The payload in the best encoding the request accepts, or 304 if unchanged."""
+        payload = self.get(key, version, build)
+        accepted = flask.request.accept_encodings
+        encoding = next((encoding for encoding in ENCODINGS if accepted[encoding]), None)
+        response = flask.Response(payload.bodies[encoding], mimetype = mimetype)
+        if encoding:
+            response.content_encoding = encoding
+            # same validator format as Flask-Compress: one ETag per encoding
+            response.set_etag('{}:{}'.format(payload.digest, encoding))
+        else:
+            response.set_etag(payload.digest)
+        response.vary.add('Accept-Encoding')
+        # browsers revalidate, getting a 304 until the payload changes
+        response.cache_control.no_cache = True
+        return response.make_conditional(flask.request)
+
+
+class PrecompressedDash(dash.Dash):
+    """
+    Dash app serving its index, layout and dependencies from a PayloadCache.
+    ``layout_version`` returns the version the current layout belongs to.
+    """
+
+    def __init__(self, *args, layout_version = lambda: 0, **kwargs):
+        self.payloads = PayloadCache()
+        self.layout_version = layout_version
+        super().__init__(*args, **kwargs)
+
+    def asset_version(self):
+        """The asset files with their modification times, which the index's asset URLs carry."""
+        paths = list(self._assets_files)
+        if self._favicon:
+            paths.append(os.path.join(self.config.assets_folder, self._favicon))
+        versions = []
+        for path in paths:
+            try:
+                versions.append((path, os.stat(path).st_mtime_ns))
+            except FileNotFoundError:
+                versions.append((path, None))
+        return tuple(versions)
+
+    def index(self, *args, **kwargs):
+        return self.payloads.respond(
+            'index',
+            self.asset_version(),
+            lambda: super(PrecompressedDash, self).index().encode('utf-8'),
+            'text/html'
+        )
+
+    def serve_layout(self):
+        return self.payloads.respond(
+            'layout',
+            self.layout_version(),
+            lambda: json.dumps(self._layout_value(), cls = plotly.utils.PlotlyJSONEncoder).encode('utf-8'),
+            'application/json'
+        )
+
+    def dependencies(self):
+        return self.payloads.respond(
+            'dependencies',
+            # callbacks are only ever added
+            len(self._callback_list),
+            lambda: json.dumps(self._callback_list).encode('utf-8'),
+            'application/json'
+        )
@@ -0,0 +1,193 @@
+"""
+Registry of the image collections hosted by the app.
+
+Every ``<name>-metadata.csv`` in the assets folder is a collection, addressed
+in the app by the first segment of the URL path (``/<name>``). A collection's
+table, gallery pages and search index are built the first time it is
+requested, and only the ``max_loaded`` most recently used collections are kept
+in memory. Catalogue values are read from the memory-mapped table shared by
+all workers; only the search index lives in each worker's heap. When a new
+version of the table is published, the index is updated for the rows in the
+table's diff, or re-synced in full when it has none.
+"""
+
+import collections
+import functools
+import pathlib
+import threading
+
+import catalogue
+import search
+
+
+# columns a gallery card shows
+GALLERY_COLUMNS = ('Entry_ID', 'image_url_thumbnail', 'Title')
+
+
+class Collection:
+    """One metadata file with its lookups, gallery pages and search index."""
+
+    def __init__(self, name, csv_path, cache_dir, page_size, watch = False):
+        self.name = name
+        self.page_size = page_size
+        self.catalogue = catalogue.SharedCatalogue(csv_path, cache_dir, watch = watch)
+        self.search_index = search.SearchIndex()
+        self._search = functools.lru_cache(maxsize = 256)(self._search_uncached)
+        self._positions = functools.lru_cache(maxsize = 16)(self._positions_uncached)
+        self._lock = threading.Lock()
+        self._table = None
+        self.table
+
+    @property
+    def table(self):
+        """The current catalogue table, re-syncing the search index after a swap."""
+        table = self.catalogue.table
+        if table is not self._table:
+            with self._lock:
+                if table is not self._table:
+                    fields = list(search.SEARCH_FIELDS)
+                    diff = table.diff
+                    if self._table is not None and diff is not None and diff['base'] == self._table.source:
+                        # only the rows that differ from the table indexed so far
+                        rows = [table.row(entry_id) for entry_id in diff['changed'] + diff['added']]
+                        self.search_index.update(
+                            (
+                                (table.value('Entry_ID', row), {field : table.value(field, row) for field in fields})
+                                for row in sorted(rows)
+                            ),
+                            diff['removed']
+                        )
+                    else:
+                        self.search_index.sync(
+                            (entry_id, dict(zip(fields, values)))
+                            for entry_id, *values
+                            in zip(table.column('Entry_ID'), *(table.column(field) for field in fields))
+                        )
+                    # precompute the page boundaries of the full, unfiltered gallery
+                    self.pages = self.page_bounds(len(table))
+                    self._table = table
+        return table
+
+    @property
+    def version(self):
+        """Changes whenever a new version of the catalogue is published."""
+        return self.table.version
+
+    def __contains__(self, entry_id):
+        return entry_id in self.table
+
+    def page_bounds(self, count):
+        """(start, stop) row boundaries of every gallery page over count rows."""
+        return [
+            (start, min(start + self.page_size, count))
+            for start in range(0, count, self.page_size)
+        ] or [(0, 0)]
+
+    def page(self, page):
+        """Return the gallery columns of the images shown on the given page."""
+        table = self.table
+        start, stop = self.pages[page]
+        return table.records(range(start, stop), GALLERY_COLUMNS)
+
+    def rows(self, entry_ids):
+        """Return the gallery columns of the given images, skipping unknown ones."""
+        table = self.table
+        rows = [row for row in map(table.row, entry_ids) if row is not None]
+        return table.records(rows, GALLERY_COLUMNS)
+
+    def value(self, entry_id, column):
+        table = self.table
+        row = table.row(entry_id)
+        if row is None:
+            raise KeyError(entry_id)
+        return table.value(column, row)
+
+    def _search_uncached(self, query, filters, version):
+        result = self.search_index.search(query, filters)
+        return result, self.page_bounds(len(result.ids))
+
+    def search(self, query, filters = ()):
+        """Search results and their page boundaries, cached per index version."""
+        return self._search(query, tuple(filters), self.search_index.version)
+
+    def _positions_uncached(self, query, filters, version):
+        result, pages = self._search(query, filters, version)
+        return {entry_id : position for position, entry_id in enumerate(result.ids)}
+
+    def neighbours(self, entry_id, count, query = '', filters = ()):
+        """
+        Up to count Entry_IDs before and after entry_id in the gallery order
+        of the given search, nearest first; empty if it is not in the results.
+        """
+        filters = tuple(filters)
+        version = self.search_index.version
+        ids = self._search(query, filters, version)[0].ids
+        position = self._positions(query, filters, version).get(entry_id)
+        if position is None:
+            return [], []
+        return ids[max(position - count, 0):position][::-1], ids[position + 1:position + 1 + count]
+
+
+class CollectionRegistry:
+    """Discovers collections and keeps a bounded LRU of loaded ones."""
+
+    def __init__(self, assets_path, cache_dir, page_size, max_loaded = 4, watch = False):
+        self.assets_path = pathlib.Path(assets_path)
+        self.cache_dir = cache_dir
+        self.page_size = page_size
+        self.max_loaded = max_loaded
+        # publish collections whose CSV changes while they are loaded
+        self.watch = watch
+        self._loaded = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._loading = {} # name -> lock held while that collection is built
+
+    def names(self):
+        """Names of the metadata files currently in the assets folder."""
+        return sorted(
+            catalogue.collection_name(path)
+            for path in self.assets_path.glob('*{}.csv'.format(catalogue.METADATA_SUFFIX))
+        )
+
+    def path(self, name):
+        return self.assets_path.joinpath('{}{}.csv'.format(name, catalogue.METADATA_SUFFIX))
+
+    def get(self, name):
+        """The named collection, loading it (and evicting the least recently used) if needed."""
+        with self._lock:
+            if name in self._loaded:
+                self._loaded.move_to_end(name)
+                return self._loaded[name]
+            if not self.path(name).exists():
+                raise KeyError(name)
+            loading = self._loading.setdefault(name, threading.Lock())
+        # built under its own lock, so requests for other collections are not held up
+        with loading:
+            with self._lock:
+                if name in self._loaded:
+                    self._loaded.move_to_end(name)
+                    return self._loaded[name]
+            try:
+                collection = Collection(name, self.path(name), self.cache_dir, self.page_size, self.watch)
+                with self._lock:
+                    self._loaded[name] = collection
+                    while len(self._loaded) > self.max_loaded:
+                        self._loaded.popitem(last = False)
+            finally:
+                with self._lock:
+                    self._loading.pop(name, None)
+            return collection
+
+    def published_tables(self):
+        """
+        The current table of every collection by name, e.g. for a bulk export.
+        Collections not loaded are only memory-mapped for the caller, without
+        building their search index or evicting loaded ones, and without
+        republishing their CSV, which may be mid-edit.
+        """
+        with self._lock:
+            loaded = dict(self._loaded)
+        return {
+            name : loaded[name].table if name in loaded else catalogue.published_table(self.path(name), self.cache_dir)
+            for name in self.names()
+        }
@@ -0,0 +1,293 @@
+"""
+Full-text and faceted search over the image catalogue.
+
+An inverted index maps every term of the searchable fields to the documents
+containing it. Query tokens match terms exactly, by prefix, or -- for longer
+tokens -- within one edit, found through a dictionary of single-character
+deletions. Scoring, facet filtering and facet counts run over NumPy arrays
+indexed by document slot, so a query costs a few vectorized passes however
+many documents match.
+
+``SearchIndex.sync`` diffs a new set of documents against the indexed ones by
+id and content, and only re-indexes the documents that were added, changed or
+removed. ``SearchIndex.update`` applies such changes when the caller already
+knows them, without visiting the other documents.
+"""
+
+import collections
+import hashlib
+import math
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+
+import numpy as np
+
+# searchable field -> weight of its terms
+SEARCH_FIELDS = {
+    'Title' : 3.0,
+    'Description' : 1.0,
+    'Collection' : 1.0,
+    'Type' : 0.5,
+    'Organization' : 0.5
+}
+FACET_FIELDS = ('Collection', 'Type', 'Organization')
+
+PREFIX_FACTOR = 0.7
+TYPO_FACTOR = 0.5
+PREFIX_LIMIT = 64 # most terms a single prefix expands to
+TYPO_MIN_LENGTH = 4 # shorter tokens only match exactly or by prefix
+
+TOKEN = re.compile(r'\w+')
+
+SearchResult = collections.namedtuple('SearchResult', ['ids', 'facets'])
+
+
+def tokenize(text):
+    """Lower-cased, accent-folded word tokens."""
+    text = unicodedata.normalize('NFKD', text.lower())
+    return TOKEN.findall(''.join(c for c in text if not unicodedata.combining(c)))
+
+
+def deletions(term):
+    return {term[:i] + term[i + 1:] for i in range(len(term))}
+
+
+def fingerprint(fields):
+    return hashlib.sha1('\x1f'.join(fields.get(field, '') for field in sorted(SEARCH_FIELDS)).encode('utf-8')).digest()
+
+
+def within_one_edit(a, b):
+    """True if a and b differ by at most one insertion, deletion, substitution or transposition."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        return a[i + 1:] == b[i + 1:] or (a[i:i + 2] == b[i:i + 2][::-1] and a[i + 2:] == b[i + 2:])
+    return a[i + 1:] == b[i:] if len(a) > len(b) else a[i:] == b[i + 1:]
+
+
+class SearchIndex:
+    """Incrementally maintained inverted index with facet counts."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._ids = [] # slot -> document id, None once removed
+        self._slots = {} # document id -> slot
+        self._free = []
+        self._fingerprints = {} # document id -> hash of its fields
+        self._doc_terms = {} # slot -> {term: weight}
+        self._postings = {} # term -> {slot: weight}
+        self._arrays = {} # term -> (slots, weights), rebuilt when the term changes
+        self._vocabulary = None # sorted terms, rebuilt after terms come or go
+        self._variants = collections.defaultdict(set) # single deletion -> terms
+        self._capacity = 0
+        self._rank = np.zeros(0, dtype = np.int64) # catalogue position of each slot
+        self._next_rank = 0 # rank of a document appended by update()
+        self._facet_values = {field : [] for field in FACET_FIELDS}
+        self._facet_lookup = {field : {} for field in FACET_FIELDS}
+        self._facet_codes = {field : np.zeros(0, dtype = np.int32) for field in FACET_FIELDS}
+        self.version = 0
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _grow(self):
+        capacity = max(1024, 2 * self._capacity)
+        self._rank = np.resize(self._rank, capacity)
+        for field in FACET_FIELDS:
+            codes = np.full(capacity, -1, dtype = np.int32)
+            codes[:self._capacity] = self._facet_codes[field]
+            self._facet_codes[field] = codes
+        self._capacity = capacity
+
+    def _add_term(self, term):
+        self._vocabulary = None
+        if len(term) >= TYPO_MIN_LENGTH:
+            for variant in deletions(term) | {term}:
+                self._variants[variant].add(term)
+
+    def _drop_term(self, term):
+        self._vocabulary = None
+        if len(term) >= TYPO_MIN_LENGTH:
+            for variant in deletions(term) | {term}:
+                self._variants[variant].discard(term)
+                if not self._variants[variant]:
+                    del self._variants[variant]
+
+    def _add(self, doc_id, fields, rank):
+        slot = self._free.pop() if self._free else len(self._ids)
+        if slot == len(self._ids):
+            self._ids.append(doc_id)
+            if slot >= self._capacity:
+                self._grow()
+        else:
+            self._ids[slot] = doc_id
+        self._slots[doc_id] = slot
+        self._rank[slot] = rank
+        terms = collections.defaultdict(float)
+        for field, weight in SEARCH_FIELDS.items():
+            for term in tokenize(fields.get(field, '')):
+                terms[term] += weight
+        self._doc_terms[slot] = terms
+        for term, weight in terms.items():
+            if term not in self._postings:
+                self._postings[term] = {}
+                self._add_term(term)
+            self._postings[term][slot] = weight
+            self._arrays.pop(term, None)
+        for field in FACET_FIELDS:
+            value = fields.get(field, '')
+            lookup = self._facet_lookup[field]
+            if value not in lookup:
+                lookup[value] = len(self._facet_values[field])
+                self._facet_values[field].append(value)
+            self._facet_codes[field][slot] = lookup[value]
+
+    def _remove(self, doc_id):
+        slot = self._slots.pop(doc_id)
+        for term in self._doc_terms.pop(slot):
+            postings = self._postings[term]
+            del postings[slot]
+            self._arrays.pop(term, None)
+            if not postings:
+                del self._postings[term]
+                self._drop_term(term)
+        for field in FACET_FIELDS:
+            self._facet_codes[field][slot] = -1
+        self._ids[slot] = None
+        self._free.append(slot)
+
+    def sync(self, documents):
+        """
+        Make the index hold exactly the given (id, fields) documents, in that
+        order, re-indexing only those added, changed or removed. Returns the
+        number of documents re-indexed.
+        """
+        with self._lock:
+            seen = set()
+            changed = 0
+            reordered = False
+            rank = -1
+            for rank, (doc_id, fields) in enumerate(documents):
+                seen.add(doc_id)
+                digest = fingerprint(fields)
+                if self._fingerprints.get(doc_id) == digest:
+                    slot = self._slots[doc_id]
+                    if self._rank[slot] != rank:
+                        self._rank[slot] = rank
+                        reordered = True
+                    continue
+                if doc_id in self._slots:
+                    self._remove(doc_id)
+                self._add(doc_id, fields, rank)
+                self._fingerprints[doc_id] = digest
+                changed += 1
+            for doc_id in [doc_id for doc_id in self._slots if doc_id not in seen]:
+                self._remove(doc_id)
+                del self._fingerprints[doc_id]
+                changed += 1
+            self._next_rank = rank + 1
+            if changed or reordered:
+                self.version += 1
+            return changed
+
+    def update(self, documents, removed = ()):
+        """
+        Remove the documents with the given ids, then index the given (id,
+        fields) documents: changed ones keep their place, new ones go after
+        every other, in the order given. Returns the number re-indexed.
+        """
+        with self._lock:
+            changed = 0
+            for doc_id in removed:
+                if doc_id in self._slots:
+                    self._remove(doc_id)
+                    del self._fingerprints[doc_id]
+                    changed += 1
+            for doc_id, fields in documents:
+                digest = fingerprint(fields)
+                if self._fingerprints.get(doc_id) == digest:
+                    continue
+                if doc_id in self._slots:
+                    rank = self._rank[self._slots[doc_id]]
+                    self._remove(doc_id)
+                else:
+                    rank = self._next_rank
+                    self._next_rank += 1
+                self._add(doc_id, fields, rank)
+                self._fingerprints[doc_id] = digest
+                changed += 1
+            if changed:
+                self.version += 1
+            return changed
+
+    def _posting_array(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings[term]
+            arrays = self._arrays[term] = (
+                np.fromiter(postings.keys(), dtype = np.int64, count = len(postings)),
+                np.fromiter(postings.values(), dtype = np.float64, count = len(postings))
+            )
+        return arrays
+
+    def _expand(self, token):
+        """(term, factor) pairs a query token matches."""
+        matches = {}
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        start = bisect_left(self._vocabulary, token)
+        for term in self._vocabulary[start:start + PREFIX_LIMIT]:
+            if not term.startswith(token):
+                break
+            matches[term] = 1.0 if term == token else PREFIX_FACTOR
+        if len(token) >= TYPO_MIN_LENGTH:
+            for variant in deletions(token) | {token}:
+                for term in self._variants.get(variant, ()):
+                    if term not in matches and within_one_edit(token, term):
+                        matches[term] = TYPO_FACTOR
+        return matches.items()
+
+    def search(self, query, filters = (), limit = None):
+        """
+        Ids of the documents matching every query token and every
+        (field, value) filter, best first, with facet counts over the matches.
+        Filters on fields other than FACET_FIELDS are ignored.
+        """
+        with self._lock:
+            size = len(self._ids)
+            alive = self._facet_codes[FACET_FIELDS[0]][:size] >= 0
+            tokens = tokenize(query)
+            scores = np.zeros(size)
+            for token in tokens:
+                token_scores = np.zeros(size)
+                for term, factor in self._expand(token):
+                    slots, weights = self._posting_array(term)
+                    idf = math.log(1 + len(self._slots) / len(slots))
+                    # slots are unique within a term, so fancy indexing is safe
+                    token_scores[slots] = np.maximum(token_scores[slots], weights * (idf * factor))
+                scores += token_scores
+                alive &= token_scores > 0
+            for field, value in filters:
+                if field not in self._facet_lookup:
+                    continue
+                code = self._facet_lookup[field].get(value, -2)
+                alive &= self._facet_codes[field][:size] == code
+            matched = np.flatnonzero(alive)
+            order = matched[np.lexsort((self._rank[matched], -scores[matched]))]
+            if limit is not None:
+                order = order[:limit]
+            facets = {}
+            for field in FACET_FIELDS:
+                counts = np.bincount(self._facet_codes[field][matched], minlength = len(self._facet_values[field]))
+                facets[field] = {
+                    self._facet_values[field][code] : int(count)
+                    for code, count in enumerate(counts) if count
+                }
+            return SearchResult([self._ids[slot] for slot in order], facets)
@@ -0,0 +1,219 @@
+"""
+Server-side state of each browser session.
+
+Callbacks get the key of their session from the ``session_id`` store and keep
+what they need between requests here, rather than sending it back and forth
+through component state:
+
+    selected   [collection, Entry_ID] of the photo open in the session
+    pending    the label awaiting confirmation:
+               {'collection', 'entry_id', 'lat', 'lng', 'dt'}
+    completed  [collection, Entry_ID] of the photos the session has
+               labelled, oldest first
+
+A session expires ``ttl`` seconds after its last change. Backends:
+
+    MemoryBackend  LRU of the most recent sessions in this process only, for
+                   the development server or a single worker
+    SQLiteBackend  a file shared by the workers on one host, standing in for
+                   Redis where there is none
+    RedisBackend   a redis:// URL, shared by several hosts; needs the redis package
+"""
+
+import collections
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from connections import ThreadConnections, backend_for
+
+DEFAULTS = {'selected' : None, 'pending' : None, 'completed' : []}
+MAX_COMPLETED = 10000 # photos remembered per session
+PURGE_INTERVAL = 60 * 60 # seconds between deleting expired sessions from a shared backend
+
+
+class MemoryBackend:
+    """Sessions in this process, the least recently used dropped beyond max_sessions."""
+
+    def __init__(self, max_sessions = 10000):
+        self.max_sessions = max_sessions
+        # key -> (expiry time, JSON value)
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get(self, key):
+        item = self._sessions.get(key)
+        if item is None:
+            return None
+        if item[0] <= time.time():
+            del self._sessions[key]
+            return None
+        self._sessions.move_to_end(key)
+        return item[1]
+
+    def get(self, key):
+        with self._lock:
+            return self._get(key)
+
+    def update(self, key, change, ttl):
+        """Store change(current JSON value or None), atomically."""
+        with self._lock:
+            self._sessions[key] = (time.time() + ttl, change(self._get(key)))
+            self._sessions.move_to_end(key)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last = False)
+
+
+class SQLiteBackend:
+    """Sessions in a SQLite file, shared by the processes on one host."""
+
+    schema = 'CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)'
+
+    def __init__(self, path):
+        self.path = str(path)
+        self.connections = ThreadConnections(self.connect)
+        self._purged = 0
+
+    def connect(self):
+        if os.path.dirname(self.path):
+            os.makedirs(os.path.dirname(self.path), exist_ok = True)
+        # autocommit, transactions begun explicitly in update(); closable
+        # from any thread by ThreadConnections.close()
+        conn = sqlite3.connect(self.path, timeout = 30, isolation_level = None, check_same_thread = False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(self.schema)
+        return conn
+
+    def close(self):
+        """Close this process's connections, e.g. before forking."""
+        self.connections.close()
+
+    def get(self, key):
+        row = self.connections.get().execute(
+            'SELECT value FROM sessions WHERE key = ? AND expires_at > ?',
+            (key, time.time())
+        ).fetchone()
+        return row[0] if row else None
+
+    def update(self, key, change, ttl):
+        """Store change(current JSON value or None), atomically."""
+        conn = self.connections.get()
+        now = time.time()
+        # takes the write lock before reading, so concurrent updates do not overwrite each other
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT value FROM sessions WHERE key = ? AND expires_at > ?', (key, now)).fetchone()
+            conn.execute('INSERT OR REPLACE INTO sessions VALUES (?, ?, ?)', (key, change(row[0] if row else None), now + ttl))
+            if now - self._purged > PURGE_INTERVAL:
+                self._purged = now
+                conn.execute('DELETE FROM sessions WHERE expires_at <= ?', (now,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+
+class RedisBackend:
+    """Sessions in Redis, each a key that expires by itself."""
+
+    def __init__(self, url, prefix = 'session:'):
+        self.url = url
+        self.prefix = prefix
+        self._client = None
+        self._pid = None
+
+    def _connect(self):
+        # the client's connection pool is shared by threads but not across a fork
+        if self._client is None or self._pid != os.getpid():
+            import redis
+            self._client = redis.Redis.from_url(self.url)
+            self._pid = os.getpid()
+        return self._client
+
+    def get(self, key):
+        value = self._connect().get(self.prefix + key)
+        return value.decode('utf-8') if value is not None else None
+
+    def update(self, key, change, ttl):
+        """Store change(current JSON value or None), retrying if the session changed meanwhile."""
+        import redis
+        key = self.prefix + key
+        with self._connect().pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    value = pipe.get(key)
+                    pipe.multi()
+                    pipe.set(key, change(value.decode('utf-8') if value is not None else None), ex = int(ttl))
+                    pipe.execute()
+                    return
+                except redis.WatchError:
+                    continue
+
+
+# 'memory', a Redis URL, or else a SQLite path
+BACKENDS = {
+    'memory' : lambda _: MemoryBackend(),
+    'redis' : RedisBackend,
+    'rediss' : RedisBackend,
+    'unix' : RedisBackend
+}
+
+
+class SessionStore:
+    """The state of each session by its key, with the fields in DEFAULTS."""
+
+    def __init__(self, store, ttl = 12 * 60 * 60):
+        self.backend = backend_for(store, BACKENDS, SQLiteBackend, interface = 'update')
+        self.ttl = ttl
+
+    def close(self):
+        """Close the backend's connections in this process, if it keeps any."""
+        close = getattr(self.backend, 'close', None)
+        if close is not None:
+            close()
+
+    @staticmethod
+    def _load(value):
+        state = dict(DEFAULTS, **json.loads(value)) if value else dict(DEFAULTS)
+        # photos were Entry_IDs alone before collections: drop those
+        if not isinstance(state['selected'], list):
+            state['selected'] = None
+        if state['pending'] is not None and 'collection' not in state['pending']:
+            state['pending'] = None
+        state['completed'] = [photo for photo in state['completed'] if isinstance(photo, list)]
+        return state
+
+    def get(self, session_id):
+        """The session's state; the defaults for a new, expired or missing session."""
+        return self._load(self.backend.get(session_id) if session_id else None)
+
+    def _update(self, session_id, change):
+        if not session_id:
+            return
+        def apply(value):
+            state = self._load(value)
+            change(state)
+            return json.dumps(state)
+        self.backend.update(session_id, apply, self.ttl)
+
+    def set(self, session_id, **fields):
+        """Change some fields of the session's state."""
+        self._update(session_id, lambda state: state.update(fields))
+
+    def complete(self, session_id, photos):
+        """Record that the session has labelled these (collection, entry_id) photos."""
+        photos = list(dict.fromkeys(map(tuple, photos)))
+        if not photos:
+            return
+        added = set(photos)
+        def add(state):
+            completed = [photo for photo in state['completed'] if tuple(photo) not in added]
+            state['completed'] = (completed + [list(photo) for photo in photos])[-MAX_COMPLETED:]
+        self._update(session_id, add)
+
+    def completed(self, session_id):
+        """(collection, entry_id) of the photos the session has labelled."""
+        return frozenset(map(tuple, self.get(session_id)['completed']))
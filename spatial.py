@@ -0,0 +1,137 @@
+"""
+Grid index over label locations with clustering per map zoom level.
+
+Every label is counted into one grid cell per zoom level. Cells are a fixed
+number of screen pixels wide in Web Mercator, and each keeps a running count
+and coordinate sums. A viewport query only visits the cells visible at its
+zoom level, so the number of clusters returned and the cost of finding them
+depend on the size of the map, not on how many labels are stored.
+"""
+
+import collections
+import math
+import threading
+
+Cluster = collections.namedtuple('Cluster', ['lat', 'lng', 'count'])
+
+MIN_ZOOM = 0
+MAX_ZOOM = 18
+CELL_PX = 64 # width of a cluster cell on screen
+TILE_PX = 256
+CELLS_PER_TILE = TILE_PX // CELL_PX
+MAX_LAT = 85.0511287798 # Web Mercator limit
+
+
+def mercator(lat, lng):
+    """Project to the unit square used by Web Mercator tiles."""
+    lat = min(max(lat, -MAX_LAT), MAX_LAT)
+    x = (lng + 180.0) / 360.0
+    sin_lat = math.sin(math.radians(lat))
+    y = 0.5 - math.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)
+    return min(max(x, 0.0), 1.0), min(max(y, 0.0), 1.0)
+
+
+def cells_per_side(zoom):
+    return CELLS_PER_TILE << zoom
+
+
+def cell_range(bounds, zoom, n):
+    """Column and row ranges of an n x n grid covering [[south, west], [north, east]]."""
+    (south, west), (north, east) = bounds
+    x0, y0 = mercator(north, max(west, -180.0))
+    x1, y1 = mercator(south, min(east, 180.0))
+    xs = range(min(int(x0 * n), n - 1), min(int(x1 * n), n - 1) + 1)
+    ys = range(min(int(y0 * n), n - 1), min(int(y1 * n), n - 1) + 1)
+    return xs, ys
+
+
+class GridIndex:
+    """Per-zoom grid of label counts and coordinate sums."""
+
+    def __init__(self):
+        self._cells = [{} for _ in range(MIN_ZOOM, MAX_ZOOM + 1)]
+        # (tile x, tile y) -> number of labels added, per zoom; a tile's
+        # clusters only change when its version does
+        self._tile_versions = [{} for _ in range(MIN_ZOOM, MAX_ZOOM + 1)]
+        self._lock = threading.Lock()
+        self.count = 0
+
+    def add(self, lat, lng):
+        x, y = mercator(lat, lng)
+        with self._lock:
+            for zoom, cells in enumerate(self._cells, MIN_ZOOM):
+                n = cells_per_side(zoom)
+                key = (min(int(x * n), n - 1), min(int(y * n), n - 1))
+                tiles = self._tile_versions[zoom - MIN_ZOOM]
+                tile = (key[0] // CELLS_PER_TILE, key[1] // CELLS_PER_TILE)
+                tiles[tile] = tiles.get(tile, 0) + 1
+                cell = cells.get(key)
+                if cell is None:
+                    cells[key] = [1, lat, lng]
+                else:
+                    cell[0] += 1
+                    cell[1] += lat
+                    cell[2] += lng
+            self.count += 1
+
+    def clusters(self, bounds, zoom):
+        """Clusters in [[south, west], [north, east]] at a map zoom level."""
+        zoom = min(max(int(zoom), MIN_ZOOM), MAX_ZOOM)
+        xs, ys = cell_range(bounds, zoom, cells_per_side(zoom))
+        return self._clusters(zoom, xs, ys)
+
+    def tile_clusters(self, zoom, tx, ty):
+        """Clusters in one Web Mercator tile."""
+        xs = range(tx * CELLS_PER_TILE, (tx + 1) * CELLS_PER_TILE)
+        ys = range(ty * CELLS_PER_TILE, (ty + 1) * CELLS_PER_TILE)
+        return self._clusters(zoom, xs, ys)
+
+    def tiles(self, bounds, zoom):
+        """{(tile x, tile y): version} of the non-empty tiles in view."""
+        zoom = min(max(int(zoom), MIN_ZOOM), MAX_ZOOM)
+        xs, ys = cell_range(bounds, zoom, 1 << zoom)
+        versions = self._tile_versions[zoom - MIN_ZOOM]
+        with self._lock:
+            return {(tx, ty) : versions[tx, ty] for tx in xs for ty in ys if (tx, ty) in versions}
+
+    def tile_version(self, zoom, tx, ty):
+        return self._tile_versions[zoom - MIN_ZOOM].get((tx, ty), 0)
+
+    def _clusters(self, zoom, xs, ys):
+        cells = self._cells[zoom - MIN_ZOOM]
+        with self._lock:
+            if len(xs) * len(ys) <= len(cells):
+                keys = ((cx, cy) for cx in xs for cy in ys)
+                found = [cells[key] for key in keys if key in cells]
+            else:
+                found = [cell for (cx, cy), cell in cells.items() if cx in xs and cy in ys]
+            return [Cluster(lat / count, lng / count, count) for count, lat, lng in found]
+
+
+class LabelIndex:
+    """Grid indexes over all labels and over the labels of each (collection, entry_id) photo."""
+
+    def __init__(self):
+        self.all = GridIndex()
+        self.by_photo = collections.defaultdict(GridIndex)
+        # id of the last stored label added, for incremental catch-up
+        self.last_id = 0
+
+    def add(self, photo, lat, lng):
+        self.all.add(lat, lng)
+        self.by_photo[photo].add(lat, lng)
+
+    def extend(self, rows):
+        """Add (id, label) rows read from the label store."""
+        for label_id, label in rows:
+            self.add((label.collection, label.entry_id), label.lat, label.lng)
+            self.last_id = max(self.last_id, label_id)
+
+    def grid(self, photo = None):
+        """The grid of all labels, or of one photo's labels (empty if it has none)."""
+        if photo is None:
+            return self.all
+        return self.by_photo.get(tuple(photo)) or GridIndex()
+
+    def clusters(self, bounds, zoom, photo = None):
+        return self.grid(photo).clusters(bounds, zoom)
@@ -0,0 +1,35 @@
+import csv
+
+import pytest
+
+COLUMNS = ('Index', 'Title', 'Type', 'Organization', 'Description', 'Entry_ID', 'Collection', 'Image_url')
+
+
+def catalogue_row(entry_id, **values):
+    """A metadata row with every column of the real catalogue."""
+    row = {
+        'Index' : '0',
+        'Title' : 'Photo {}'.format(entry_id),
+        'Type' : 'Photograph',
+        'Organization' : 'Museum of South Texas History',
+        'Description' : 'Flooding in the valley',
+        'Entry_ID' : entry_id,
+        'Collection' : 'Hurricane Beulah',
+        'Image_url' : 'https://example.org/{}.jpg'.format(entry_id)
+    }
+    row.update(values)
+    return row
+
+
+@pytest.fixture
+def write_csv(tmp_path):
+    """Writes rows to <name>-metadata.csv in tmp_path/assets, returning its path."""
+    def write(name, rows):
+        path = tmp_path.joinpath('assets', '{}-metadata.csv'.format(name))
+        path.parent.mkdir(exist_ok = True)
+        with open(path, 'w', newline = '') as f:
+            writer = csv.DictWriter(f, fieldnames = COLUMNS)
+            writer.writeheader()
+            writer.writerows(rows)
+        return path
+    return write
@@ -0,0 +1,80 @@
+import pytest
+
+import catalogue
+import registry
+import search
+from conftest import catalogue_row
+
+
+def test_publish_rejects_a_truncated_csv(tmp_path, write_csv):
+    csv_path = write_csv('beulah', [catalogue_row('a.1'), catalogue_row('a.2')])
+    published = catalogue.publish(csv_path, tmp_path.joinpath('cache'))
+    data = csv_path.read_bytes()
+    # cut short in the middle of the last row, as while still being written
+    csv_path.write_bytes(data[:-10])
+    with pytest.raises(ValueError, match = 'line break'):
+        catalogue.publish(csv_path, tmp_path.joinpath('cache'))
+    assert catalogue.CatalogueTable(published).column('Entry_ID') == ['a.1', 'a.2']
+
+
+def test_publish_rejects_missing_columns_and_entry_ids(tmp_path):
+    csv_path = tmp_path.joinpath('beulah-metadata.csv')
+    csv_path.write_text('Entry_ID,Title\r\na.1,Flood\r\n')
+    with pytest.raises(ValueError, match = 'Description'):
+        catalogue.publish(csv_path, tmp_path.joinpath('cache'))
+    header = ','.join(catalogue.REQUIRED_COLUMNS)
+    csv_path.write_text(header + '\r\n' + ',Flood,,,,,\r\n')
+    with pytest.raises(ValueError, match = 'Entry_ID'):
+        catalogue.publish(csv_path, tmp_path.joinpath('cache'))
+
+
+def test_publish_needs_force_to_drop_most_rows(tmp_path, write_csv):
+    cache_dir = tmp_path.joinpath('cache')
+    csv_path = write_csv('beulah', [catalogue_row('a.{}'.format(i)) for i in range(10)])
+    catalogue.publish(csv_path, cache_dir)
+    write_csv('beulah', [catalogue_row('a.{}'.format(i)) for i in range(4)])
+    with pytest.raises(ValueError, match = 'down from 10'):
+        catalogue.publish(csv_path, cache_dir)
+    link = catalogue.publish(csv_path, cache_dir, force = True)
+    assert len(catalogue.CatalogueTable(link)) == 4
+
+
+def test_shared_catalogue_serves_the_last_good_table(tmp_path, write_csv):
+    csv_path = write_csv('beulah', [catalogue_row('a.1')])
+    catalogue.publish(csv_path, tmp_path.joinpath('cache'))
+    csv_path.write_bytes(csv_path.read_bytes()[:-1])
+    shared = catalogue.SharedCatalogue(csv_path, tmp_path.joinpath('cache'))
+    assert shared.table.column('Entry_ID') == ['a.1']
+
+
+def test_incremental_index_update_matches_a_full_rebuild(tmp_path, write_csv):
+    rows = [
+        catalogue_row('a.{}'.format(i), Title = 'Flooded street {}'.format(i), Type = 'Photograph' if i % 2 else 'Postcard')
+        for i in range(20)
+    ]
+    write_csv('beulah', rows)
+    collection = registry.Collection('beulah', tmp_path.joinpath('assets', 'beulah-metadata.csv'), tmp_path.joinpath('cache'), 10)
+    collection.catalogue.check_interval = 0
+
+    # change, remove and add rows
+    rows[3] = catalogue_row('a.3', Title = 'Rescue boat on the levee', Organization = 'Hidalgo County')
+    del rows[7]
+    del rows[11]
+    rows.append(catalogue_row('a.20', Title = 'Boat in the floodwater', Type = 'Slide'))
+    csv_path = write_csv('beulah', rows)
+    catalogue.publish(csv_path, tmp_path.joinpath('cache'))
+    table = collection.table
+    assert table.diff is not None and table.diff['removed']
+
+    rebuilt = search.SearchIndex()
+    fields = list(search.SEARCH_FIELDS)
+    rebuilt.sync(
+        (entry_id, dict(zip(fields, values)))
+        for entry_id, *values in zip(table.column('Entry_ID'), *(table.column(field) for field in fields))
+    )
+    assert len(collection.search_index) == len(rebuilt) == 19
+    for query, filters in (('', ()), ('flood', ()), ('boat', ()), ('street', (('Type', 'Postcard'),)), ('levee', ())):
+        updated = collection.search_index.search(query, filters)
+        expected = rebuilt.search(query, filters)
+        assert sorted(updated.ids) == sorted(expected.ids)
+        assert updated.facets == expected.facets
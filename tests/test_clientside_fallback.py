@@ -0,0 +1,107 @@
+"""
+The UI-only callbacks run on the server with CLIENTSIDE_CALLBACKS=0, the
+fallback for tests; a copy of the app is imported with it for this module.
+"""
+
+import importlib.util
+import json
+import pathlib
+
+import pytest
+
+from benchmarks.common import callback_body, dependencies
+
+ROOT = pathlib.Path(__file__).parent.parent
+
+
+@pytest.fixture(scope = 'module')
+def client(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('serverside')
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setenv('CLIENTSIDE_CALLBACKS', '0')
+        patch.setenv('LABELS_DATABASE', str(directory.joinpath('labels.sqlite3')))
+        patch.setenv('SESSION_STORE', 'memory')
+        spec = importlib.util.spec_from_file_location('app_serverside', ROOT.joinpath('app.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    assert not module.CLIENTSIDE_CALLBACKS
+    client = module.server.test_client()
+    client.dependencies = dependencies(client)
+    yield client
+    module.label_store.close()
+
+
+def update(client, output, values = {}, changed = ()):
+    """Run the server callback with the output; the response's props, or None when it prevents the update."""
+    response = client.post(
+        '/_dash-update-component',
+        data = json.dumps(callback_body(client.dependencies, output, values, changed)),
+        content_type = 'application/json'
+    )
+    if response.status_code == 204:
+        return None
+    assert response.status_code == 200
+    return response.get_json()['response']
+
+
+def test_ui_callbacks_are_served(client):
+    served = {spec['output'] for spec in client.dependencies if not spec.get('clientside_function')}
+    for output in (
+        'liveview_label_modal_app.is_open',
+        '..layer.children...map_location.children..',
+        'session_id.data',
+        'liveview_label_modal_initial.is_open',
+        'liveview_label_modal_poster.is_open'
+    ):
+        assert output in served
+
+
+def test_display_app_modal(client):
+    output = 'liveview_label_modal_app.is_open'
+    opened = update(client, output, {'selected_entry.data' : '2013.001.013'}, ['selected_entry.data'])
+    assert opened == {'liveview_label_modal_app' : {'is_open' : True}}
+    closed = update(
+        client, output,
+        {'liveview_modal_close_button_app.n_clicks' : 1, 'liveview_label_modal_app.is_open' : True},
+        ['liveview_modal_close_button_app.n_clicks']
+    )
+    assert closed == {'liveview_label_modal_app' : {'is_open' : False}}
+
+
+def test_map_click(client):
+    output = 'layer.children'
+    assert update(client, output, {'map.click_lat_lng' : None}, ['map.click_lat_lng']) is None
+    response = update(client, output, {'map.click_lat_lng' : [26.25, -98.1234]}, ['map.click_lat_lng'])
+    marker, = response['layer']['children']
+    assert marker['type'] == 'Marker' and marker['props']['position'] == [26.25, -98.1234]
+    assert response['map_location'] == {'children' : 'You have selected a point at 26.250, -98.123'}
+
+
+def test_start_session(client):
+    output = 'session_id.data'
+    started = update(client, output, {'url.pathname' : '/'}, ['url.pathname'])['session_id']['data']
+    assert len(started) == 32 and started != update(client, output, {'url.pathname' : '/'})['session_id']['data']
+    # a tab keeps its id across reloads
+    assert update(client, output, {'url.pathname' : '/', 'session_id.data' : started}, ['url.pathname']) is None
+
+
+def test_intro_modal(client):
+    output = 'liveview_label_modal_initial.is_open'
+    assert update(client, output, {'url.pathname' : '/'}, ['url.pathname']) == {
+        'liveview_label_modal_initial' : {'is_open' : True}
+    }
+    assert update(
+        client, output, {'liveview_modal_ok_button_initial.n_clicks' : 1}, ['liveview_modal_ok_button_initial.n_clicks']
+    ) == {'liveview_label_modal_initial' : {'is_open' : False}}
+
+
+def test_poster_modal(client):
+    output = 'liveview_label_modal_poster.is_open'
+    assert update(client, output, {'btn_poster.n_clicks' : 1}, ['btn_poster.n_clicks']) == {
+        'liveview_label_modal_poster' : {'is_open' : True}
+    }
+    assert update(
+        client, output,
+        {'liveview_modal_close_button.n_clicks' : 1, 'liveview_label_modal_poster.is_open' : True},
+        ['liveview_modal_close_button.n_clicks']
+    ) == {'liveview_label_modal_poster' : {'is_open' : False}}
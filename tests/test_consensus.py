@@ -0,0 +1,75 @@
+import math
+
+import numpy as np
+
+import consensus
+import labels
+
+
+def metres_between(a, b):
+    y = (a[0] - b[0]) * consensus.EARTH_RADIUS * math.radians(1.0)
+    x = (a[1] - b[1]) * consensus.EARTH_RADIUS * math.radians(1.0) * math.cos(math.radians(a[0]))
+    return math.hypot(x, y)
+
+
+def clicks(count, seed = 0, centre = (26.2, -98.2), spread = 20):
+    """Points scattered about centre, spread metres apart on average."""
+    rng = np.random.default_rng(seed)
+    degrees = spread / (consensus.EARTH_RADIUS * math.radians(1.0))
+    return [(centre[0] + dy * degrees, centre[1] + dx * degrees) for dy, dx in rng.normal(size = (count, 2))]
+
+
+def test_single_label_is_its_own_consensus():
+    photo = consensus.PhotoConsensus()
+    photo.add(26.2, -98.2)
+    assert photo.result.count == photo.result.inliers == 1
+    assert photo.result.radius is None
+    assert metres_between(photo.result[:2], (26.2, -98.2)) < 1e-6
+
+
+def test_stray_clicks_are_rejected():
+    points = clicks(30) + [(26.25, -98.2), (26.2, -98.15)] # about 5 km off
+    lats, lngs = zip(*points)
+    result = consensus.estimate(['photo'] * len(points), lats, lngs)['photo'][0]
+    assert result.count == 32
+    assert result.inliers == 30
+    assert metres_between(result[:2], (26.2, -98.2)) < 15
+    assert 0 < result.radius < 30
+
+
+def test_groups_are_estimated_apart():
+    a, b = clicks(10, 1), clicks(10, 2, centre = (27.5, -97.0))
+    lats, lngs = zip(*(a + b))
+    results = consensus.estimate(['a'] * 10 + ['b'] * 10, lats, lngs)
+    assert metres_between(results['a'][0][:2], (26.2, -98.2)) < 20
+    assert metres_between(results['b'][0][:2], (27.5, -97.0)) < 20
+
+
+def test_incremental_matches_batch():
+    points = clicks(100, 3) + [(26.3, -98.2)]
+    rows = [(i + 1, labels.Label('2021-08-01T15:00:00', 'beulah', 'photo', lat, lng)) for i, (lat, lng) in enumerate(points)]
+    one_by_one = consensus.ConsensusIndex()
+    for row in rows:
+        one_by_one.extend([row]) # below BACKFILL_MIN_ROWS: added one at a time
+    batch = consensus.ConsensusIndex()
+    batch.extend(rows)
+    assert one_by_one.last_id == batch.last_id == len(rows)
+    incremental, full = one_by_one.get(('beulah', 'photo')), batch.get(('beulah', 'photo'))
+    assert incremental.count == full.count == len(rows)
+    assert incremental.inliers == full.inliers == 100
+    assert metres_between(incremental[:2], full[:2]) < 5
+    assert abs(incremental.radius - full.radius) < 5
+    assert one_by_one.get(('other', 'photo')) is None
+
+
+def test_photos_are_told_apart_by_collection():
+    rows = [
+        (i + 1, labels.Label('2021-08-01T15:00:00', collection, 'same.id', lat, lng))
+        for i, (collection, (lat, lng)) in enumerate(
+            [('a', point) for point in clicks(40, 4)] + [('b', point) for point in clicks(40, 5, centre = (27.5, -97.0))]
+        )
+    ]
+    index = consensus.ConsensusIndex()
+    index.extend(rows) # in batch
+    assert metres_between(index.get(('a', 'same.id'))[:2], (26.2, -98.2)) < 20
+    assert metres_between(index.get(('b', 'same.id'))[:2], (27.5, -97.0)) < 20
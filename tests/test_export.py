@@ -0,0 +1,107 @@
+import csv
+import io
+import json
+
+import pytest
+
+import catalogue
+import export
+import labels
+from conftest import catalogue_row
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = labels.LabelStore(tmp_path.joinpath('labels.sqlite3'))
+    # the same Entry_ID in two collections
+    for i, collection in enumerate(('beulah', 'harvey', 'beulah', 'harvey', 'beulah')):
+        store.submit('2021-08-01T15:00:0{}'.format(i), collection, 'a.1', 26.0 + i, -98.0 - i)
+    store.flush()
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def tables(tmp_path, write_csv):
+    return {
+        name : catalogue.CatalogueTable(catalogue.publish(write_csv(name, [catalogue_row('a.1', Title = name.title())]), tmp_path))
+        for name in ('beulah', 'harvey')
+    }
+
+
+def read_csv(data):
+    return list(csv.DictReader(io.StringIO(b''.join(data).decode('utf-8'))))
+
+
+def test_csv_rows_name_the_collection_of_each_photo(store, tables):
+    rows = read_csv(export.export(store, tables, 'csv'))
+    assert list(rows[0]) == list(export.FIELDS)
+    assert [(row['label_id'], row['collection'], row['Entry_ID'], row['Title']) for row in rows] == [
+        ('1', 'beulah', 'a.1', 'Beulah'),
+        ('2', 'harvey', 'a.1', 'Harvey'),
+        ('3', 'beulah', 'a.1', 'Beulah'),
+        ('4', 'harvey', 'a.1', 'Harvey'),
+        ('5', 'beulah', 'a.1', 'Beulah')
+    ]
+    assert rows[1]['lat'] == '27.0' and rows[1]['submitted_at'] == '2021-08-01T15:00:01Z'
+
+
+def test_geojsonseq_features(store, tables):
+    data = b''.join(export.export(store, tables, 'geojsonseq', chunk_size = 2)).decode('utf-8')
+    records = data.split('\x1e')
+    assert records[0] == '' and all(record.endswith('\n') for record in records[1:])
+    features = [json.loads(record) for record in records[1:]]
+    assert [feature['id'] for feature in features] == [1, 2, 3, 4, 5]
+    assert features[1]['geometry'] == {'type' : 'Point', 'coordinates' : [-99.0, 27.0]}
+    assert features[1]['properties'] == {
+        'collection' : 'harvey',
+        'Entry_ID' : 'a.1',
+        'Title' : 'Harvey',
+        'Description' : 'Flooding in the valley',
+        'Collection' : 'Hurricane Beulah',
+        'submitted_at' : '2021-08-01T15:00:01Z'
+    }
+
+
+def test_cursor_pages_cover_every_label_once(store, tables):
+    exported = []
+    after_id = 0
+    while True:
+        until_id = store.last_id(after_id, 2)
+        if until_id == after_id:
+            break
+        rows = read_csv(export.export(store, tables, 'csv', after_id, until_id, chunk_size = 1))
+        assert len(rows) <= 2
+        exported += [int(row['label_id']) for row in rows]
+        after_id = until_id
+    assert exported == [1, 2, 3, 4, 5]
+
+
+def test_labels_after_until_id_are_left_for_the_next_pull(store, tables):
+    until_id = store.last_id(0)
+    store.submit('2021-08-01T16:00:00', 'beulah', 'a.1', 26.0, -98.0)
+    store.flush()
+    assert [row['label_id'] for row in read_csv(export.export(store, tables, 'csv', 0, until_id))] == ['1', '2', '3', '4', '5']
+    assert [row['label_id'] for row in read_csv(export.export(store, tables, 'csv', until_id))] == ['6']
+
+
+def test_export_route(store, monkeypatch):
+    import app
+    monkeypatch.setattr(app, 'EXPORT_TOKEN', 'secret')
+    monkeypatch.setattr(app, 'label_store', store)
+    client = app.server.test_client()
+    headers = {'Authorization' : 'Bearer secret'}
+    assert client.get('/export/labels.csv').status_code == 401
+    assert client.get('/export/labels.xml', headers = headers).status_code == 404
+
+    response = client.get('/export/labels.csv?limit=3', headers = headers)
+    assert response.status_code == 200
+    assert response.headers['X-Export-Cursor'] == '3'
+    assert [row['label_id'] for row in read_csv([response.data])] == ['1', '2', '3']
+    response = client.get('/export/labels.geojsonseq?after=3', headers = headers)
+    assert response.headers['X-Export-Cursor'] == '5'
+    assert response.data.count(b'\x1e') == 2
+
+    # refused up front, not failing after a 200 has been sent
+    monkeypatch.setattr(export, 'available', lambda format: False)
+    assert client.get('/export/labels.parquet', headers = headers).status_code == 501
@@ -0,0 +1,164 @@
+import io
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+from PIL import Image
+
+import imagecheck
+
+
+def jpeg(pixels, size = None, quality = 90):
+    image = Image.fromarray(pixels)
+    if size:
+        image = image.resize(size)
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG', quality = quality)
+    return buffer.getvalue()
+
+
+def picture(seed, size = (640, 480)):
+    """A smooth random picture, compressing and hashing as photographs do."""
+    rng = np.random.default_rng(seed)
+    coarse = rng.integers(0, 256, (6, 8, 3), dtype = np.uint8)
+    return np.asarray(Image.fromarray(coarse).resize(size, Image.BICUBIC))
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_HEAD(self):
+        self.do_GET(body = False)
+
+    def do_GET(self, body = True):
+        with self.server.lock:
+            self.server.requests.append((self.command, self.path, self.headers.get('Range')))
+        data = self.server.images.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        start, stop = 0, len(data)
+        if self.headers.get('Range') and self.server.ranges:
+            first, _, last = self.headers['Range'][len('bytes='):].partition('-')
+            start, stop = int(first), min(int(last) + 1, len(data))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(start, stop - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(stop - start))
+        self.end_headers()
+        if body:
+            self.wfile.write(data[start:stop])
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    server.images = {}
+    server.requests = []
+    server.ranges = True
+    server.lock = threading.Lock()
+    threading.Thread(target = server.serve_forever, daemon = True).start()
+    server.url = 'http://127.0.0.1:{}'.format(server.server_port)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_modes(server):
+    data = jpeg(picture(0), (1200, 800))
+    server.images['/a.jpg'] = data
+    fetcher = imagecheck.Fetcher()
+    head = fetcher.check(server.url + '/a.jpg', 'head')
+    assert (head['status'], head['content_length'], head['width']) == (200, len(data), None)
+    full = fetcher.check(server.url + '/a.jpg', 'full')
+    assert (full['status'], full['width'], full['height'], len(full['phash'])) == (200, 1200, 800, 16)
+    missing = fetcher.check(server.url + '/gone.jpg')
+    assert missing['status'] == 404 and missing['width'] is None
+    assert fetcher.check('http://127.0.0.1:1/a.jpg')['error']
+
+
+def test_probe_reads_the_header_from_a_range(server):
+    # an image larger than the probe, with the whole length in Content-Range
+    data = jpeg(np.random.default_rng(1).integers(0, 256, (1500, 2000, 3), dtype = np.uint8))
+    assert len(data) > imagecheck.PROBE_BYTES
+    server.images['/big.jpg'] = data
+    fetcher = imagecheck.Fetcher()
+    probe = fetcher.check(server.url + '/big.jpg', 'probe')
+    assert (probe['status'], probe['content_length'], probe['width'], probe['height']) == (200, len(data), 2000, 1500)
+    assert server.requests[-1][2] == 'bytes=0-{}'.format(imagecheck.PROBE_BYTES - 1)
+    # a server ignoring Range sends the whole image; the probe stops early
+    server.ranges = False
+    probe = fetcher.check(server.url + '/big.jpg', 'probe')
+    assert (probe['status'], probe['width'], probe['error']) == (200, 2000, None)
+    # and the connection it abandoned is not reused
+    assert fetcher.check(server.url + '/big.jpg', 'head')['status'] == 200
+
+
+def test_phash_matches_the_same_picture_only(server):
+    def distance(a, b):
+        return bin(int(a, 16) ^ int(b, 16)).count('1')
+    fetcher = imagecheck.Fetcher()
+    server.images['/original.jpg'] = jpeg(picture(2), (1024, 768), quality = 95)
+    server.images['/smaller.jpg'] = jpeg(picture(2), (400, 300), quality = 60)
+    server.images['/other.jpg'] = jpeg(picture(3), (1024, 768))
+    original, smaller, other = (
+        fetcher.check('{}/{}.jpg'.format(server.url, name))['phash'] for name in ('original', 'smaller', 'other')
+    )
+    assert distance(original, smaller) <= 6
+    assert distance(original, other) > 16
+
+
+def test_stale_entries(tmp_path):
+    checks = imagecheck.ImageChecks(tmp_path.joinpath('images.sqlite3'))
+    result = dict.fromkeys(imagecheck.ImageChecks.columns)
+    checks.record('beulah', [
+        ('a', 'https://x/a.jpg', 'full', dict(result, status = 200)),
+        ('b', 'https://x/b.jpg', 'full', dict(result, status = 200)),
+        ('c', 'https://x/c.jpg', 'head', dict(result, status = 200)),
+        ('d', 'https://x/d.jpg', 'full', dict(result, error = 'ConnectionRefusedError')),
+        ('e', 'https://x/e.jpg', 'full', dict(result, status = 404))
+    ])
+    entries = [
+        ('a', 'https://x/a.jpg'), # unchanged
+        ('b', 'https://x/b2.jpg'), # URL edited
+        ('c', 'https://x/c.jpg'), # checked in a cheaper mode
+        ('d', 'https://x/d.jpg'), # could not connect
+        ('e', 'https://x/e.jpg'), # not found, which is a result
+        ('f', 'https://x/f.jpg') # new
+    ]
+    assert [entry_id for entry_id, _ in checks.stale('beulah', entries, 'full')] == ['b', 'c', 'd', 'f']
+    assert [entry_id for entry_id, _ in checks.stale('beulah', entries, 'head')] == ['b', 'd', 'f']
+    assert [entry_id for entry_id, _ in checks.stale('harvey', entries[:1], 'head')] == ['a']
+    time.sleep(0.01)
+    assert len(checks.stale('beulah', entries, 'full', max_age = 0)) == 6
+
+
+def test_run_checks_only_what_is_stale(tmp_path, server):
+    for name in 'abc':
+        server.images['/{}.jpg'.format(name)] = jpeg(picture(ord(name)))
+    checks = imagecheck.ImageChecks(tmp_path.joinpath('images.sqlite3'))
+    fetcher = imagecheck.Fetcher()
+    entries = [(name, '{}/{}.jpg'.format(server.url, name)) for name in 'abcd']
+    count, seconds, statuses = imagecheck.run(checks, fetcher, 'beulah', entries, 'full', workers = 2)
+    assert count == 4 and statuses == {200 : 3, 404 : 1}
+    found = checks.lookup('beulah', 'abcd')
+    assert found['a']['width'] == 640 and found['d']['status'] == 404
+
+    server.requests.clear()
+    assert imagecheck.run(checks, fetcher, 'beulah', entries, 'full')[0] == 0
+    assert server.requests == []
+    # an entry gone from the catalogue is pruned, an edited URL checked again
+    entries = [('a', entries[0][1]), ('b', server.url + '/c.jpg')]
+    assert imagecheck.run(checks, fetcher, 'beulah', entries, 'full')[0] == 1
+    assert sorted(checks.lookup('beulah', 'abcd')) == ['a', 'b']
+    assert checks.lookup('beulah', 'b')['b']['phash'] == found['c']['phash']
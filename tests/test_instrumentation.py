@@ -0,0 +1,62 @@
+import dash
+import dash_html_components as html
+from dash.dependencies import Input, Output
+
+import instrumentation
+
+
+def make_app():
+    app = dash.Dash(__name__)
+    app.layout = html.Div([html.Button(id = 'button'), html.Div(id = 'out')])
+
+    @app.callback(Output('out', 'children'), Input('button', 'n_clicks'))
+    def show_clicks(n_clicks):
+        return str(n_clicks)
+
+    return app
+
+
+def post(client, output):
+    return client.post('/_dash-update-component', json = {
+        'output' : output,
+        'outputs' : {'id' : 'out', 'property' : 'children'},
+        'inputs' : [{'id' : 'button', 'property' : 'n_clicks', 'value' : 1}],
+        'changedPropIds' : ['button.n_clicks']
+    })
+
+
+def test_label_value_escapes():
+    assert instrumentation.label_value('a\\b"c\nd') == '"a\\\\b\\"c\\nd"'
+
+
+def test_unregistered_outputs_are_unknown():
+    app = make_app()
+    metrics = instrumentation.instrument(app, token = 'secret')
+    client = app.server.test_client()
+    assert post(client, 'out.children').status_code == 200
+    for output in ('made.up', 'another"one\n'):
+        post(client, output)
+    assert set(metrics.stats) == {'show_clicks', instrumentation.UNKNOWN}
+    assert metrics.stats[instrumentation.UNKNOWN].duration.count == 2
+    text = client.get('/metrics', headers = {'Authorization' : 'Bearer secret'}).data.decode('utf-8')
+    assert 'dash_callback_duration_seconds_count{callback="show_clicks"} 1' in text
+    assert 'dash_callback_errors_total{callback="unknown"} 2' in text
+
+
+def test_metrics_need_the_token():
+    app = make_app()
+    instrumentation.instrument(app, token = 'secret')
+    client = app.server.test_client()
+    post(client, 'out.children')
+    for path in ('/metrics', '/debug/callbacks'):
+        assert client.get(path).status_code == 401
+        assert client.get(path, headers = {'Authorization' : 'Bearer wrong'}).status_code == 401
+        assert client.get(path, headers = {'Authorization' : 'Bearer secret'}).status_code == 200
+    # without a token they are not served, though calls are still recorded
+    app = make_app()
+    metrics = instrumentation.instrument(app)
+    client = app.server.test_client()
+    post(client, 'out.children')
+    assert metrics.stats['show_clicks'].duration.count == 1
+    assert client.get('/metrics', headers = {'Authorization' : 'Bearer '}).status_code == 404
+    assert client.get('/debug/callbacks').status_code == 404
@@ -0,0 +1,94 @@
+import sqlite3
+
+import labels
+
+
+class FlakyBackend(labels.SQLiteBackend):
+    """Fails its first connects and commits, as a database that is down for a while."""
+
+    def __init__(self, path, failed_connects, failed_commits):
+        super().__init__(path)
+        self.failed_connects = failed_connects
+        self.failed_commits = failed_commits
+
+    def connect(self):
+        if self.failed_connects:
+            self.failed_connects -= 1
+            raise sqlite3.OperationalError('unable to open database file')
+        return FlakyConnection(super().connect(), self)
+
+
+class FlakyConnection:
+    def __init__(self, conn, backend):
+        self._conn = conn
+        self._backend = backend
+
+    def commit(self):
+        if self._backend.failed_commits:
+            self._backend.failed_commits -= 1
+            raise sqlite3.OperationalError('database is locked')
+        self._conn.commit()
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def test_repeated_keys_are_stored_once(tmp_path):
+    store = labels.LabelStore(tmp_path.joinpath('labels.sqlite3'))
+    key = labels.idempotency_key('session', 'beulah', '2013.001.030', '2021-08-01 10:00:00')
+    assert store.submit('2021-08-01T15:00:00', 'beulah', '2013.001.030', 26.2, -98.2, key = key) == labels.QUEUED
+    assert store.submit('2021-08-01T15:00:00', 'beulah', '2013.001.030', 26.2, -98.2, key = key) == labels.DUPLICATE
+    store.flush()
+    assert store.submit('2021-08-01T15:00:00', 'beulah', '2013.001.030', 26.2, -98.2, key = key) == labels.WRITTEN
+    # another worker, which has not seen the key, queues it; the database ignores it
+    other = labels.LabelStore(tmp_path.joinpath('labels.sqlite3'))
+    assert other.submit('2021-08-01T15:00:00', 'beulah', '2013.001.030', 26.2, -98.2, key = key) == labels.QUEUED
+    other.flush()
+    assert store.labels() == [labels.Label('2021-08-01T15:00:00', 'beulah', '2013.001.030', 26.2, -98.2)]
+    assert store.close() == other.close() == 0
+
+
+def test_full_queue_defers(tmp_path):
+    store = labels.LabelStore(tmp_path.joinpath('labels.sqlite3'), max_pending = 1)
+    store._ensure_writer = lambda: None # no writer, so nothing leaves the queue
+    assert store.submit('2021-08-01T15:00:00', 'beulah', 'a', 0, 0) == labels.QUEUED
+    assert store.submit('2021-08-01T15:00:00', 'beulah', 'b', 0, 0) == labels.DEFERRED
+
+
+def test_failed_writes_are_retried_until_written(tmp_path, monkeypatch):
+    monkeypatch.setattr(labels, 'MAX_RETRY_WAIT', 0)
+    store = labels.LabelStore(FlakyBackend(tmp_path.joinpath('labels.sqlite3'), failed_connects = 3, failed_commits = 6))
+    for i in range(10):
+        store.submit('2021-08-01T15:00:00', 'beulah', 'entry.{}'.format(i), 26.2, -98.2, key = str(i))
+    store.flush()
+    assert store.pending() == 0
+    assert [label.entry_id for label in store.labels()] == ['entry.{}'.format(i) for i in range(10)]
+    assert all(store.submit('2021-08-01T15:00:00', 'beulah', 'entry.{}'.format(i), 26.2, -98.2, key = str(i)) == labels.WRITTEN for i in range(10))
+
+
+def test_writer_restarts_after_close(tmp_path):
+    store = labels.LabelStore(tmp_path.joinpath('labels.sqlite3'))
+    store.submit('2021-08-01T15:00:00', 'beulah', 'a', 0, 0)
+    assert store.close() == 0
+    store.submit('2021-08-01T15:00:00', 'beulah', 'b', 0, 0)
+    store.flush()
+    assert [label.entry_id for label in store.labels()] == ['a', 'b']
+    store.close()
+
+
+def test_labels_are_kept_by_collection(tmp_path):
+    path = tmp_path.joinpath('labels.sqlite3')
+    # a database from before labels had a collection
+    conn = sqlite3.connect(str(path))
+    conn.execute('CREATE TABLE labels (id INTEGER PRIMARY KEY AUTOINCREMENT, submitted_at TEXT NOT NULL, entry_id TEXT NOT NULL, lat REAL NOT NULL, lng REAL NOT NULL)')
+    conn.execute("INSERT INTO labels (submitted_at, entry_id, lat, lng) VALUES ('2021-08-01T15:00:00', 'same.id', 1, 1)")
+    conn.commit()
+    conn.close()
+    store = labels.LabelStore(path)
+    store.submit('2021-08-01T15:00:00', 'other', 'same.id', 2, 2)
+    store.flush()
+    assert [label.collection for label in store.labels()] == [labels.LEGACY_COLLECTION, 'other']
+    assert store.labels((labels.LEGACY_COLLECTION, 'same.id')) == [labels.Label('2021-08-01T15:00:00', labels.LEGACY_COLLECTION, 'same.id', 1, 1)]
+    assert [label.lat for label in store.labels(('other', 'same.id'))] == [2]
+    assert labels.idempotency_key('s', 'a', 'same.id', 't') != labels.idempotency_key('s', 'b', 'same.id', 't')
+    store.close()
@@ -0,0 +1,74 @@
+import gzip
+import os
+
+import brotli
+import dash_html_components as html
+import pytest
+from dash.dependencies import Input, Output
+
+import precompressed
+
+
+@pytest.fixture
+def app(tmp_path):
+    assets = tmp_path.joinpath('assets')
+    assets.mkdir()
+    assets.joinpath('style.css').write_text('body { margin: 0; }')
+    app = precompressed.PrecompressedDash(__name__, assets_folder = str(assets), layout_version = lambda: app.version)
+    app.version = 1
+    app.layout = lambda: html.Div(id = 'page', children = 'version {}'.format(app.version))
+    return app
+
+
+def test_encoding_negotiation(app):
+    client = app.server.test_client()
+    identity = client.get('/_dash-layout', headers = {'Accept-Encoding' : ''})
+    assert identity.content_encoding is None and b'version 1' in identity.data
+    for accepted, encoding, decompress in (
+        ('gzip, deflate, br', 'br', brotli.decompress),
+        ('gzip', 'gzip', gzip.decompress)
+    ):
+        response = client.get('/_dash-layout', headers = {'Accept-Encoding' : accepted})
+        assert response.content_encoding == encoding
+        assert 'Accept-Encoding' in response.vary
+        assert decompress(response.data) == identity.data
+    assert len({client.get('/_dash-layout', headers = {'Accept-Encoding' : accepted}).get_etag()[0] for accepted in ('', 'gzip', 'br')}) == 3
+
+
+def test_conditional_requests_get_304(app):
+    client = app.server.test_client()
+    for path in ('/', '/_dash-layout', '/_dash-dependencies'):
+        response = client.get(path, headers = {'Accept-Encoding' : 'br'})
+        assert response.status_code == 200 and response.cache_control.no_cache
+        etag = response.headers['ETag']
+        unchanged = client.get(path, headers = {'Accept-Encoding' : 'br', 'If-None-Match' : etag})
+        assert unchanged.status_code == 304 and unchanged.data == b''
+        # a validator of another encoding does not match
+        assert client.get(path, headers = {'Accept-Encoding' : 'gzip', 'If-None-Match' : etag}).status_code == 200
+
+
+def test_layout_is_rebuilt_for_a_new_version(app):
+    client = app.server.test_client()
+    etag = client.get('/_dash-layout').headers['ETag']
+    app.version = 2
+    response = client.get('/_dash-layout', headers = {'If-None-Match' : etag})
+    assert response.status_code == 200 and b'version 2' in response.data
+
+
+def test_index_is_rebuilt_when_an_asset_changes(app, tmp_path):
+    client = app.server.test_client()
+    etag = client.get('/').headers['ETag']
+    assert client.get('/', headers = {'If-None-Match' : etag}).status_code == 304
+    style = tmp_path.joinpath('assets', 'style.css')
+    stat = style.stat()
+    os.utime(style, ns = (stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    response = client.get('/', headers = {'If-None-Match' : etag})
+    assert response.status_code == 200 and response.headers['ETag'] != etag
+
+
+def test_dependencies_are_rebuilt_when_a_callback_is_added(app):
+    client = app.server.test_client()
+    etag = client.get('/_dash-dependencies').headers['ETag']
+    app.callback(Output('page', 'title'), Input('page', 'children'))(lambda children: children)
+    response = client.get('/_dash-dependencies', headers = {'If-None-Match' : etag})
+    assert response.status_code == 200 and b'page.title' in response.data
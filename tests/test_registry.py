@@ -0,0 +1,50 @@
+import threading
+
+import registry
+from conftest import catalogue_row
+
+
+def test_published_tables_leave_the_loaded_collections_alone(tmp_path, write_csv):
+    write_csv('first', [catalogue_row('a.1'), catalogue_row('a.2')])
+    write_csv('second', [catalogue_row('b.1')])
+    catalogues = registry.CollectionRegistry(tmp_path.joinpath('assets'), tmp_path.joinpath('cache'), 10, max_loaded = 1)
+    first = catalogues.get('first')
+    tables = catalogues.published_tables()
+    assert sorted(tables) == ['first', 'second']
+    assert tables['first'] is first.table
+    assert tables['second'].column('Entry_ID') == ['b.1']
+    assert list(catalogues._loaded) == ['first']
+
+
+def test_loading_one_collection_does_not_block_another(tmp_path, write_csv, monkeypatch):
+    write_csv('slow', [catalogue_row('a.1')])
+    write_csv('fast', [catalogue_row('b.1')])
+    catalogues = registry.CollectionRegistry(tmp_path.joinpath('assets'), tmp_path.joinpath('cache'), 10)
+    building = threading.Event()
+    release = threading.Event()
+    collection = registry.Collection
+
+    def build(name, *args):
+        if name == 'slow':
+            building.set()
+            release.wait(5)
+        return collection(name, *args)
+
+    monkeypatch.setattr(registry, 'Collection', build)
+    loaded = []
+    slow = threading.Thread(target = lambda: loaded.append(catalogues.get('slow')))
+    slow.start()
+    assert building.wait(5)
+    assert catalogues.get('fast').name == 'fast'
+    release.set()
+    slow.join()
+    assert loaded[0] is catalogues.get('slow')
+
+
+def test_published_tables_serve_the_published_version_of_a_csv_being_edited(tmp_path, write_csv):
+    csv_path = write_csv('first', [catalogue_row('a.1'), catalogue_row('a.2')])
+    catalogues = registry.CollectionRegistry(tmp_path.joinpath('assets'), tmp_path.joinpath('cache'), 10)
+    assert catalogues.published_tables()['first'].column('Entry_ID') == ['a.1', 'a.2']
+    # half-written, which publishing would refuse
+    csv_path.write_bytes(csv_path.read_bytes()[:-5])
+    assert catalogues.published_tables()['first'].column('Entry_ID') == ['a.1', 'a.2']
@@ -0,0 +1,38 @@
+import pytest
+
+import search
+
+
+@pytest.fixture
+def index():
+    index = search.SearchIndex()
+    index.sync([
+        ('a.1', {'Title' : 'Flooded street in Harlingen', 'Type' : 'Photograph', 'Organization' : 'MOSTH', 'Collection' : 'Beulah'}),
+        ('a.2', {'Title' : 'Rescue boat', 'Type' : 'Postcard', 'Organization' : 'MOSTH', 'Collection' : 'Beulah'}),
+        ('a.3', {'Title' : 'Floodwater on the levee', 'Type' : 'Photograph', 'Organization' : 'Hidalgo County', 'Collection' : 'Beulah'}),
+    ])
+    return index
+
+
+def test_exact_prefix_and_typo_matches(index):
+    assert index.search('boat').ids == ['a.2']
+    assert set(index.search('flood').ids) == {'a.1', 'a.3'}
+    assert index.search('harlingne').ids == ['a.1']
+    assert index.search('levee boat').ids == []
+
+
+def test_facet_filters(index):
+    result = index.search('', (('Type', 'Photograph'),))
+    assert result.ids == ['a.1', 'a.3']
+    assert result.facets['Organization'] == {'MOSTH' : 1, 'Hidalgo County' : 1}
+    assert index.search('', (('Type', 'Slide'),)).ids == []
+
+
+def test_unknown_facet_fields_are_ignored(index):
+    assert index.search('boat', (('Colour', 'Red'),)).ids == ['a.2']
+
+
+def test_malformed_facet_options_are_skipped():
+    import app
+    assert app.facet_filters(['Type:Photograph', 'junk', 'Organization:A:B']) == (('Type', 'Photograph'), ('Organization', 'A:B'))
+    assert app.facet_filters(None) == ()
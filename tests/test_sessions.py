@@ -0,0 +1,29 @@
+import json
+
+import sessions
+
+
+def test_completed_photos_are_kept_by_collection():
+    store = sessions.SessionStore('memory')
+    store.complete('session', [('a', 'same.id'), ('b', 'same.id'), ('a', 'same.id')])
+    store.complete('session', [('a', 'other.id')])
+    assert store.completed('session') == {('a', 'same.id'), ('b', 'same.id'), ('a', 'other.id')}
+    assert store.get('session')['completed'] == [['a', 'same.id'], ['b', 'same.id'], ['a', 'other.id']]
+
+
+def test_state_from_before_collections_is_dropped():
+    store = sessions.SessionStore('memory')
+    old = {'selected' : 'same.id', 'pending' : {'entry_id' : 'same.id', 'lat' : 1, 'lng' : 2, 'dt' : ''}, 'completed' : ['same.id']}
+    store.backend.update('session', lambda value: json.dumps(old), 60)
+    assert store.get('session') == sessions.DEFAULTS
+    store.set('session', selected = ['a', 'same.id'])
+    assert store.get('session')['selected'] == ['a', 'same.id']
+
+
+def test_sqlite_backend(tmp_path):
+    store = sessions.SessionStore(tmp_path.joinpath('sessions.sqlite3'))
+    store.set('session', selected = ['a', 'same.id'])
+    store.complete('session', [('a', 'same.id')])
+    assert store.get('session')['selected'] == ['a', 'same.id']
+    assert store.completed('session') == {('a', 'same.id')}
+    assert store.get('missing') == sessions.DEFAULTS
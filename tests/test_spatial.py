@@ -0,0 +1,119 @@
+import time
+
+import geobuf
+import pytest
+
+import labels
+import maplayers
+import spatial
+
+
+def test_labels_are_indexed_by_collection_and_entry():
+    index = spatial.LabelIndex()
+    index.extend([
+        (1, labels.Label('2021-08-01T15:00:00', 'a', 'same.id', 26.2, -98.2)),
+        (2, labels.Label('2021-08-01T15:00:00', 'b', 'same.id', 27.5, -97.0)),
+        (3, labels.Label('2021-08-01T15:00:00', 'b', 'same.id', 27.5, -97.0))
+    ])
+    assert index.last_id == 3
+    assert index.grid().count == 3
+    assert index.grid(('a', 'same.id')).count == 1
+    assert index.grid(['b', 'same.id']).count == 2
+    assert index.grid(('c', 'same.id')).count == 0
+
+
+def tile_of(lat, lng, zoom):
+    x, y = spatial.mercator(lat, lng)
+    return int(x * (1 << zoom)), int(y * (1 << zoom))
+
+
+def test_tiles_list_the_non_empty_tiles_in_view_with_their_versions():
+    grid = spatial.GridIndex()
+    # two labels close together, one far off
+    for lat, lng in ((26.2, -98.2), (26.2001, -98.2001), (29.7, -95.4)):
+        grid.add(lat, lng)
+    zoom = 10
+    near, far = tile_of(26.2, -98.2, zoom), tile_of(29.7, -95.4, zoom)
+    assert grid.tiles([[25.0, -100.0], [31.0, -94.0]], zoom) == {near : 2, far : 1}
+    assert grid.tiles([[25.0, -100.0], [27.0, -97.0]], zoom) == {near : 2}
+    assert grid.tile_version(zoom, *near) == 2 and grid.tile_version(zoom, near[0] + 1, near[1]) == 0
+
+    cluster, = grid.tile_clusters(zoom, *near)
+    assert cluster.count == 2 and abs(cluster.lat - 26.20005) < 1e-9
+    assert grid.tile_clusters(zoom, near[0] + 1, near[1]) == []
+    # at zoom 0 everything is in the one tile
+    assert grid.tiles([[-80, -180], [80, 180]], 0) == {(0, 0) : 3}
+    assert sum(cluster.count for cluster in grid.tile_clusters(0, 0, 0)) == 3
+
+
+def test_a_tile_version_only_changes_with_its_own_labels():
+    grid = spatial.GridIndex()
+    grid.add(26.2, -98.2)
+    zoom = 12
+    near = tile_of(26.2, -98.2, zoom)
+    grid.add(29.7, -95.4)
+    assert grid.tile_version(zoom, *near) == 1
+    grid.add(26.2, -98.2)
+    assert grid.tile_version(zoom, *near) == 2
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    """The app with an empty label store and index, counting the label store reads."""
+    import app
+    import consensus
+    store = labels.LabelStore(tmp_path.joinpath('labels.sqlite3'))
+    store.reads = []
+    since = store.since
+    store.since = lambda *args, **kwargs: store.reads.append(args) or since(*args, **kwargs)
+    monkeypatch.setattr(app, 'label_store', store)
+    monkeypatch.setattr(app, 'label_index', spatial.LabelIndex())
+    monkeypatch.setattr(app, 'photo_consensus', consensus.ConsensusIndex())
+    monkeypatch.setattr(app, 'geobuf_cache', maplayers.GeobufCache())
+    monkeypatch.setattr(app, 'label_index_checked', time.monotonic())
+    yield app
+    store.close()
+
+
+def test_label_tiles_hold_the_clusters_of_their_photo(served):
+    store = served.label_store
+    store.submit('2021-08-01T15:00:00', 'beulah', 'a.1', 26.2, -98.2)
+    store.submit('2021-08-01T15:00:00', 'harvey', 'a.1', 26.2, -98.2)
+    store.submit('2021-08-01T15:00:00', 'beulah', 'a.2', 26.2, -98.2)
+    store.flush()
+    served.refresh_label_index(force = True)
+    client = served.server.test_client()
+    x, y = tile_of(26.2, -98.2, 10)
+
+    def counts(query):
+        response = client.get('/map/labels/10/{}/{}.pbf?{}'.format(x, y, query))
+        assert response.status_code == 200 and response.mimetype == maplayers.MIMETYPE
+        # the Python decoder gives None for an empty collection
+        features = (geobuf.decode(response.data) or {'features' : []})['features']
+        return [feature['properties']['count'] for feature in features], response
+
+    assert counts('v=3')[0] == [3]
+    photo, response = counts('v=1&collection=beulah&entry=a.1')
+    assert photo == [1] and response.cache_control.max_age == served.MAP_TILE_MAX_AGE
+    assert counts('v=0&collection=harvey&entry=a.2')[0] == []
+    assert client.get('/map/labels/30/0/0.pbf').status_code == 404
+
+
+def test_a_newer_version_refreshes_only_when_labels_were_stored(served):
+    client = served.server.test_client()
+    x, y = tile_of(26.2, -98.2, 10)
+    path = '/map/labels/10/{}/{}.pbf?v=5'.format(x, y)
+    # nothing stored: a client's claim of a newer tile does not make every request read the store
+    for _ in range(3):
+        response = client.get(path)
+        assert response.cache_control.no_cache
+    assert served.label_store.reads == []
+
+    # another worker stored a label: the first request picks it up
+    served.label_store.submit('2021-08-01T15:00:00', 'beulah', 'a.1', 26.2, -98.2)
+    served.label_store.flush()
+    client.get(path)
+    assert len(served.label_store.reads) >= 1 and served.label_index.last_id == 1
+    reads = len(served.label_store.reads)
+    client.get(path)
+    assert len(served.label_store.reads) == reads
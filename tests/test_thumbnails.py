@@ -0,0 +1,93 @@
+import io
+import os
+
+import pytest
+from PIL import Image
+
+import thumbnails
+
+BUCKET = 'https://s3.us-west-2.amazonaws.com/app-catalogit-media-public/'
+
+
+@pytest.fixture
+def source_root(tmp_path):
+    """A local directory standing in for the bucket, with a few originals."""
+    root = tmp_path.joinpath('s3')
+    for i, size in enumerate(((1600, 1200), (900, 1600), (150, 100))):
+        path = root.joinpath('app-catalogit-media-public', 'photo', '{}.jpg'.format(i))
+        path.parent.mkdir(parents = True, exist_ok = True)
+        buffer = io.BytesIO()
+        Image.new('RGB', size, (40 * i, 120, 200)).save(buffer, 'JPEG')
+        path.write_bytes(buffer.getvalue())
+    return root
+
+
+def url(i):
+    return '{}photo/{}.jpg'.format(BUCKET, i)
+
+
+def counting(cache):
+    """Count the originals the cache fetches."""
+    fetched = []
+    fetch = cache.fetch
+    cache.fetch = lambda url: fetched.append(url) or fetch(url)
+    return fetched
+
+
+def test_variants_fit_their_boxes(tmp_path, source_root):
+    cache = thumbnails.ThumbnailCache(tmp_path.joinpath('cache'), source_root = source_root)
+    for i, size in enumerate(((1600, 1200), (900, 1600), (150, 100))):
+        for variant in thumbnails.VARIANTS:
+            with Image.open(cache.get(url(i), variant)) as image:
+                assert image.size == thumbnails.variant_size(size, variant)
+                assert max(image.size) <= max(thumbnails.VARIANTS[variant])
+
+
+def test_originals_are_fetched_once(tmp_path, source_root):
+    cache = thumbnails.ThumbnailCache(tmp_path.joinpath('cache'), source_root = source_root)
+    fetched = counting(cache)
+    first = cache.get(url(0), 'thumb')
+    assert cache.get(url(0), 'thumb') == first
+    assert cache.get(url(0), 'preview') != first
+    assert fetched == [url(0)]
+    # a new cache over the same directory, as in another worker
+    other = thumbnails.ThumbnailCache(tmp_path.joinpath('cache'), source_root = source_root)
+    assert counting(other) == [] and other.get(url(0), 'thumb') == first
+
+
+def test_least_recently_served_blobs_are_evicted(tmp_path, source_root):
+    cache = thumbnails.ThumbnailCache(tmp_path.joinpath('cache'), source_root = source_root)
+    paths = [cache.ensure(url(i)) for i in range(3)]
+    sizes = [sum(path.stat().st_size for path in variants.values()) for variants in paths]
+    for i, variants in enumerate(paths):
+        for path in variants.values():
+            os.utime(path, (1000 + i, 1000 + i))
+    # room for the two most recently served
+    cache.max_bytes = sizes[1] + sizes[2]
+    cache.evict()
+    assert not any(path.exists() for path in paths[0].values())
+    assert all(path.exists() for variants in paths[1:] for path in variants.values())
+    fetched = counting(cache)
+    # served again though it does not fit beside them, evicting the older
+    served = cache.get(url(0), 'thumb')
+    assert fetched == [url(0)] and served.exists()
+    assert not any(path.exists() for path in paths[1].values())
+
+
+def test_a_blob_evicted_while_being_served_is_rendered_again(tmp_path, source_root):
+    cache = thumbnails.ThumbnailCache(tmp_path.joinpath('cache'), source_root = source_root)
+    ensure = cache.ensure
+    evicted = []
+
+    def ensure_then_evict(url):
+        paths = ensure(url)
+        if not evicted:
+            # another worker evicts the blobs just after they were found
+            for path in paths.values():
+                path.unlink()
+            evicted.append(url)
+        return paths
+
+    cache.ensure = ensure_then_evict
+    path = cache.get(url(1), 'thumb')
+    assert evicted and path.exists()
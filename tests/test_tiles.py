@@ -0,0 +1,89 @@
+import pytest
+
+import tiles
+
+STUDY_AREA = [[25.4, -101.6], [28.4, -94.7]]
+INSIDE = (8, 58, 109) # a tile of the study area at zoom 8
+OUTSIDE = (8, 0, 0)
+
+
+@pytest.fixture
+def upstream(tmp_path):
+    """A local fake upstream: a directory of tiles, served through file:// URLs."""
+    root = tmp_path.joinpath('upstream')
+
+    def add(zoom, x, y, data = None):
+        path = root.joinpath(str(zoom), str(x), '{}.png'.format(y))
+        path.parent.mkdir(parents = True, exist_ok = True)
+        path.write_bytes(data or 'tile {}/{}/{}'.format(zoom, x, y).encode('utf-8'))
+        return path
+
+    add.url = root.as_uri() + '/{z}/{x}/{y}.png'
+    return add
+
+
+def test_a_miss_is_filled_from_the_upstream_once(tmp_path, upstream):
+    path = upstream(*INSIDE)
+    store = tiles.TileStore(tmp_path.joinpath('tiles.mbtiles'), upstream = upstream.url, fill_bounds = STUDY_AREA)
+    assert store.get(*INSIDE) == b'tile 8/58/109'
+    path.unlink()
+    assert store.get(*INSIDE) == b'tile 8/58/109'
+    # stored in the MBTiles row order
+    row = store.connections.get().execute('SELECT tile_row FROM tiles').fetchone()[0]
+    assert row == tiles.tms_row(8, 109)
+
+
+def test_misses_outside_the_study_area_are_not_fetched(tmp_path, upstream):
+    upstream(*OUTSIDE)
+    store = tiles.TileStore(tmp_path.joinpath('tiles.mbtiles'), upstream = upstream.url, fill_bounds = STUDY_AREA)
+    assert not store.fills(*OUTSIDE)
+    assert store.get(*OUTSIDE) is None
+
+
+def test_offline_store_serves_only_what_it_holds(tmp_path, upstream, monkeypatch):
+    upstream(*INSIDE)
+    path = tmp_path.joinpath('tiles.mbtiles')
+    tiles.TileStore(path, upstream = upstream.url).get(*INSIDE)
+    offline = tiles.TileStore(path)
+    assert offline.get(*INSIDE) == b'tile 8/58/109'
+    assert offline.get(8, 58, 110) is None
+
+    import app
+    monkeypatch.setattr(app, 'tile_store', offline)
+    client = app.server.test_client()
+    response = client.get('/map/tiles/8/58/109.png')
+    assert response.status_code == 200 and response.data == b'tile 8/58/109'
+    assert client.get('/map/tiles/8/58/110.png').status_code == 404
+    assert client.get('/map/tiles/8/256/0.png').status_code == 404
+
+
+def test_eviction_drops_the_least_recently_served_tiles(tmp_path):
+    store = tiles.TileStore(tmp_path.joinpath('tiles.mbtiles'), max_bytes = 1000)
+    for y in range(8):
+        store.put(10, 0, y, bytes(200))
+        store.connections.get().execute('UPDATE tile_usage SET last_used = ? WHERE tile_row = ?', (y, tiles.tms_row(10, y)))
+        store.connections.get().commit()
+    store.evict()
+    kept = [y for y in range(8) if store.lookup(10, 0, y) is not None]
+    assert kept == [4, 5, 6, 7]
+    total = store.connections.get().execute('SELECT SUM(size) FROM tile_usage').fetchone()[0]
+    assert total <= tiles.EVICT_TO * store.max_bytes and store._total_bytes == total
+
+
+def test_seeding_fetches_every_tile_of_the_area(tmp_path, upstream):
+    bounds = [[26.0, -98.5], [26.5, -98.0]]
+    wanted = [
+        (zoom, x, y)
+        for zoom in (9, 10)
+        for xs, ys in [tiles.tile_range(bounds, zoom)]
+        for x in xs
+        for y in ys
+    ]
+    for tile in wanted:
+        upstream(*tile)
+    # seeding is deliberate, so it is not limited to fill_bounds
+    store = tiles.TileStore(tmp_path.joinpath('tiles.mbtiles'), upstream = upstream.url, fill_bounds = [[0, 0], [1, 1]])
+    failures, count = store.seed(bounds, tiles.zoom_levels('9-10'))
+    assert failures == [] and count == len(wanted)
+    offline = tiles.TileStore(tmp_path.joinpath('tiles.mbtiles'))
+    assert all(offline.get(*tile) == 'tile {}/{}/{}'.format(*tile).encode('utf-8') for tile in wanted)
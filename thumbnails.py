@@ -0,0 +1,215 @@
+"""
+Generate gallery thumbnails and modal previews from the catalogue images.
+
+Each original is fetched once (from S3, or from a local directory standing in
+for it), resized into every variant in ``VARIANTS`` and stored under a
+content-addressed cache directory:
+
+    <cache_dir>/blobs/<digest[:2]>/<digest>.<ext>   resized image bytes
+    <cache_dir>/refs/<sha1(url)>.json               {variant: blob name}
+
+The cache is trimmed to ``max_bytes`` by evicting the least recently served
+blobs. Run this module directly to pre-generate thumbnails for a metadata CSV.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import os
+import pathlib
+import threading
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, features
+
+# variant name -> bounding box of the resized image
+VARIANTS = {
+    'thumb' : (200, 200),
+    'preview' : (1280, 1280)
+}
+LOCK_STRIPES = 64 # locks shared out among the URLs being rendered
+GET_ATTEMPTS = 3 # tries to serve a blob that is evicted as it is found
+
+if features.check('webp'):
+    IMAGE_FORMAT, IMAGE_EXT, IMAGE_MIMETYPE = 'WEBP', 'webp', 'image/webp'
+else:
+    IMAGE_FORMAT, IMAGE_EXT, IMAGE_MIMETYPE = 'JPEG', 'jpg', 'image/jpeg'
+
+
+def _atomic_write(path, data):
+    """Write bytes so concurrent readers never see a partial file."""
+    path.parent.mkdir(parents = True, exist_ok = True)
+    tmp = path.with_name('.{}.{}.tmp'.format(path.name, os.getpid()))
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def variant_size(size, variant):
+    """(width, height) of an image of the given size once resized into the variant."""
+    box_width, box_height = VARIANTS[variant]
+    width, height = size
+    scale = min(box_width / width, box_height / height, 1) # never enlarged
+    return max(round(width * scale), 1), max(round(height * scale), 1)
+
+
+def render_variants(data):
+    """Resize original image bytes into every variant, returning encoded bytes."""
+    original = Image.open(io.BytesIO(data))
+    original.load()
+    if original.mode not in ('RGB', 'L'):
+        original = original.convert('RGB')
+    rendered = {}
+    for variant, size in VARIANTS.items():
+        image = original.copy()
+        image.thumbnail(size)
+        buffer = io.BytesIO()
+        image.save(buffer, IMAGE_FORMAT, quality = 80)
+        rendered[variant] = buffer.getvalue()
+    return rendered
+
+
+class ThumbnailCache:
+    """Content-addressed, size-bounded on-disk cache of resized images."""
+
+    def __init__(self, cache_dir, max_bytes = 512 * 1024 ** 2, source_root = None, timeout = 10):
+        self.cache_dir = pathlib.Path(cache_dir)
+        self.max_bytes = max_bytes
+        # local directory mirroring the URL paths of the originals, used in
+        # place of fetching from S3
+        self.source_root = pathlib.Path(source_root) if source_root else None
+        self.timeout = timeout
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # bytes in the blob directory, kept up to date by ensure() and
+        # summed again from the files by each evict()
+        self._total_bytes = None
+        self._total_lock = threading.Lock()
+
+    def _ref_path(self, url):
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        return self.cache_dir.joinpath('refs', key + '.json')
+
+    def _blob_path(self, name):
+        return self.cache_dir.joinpath('blobs', name[:2], name)
+
+    def _lock(self, url):
+        return self._locks[hash(url) % LOCK_STRIPES]
+
+    def fetch(self, url):
+        """Return the bytes of the original image."""
+        if self.source_root is not None:
+            path = urllib.parse.unquote(urllib.parse.urlparse(url).path).lstrip('/')
+            return self.source_root.joinpath(path).read_bytes()
+        with urllib.request.urlopen(url, timeout = self.timeout) as response:
+            return response.read()
+
+    def lookup(self, url):
+        """Return {variant: blob path} if every variant is cached, else None."""
+        try:
+            names = json.loads(self._ref_path(url).read_text())
+        except (OSError, ValueError):
+            return None
+        paths = {variant: self._blob_path(names[variant]) for variant in VARIANTS if variant in names}
+        if len(paths) != len(VARIANTS) or not all(path.exists() for path in paths.values()):
+            return None
+        return paths
+
+    def ensure(self, url):
+        """Fetch and render the original once, returning {variant: blob path}."""
+        paths = self.lookup(url)
+        if paths is not None:
+            return paths
+        with self._lock(url):
+            paths = self.lookup(url)
+            if paths is not None:
+                return paths
+            names = {}
+            written = 0
+            for variant, data in render_variants(self.fetch(url)).items():
+                name = '{}.{}'.format(hashlib.sha256(data).hexdigest(), IMAGE_EXT)
+                if not self._blob_path(name).exists():
+                    _atomic_write(self._blob_path(name), data)
+                    written += len(data)
+                names[variant] = name
+            _atomic_write(self._ref_path(url), json.dumps(names).encode('utf-8'))
+        with self._total_lock:
+            fits = self._total_bytes is not None and self._total_bytes + written <= self.max_bytes
+            if fits:
+                self._total_bytes += written
+        paths = {variant: self._blob_path(name) for variant, name in names.items()}
+        if not fits:
+            self.evict(keep = paths.values())
+        return paths
+
+    def get(self, url, variant):
+        """Return the cached file of one variant, generating it on a miss."""
+        for attempt in range(GET_ATTEMPTS):
+            path = self.ensure(url)[variant]
+            try:
+                # evict() deletes the blobs with the oldest modification times first
+                os.utime(path)
+                return path
+            except FileNotFoundError:
+                # evicted meanwhile, by another thread or worker: render it again
+                if attempt == GET_ATTEMPTS - 1:
+                    raise
+
+    def evict(self, keep = ()):
+        """
+        Delete least recently used blobs until the cache fits in max_bytes,
+        or only the blobs in keep, e.g. those about to be served, are left.
+        """
+        keep = set(keep)
+        blobs = []
+        for path in self.cache_dir.joinpath('blobs').glob('*/*'):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # evicted by another worker meanwhile
+                continue
+            blobs.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in blobs)
+        for _, size, path in sorted(blobs):
+            if total <= self.max_bytes:
+                break
+            if path in keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._total_lock:
+            self._total_bytes = total
+
+    def warm(self, urls, workers = 8):
+        """Generate every variant for the given URLs, returning the failures."""
+        def attempt(url):
+            try:
+                self.ensure(url)
+            except Exception as error:
+                return url, error
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            return [failure for failure in pool.map(attempt, urls) if failure]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Pre-generate catalogue thumbnails.')
+    parser.add_argument('metadata', help = 'metadata CSV with an Image_url column')
+    parser.add_argument('--cache-dir', default = 'cache/thumbnails')
+    parser.add_argument('--source-root', help = 'local directory standing in for S3')
+    parser.add_argument('--max-bytes', type = int, default = 512 * 1024 ** 2)
+    parser.add_argument('--workers', type = int, default = 8)
+    args = parser.parse_args()
+
+    with open(args.metadata, newline = '') as f:
+        urls = [row['Image_url'] for row in csv.DictReader(f)]
+    cache = ThumbnailCache(args.cache_dir, args.max_bytes, args.source_root)
+    failures = cache.warm(urls, args.workers)
+    for url, error in failures:
+        print('failed: {} ({})'.format(url, error))
+    print('{} of {} images cached'.format(len(urls) - len(failures), len(urls)))
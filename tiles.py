@@ -0,0 +1,247 @@
+"""
+Local cache of the base map tiles, kept in an MBTiles file.
+
+The map's tile layer points at the app rather than at a public tile server.
+The app serves tiles from an MBTiles (SQLite) store shared by all workers and
+fills misses from an upstream XYZ tile server, so once the study area is
+cached opening the map neither waits on nor needs the internet. Only misses
+within ``fill_bounds``, the study area, are filled, so the app is not an open
+proxy to the upstream for the whole world. Without an upstream the store only
+serves the tiles it holds, e.g. on a host without outbound network.
+
+The store is bounded to ``max_bytes`` of tile data by evicting the least
+recently served tiles. Run this module directly to seed it for an area and a
+range of zoom levels, e.g. the study area:
+
+    python -m tiles cache/tiles.mbtiles --bounds 25.4 -101.6 28.4 -94.7 --zooms 8-13
+
+Check the upstream's usage policy before seeding from it; the public
+OpenStreetMap servers do not allow bulk downloads.
+"""
+
+import pathlib
+import sqlite3
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import spatial
+from connections import ThreadConnections
+
+MIMETYPE = 'image/png'
+MAX_ZOOM = 19
+USER_AGENT = 'acrc-website tile cache' # followed by the contact given to TileStore
+LOCK_STRIPES = 64 # locks shared out among the tiles being fetched
+TOUCH_INTERVAL = 60 * 60 # seconds; a served tile's last use is recorded at most this often
+EVICT_TO = 0.9 # eviction trims the store to this fraction of max_bytes
+
+SCHEMA = """
+    CREATE TABLE IF NOT EXISTS metadata (name TEXT, value TEXT);
+    CREATE UNIQUE INDEX IF NOT EXISTS name ON metadata (name);
+    CREATE TABLE IF NOT EXISTS tiles (zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, tile_data BLOB);
+    CREATE UNIQUE INDEX IF NOT EXISTS tile_index ON tiles (zoom_level, tile_column, tile_row);
+    CREATE TABLE IF NOT EXISTS tile_usage (
+        zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER, size INTEGER, last_used REAL,
+        PRIMARY KEY (zoom_level, tile_column, tile_row)
+    );
+    CREATE INDEX IF NOT EXISTS tile_usage_last_used ON tile_usage (last_used);
+"""
+METADATA = {
+    'name' : 'Base map cache',
+    'format' : 'png',
+    'type' : 'baselayer'
+}
+
+
+def tms_row(zoom, y):
+    """MBTiles numbers rows from the south, XYZ URLs from the north."""
+    return (1 << zoom) - 1 - y
+
+
+def tile_range(bounds, zoom):
+    """Column and row ranges of the tiles covering [[south, west], [north, east]]."""
+    return spatial.cell_range(bounds, zoom, 1 << zoom)
+
+
+class TileStore:
+    """Size-bounded MBTiles store of XYZ tiles, filled from an upstream on a miss."""
+
+    def __init__(self, path, max_bytes = 1024 ** 3, upstream = None, timeout = 10, fill_bounds = None, contact = None):
+        self.path = pathlib.Path(path)
+        self.max_bytes = max_bytes
+        # URL template with {z}, {x} and {y}, or None to serve stored tiles only
+        self.upstream = upstream or None
+        # [[south, west], [north, east]] of the misses filled from the
+        # upstream; None fills any, as when seeding
+        self.fill_bounds = fill_bounds
+        self.timeout = timeout
+        # e.g. an email address, sent to the upstream as its policy asks
+        self.user_agent = '{} ({})'.format(USER_AGENT, contact) if contact else USER_AGENT
+        self.connections = ThreadConnections(self.connect)
+        self._locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        # bytes of tile data in the store, kept up to date by put() and
+        # summed again from tile_usage by each evict(), both under the lock
+        self._total_bytes = None
+        self._total_lock = threading.RLock()
+
+    def connect(self):
+        self.path.parent.mkdir(parents = True, exist_ok = True)
+        conn = sqlite3.connect(str(self.path), timeout = 30, check_same_thread = False)
+        # only takes effect on a new file: lets evict() give pages back
+        conn.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        conn.executemany('INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)', METADATA.items())
+        conn.commit()
+        return conn
+
+    def close(self):
+        """Close this process's connections, e.g. before forking."""
+        self.connections.close()
+
+    def _lock(self, tile):
+        return self._locks[hash(tile) % LOCK_STRIPES]
+
+    def fills(self, zoom, x, y):
+        """Whether a miss of the tile is filled from the upstream."""
+        if self.upstream is None:
+            return False
+        if self.fill_bounds is None:
+            return True
+        xs, ys = tile_range(self.fill_bounds, zoom)
+        return x in xs and y in ys
+
+    def lookup(self, zoom, x, y):
+        """The stored tile's bytes, or None."""
+        conn = self.connections.get()
+        key = (zoom, x, tms_row(zoom, y))
+        row = conn.execute(
+            'SELECT tile_data, last_used FROM tiles LEFT JOIN tile_usage USING (zoom_level, tile_column, tile_row) '
+            'WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+            key
+        ).fetchone()
+        if row is None:
+            return None
+        data, last_used = row
+        # evict() drops the tiles with the oldest last_used first, so
+        # serving a tile refreshes its row, at most every TOUCH_INTERVAL
+        now = time.time()
+        if last_used is None or now - last_used > TOUCH_INTERVAL:
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO tile_usage VALUES (?, ?, ?, ?, ?)', key + (len(data), now))
+        return data
+
+    def put(self, zoom, x, y, data):
+        key = (zoom, x, tms_row(zoom, y))
+        conn = self.connections.get()
+        with conn:
+            conn.execute('INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?)', key + (data,))
+            conn.execute('INSERT OR REPLACE INTO tile_usage VALUES (?, ?, ?, ?, ?)', key + (len(data), time.time()))
+        with self._total_lock:
+            if self._total_bytes is None or self._total_bytes + len(data) > self.max_bytes:
+                self.evict()
+            else:
+                self._total_bytes += len(data)
+
+    def fetch(self, zoom, x, y):
+        """Return the tile's bytes from the upstream."""
+        request = urllib.request.Request(
+            self.upstream.format(z = zoom, x = x, y = y),
+            headers = {'User-Agent' : self.user_agent}
+        )
+        with urllib.request.urlopen(request, timeout = self.timeout) as response:
+            return response.read()
+
+    def get(self, zoom, x, y, fill = None):
+        """
+        The tile's bytes, fetched from the upstream on a miss if fills() it,
+        or if fill; None if unavailable.
+        """
+        data = self.lookup(zoom, x, y)
+        fill = self.fills(zoom, x, y) if fill is None else fill and self.upstream is not None
+        if data is not None or not fill:
+            return data
+        with self._lock((zoom, x, y)):
+            data = self.lookup(zoom, x, y)
+            if data is None:
+                data = self.fetch(zoom, x, y)
+                self.put(zoom, x, y, data)
+        return data
+
+    def evict(self):
+        """Delete least recently served tiles until the store fits in max_bytes."""
+        with self._total_lock:
+            self._evict()
+
+    def _evict(self):
+        conn = self.connections.get()
+        evicted = []
+        with conn:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM tile_usage').fetchone()[0]
+            if total > self.max_bytes:
+                excess = total - int(EVICT_TO * self.max_bytes)
+                cursor = conn.execute('SELECT zoom_level, tile_column, tile_row, size FROM tile_usage ORDER BY last_used')
+                while excess > 0:
+                    rows = cursor.fetchmany(1000)
+                    if not rows:
+                        break
+                    for zoom, column, row, size in rows:
+                        if excess <= 0:
+                            break
+                        evicted.append((zoom, column, row))
+                        excess -= size
+                        total -= size
+                cursor.close()
+                conn.executemany('DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?', evicted)
+                conn.executemany('DELETE FROM tile_usage WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?', evicted)
+        if evicted:
+            conn.execute('PRAGMA incremental_vacuum').fetchall()
+        self._total_bytes = total
+
+    def seed(self, bounds, zooms, workers = 4):
+        """
+        Fetch every missing tile of bounds at the given zoom levels, in
+        fill_bounds or not, returning the failures and the number of tiles.
+        """
+        tiles = [
+            (zoom, x, y)
+            for zoom in zooms
+            for xs, ys in [tile_range(bounds, zoom)]
+            for x in xs
+            for y in ys
+        ]
+        def attempt(tile):
+            try:
+                self.get(*tile, fill = True)
+            except Exception as error:
+                return tile, error
+        with ThreadPoolExecutor(max_workers = workers) as pool:
+            return [failure for failure in pool.map(attempt, tiles) if failure], len(tiles)
+
+
+def zoom_levels(text):
+    """Zoom levels from '8' or '8-13'."""
+    first, _, last = text.partition('-')
+    return range(int(first), int(last or first) + 1)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description = 'Seed the base map tile cache.')
+    parser.add_argument('mbtiles', help = 'MBTiles file, created if missing')
+    parser.add_argument('--bounds', type = float, nargs = 4, metavar = ('SOUTH', 'WEST', 'NORTH', 'EAST'), required = True)
+    parser.add_argument('--zooms', type = zoom_levels, required = True, help = 'zoom level or range, e.g. 8-13')
+    parser.add_argument('--upstream', default = 'https://tile.openstreetmap.org/{z}/{x}/{y}.png')
+    parser.add_argument('--max-bytes', type = int, default = 1024 ** 3)
+    parser.add_argument('--workers', type = int, default = 4)
+    args = parser.parse_args()
+
+    south, west, north, east = args.bounds
+    store = TileStore(args.mbtiles, args.max_bytes, args.upstream)
+    start = time.perf_counter()
+    failures, count = store.seed([[south, west], [north, east]], args.zooms, args.workers)
+    for tile, error in failures[:20]:
+        print('failed: {}/{}/{} ({})'.format(*tile, error))
+    print('{} of {} tiles cached in {:.1f} s'.format(count - len(failures), count, time.perf_counter() - start))